@@ -0,0 +1,31 @@
+import mimetypes
+
+from fastapi import APIRouter, Request, Response
+from fastapi.responses import FileResponse
+
+from app.config.env import env
+from app.exception.image import ContentsNotFoundException
+from app.schema.enum.exception import ErrorType
+from app.schema.enum.image import SvgEncodingType
+from app.util.image_util import decode_svg
+from app.util.storage import LocalStorage, get_storage
+
+router = APIRouter()
+
+
+@router.get('/{bucket_name}/{file_name:path}')
+def download_file(request: Request, bucket_name: str, file_name: str):
+    # only the local backend's image bucket is served here, s3 urls point at the bucket
+    storage = get_storage()
+    if bucket_name != env.BUCKET_NAME or not isinstance(storage, LocalStorage):
+        raise ContentsNotFoundException(ErrorType.CONTENTS_NOT_FOUND)
+    path = storage.get_file_path(bucket_name, file_name)
+    if path is None:
+        raise ContentsNotFoundException(ErrorType.CONTENTS_NOT_FOUND)
+
+    media_type, encoding = mimetypes.guess_type(path.name)
+    if encoding and encoding not in request.headers.get('accept-encoding', ''):
+        # a client that cannot decode the stored encoding gets the plain file
+        return Response(decode_svg(path.read_bytes(), SvgEncodingType(encoding)), media_type=media_type)
+    # the server sends the file itself (http.response.pathsend) when it supports it, otherwise it is streamed in chunks
+    return FileResponse(path, headers={'Content-Encoding': encoding} if encoding else None)
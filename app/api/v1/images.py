@@ -1,26 +1,37 @@
-from typing import List
+import asyncio
+from http import HTTPStatus
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, File, UploadFile
+from celery import group
+from fastapi import APIRouter, Depends, File, Query, Response, UploadFile
 from pydantic import UUID4
 
 from app.api.depedencies import get_image_service
 from app.schema.dto.image import (
+    CompleteUploadsRequest,
+    CreateUploadsRequest,
+    DeleteImagesRequest,
+    DeleteImagesResponse,
     GetImageResponse,
     GetImagesResponse,
     ImageServiceOutput,
+    SaveImageInput,
     SaveLogInput,
     UploadImageResponse,
+    UploadUrlOutput,
 )
-from app.schema.enum.image import ImageProcessingType
+from app.schema.enum.image import ImageProcessingType, UploadMode
 from app.service.image import ImageService
-from app.tasks.image import process_image_task
-from app.util.image_util import create_save_path, get_image_format
+from app.tasks.image import delete_files_task, process_image_task
+from app.util.helper import batched, run_blocking
+from app.util.image_util import ImageContext, create_save_path
+from app.util.s3_uploder import DELETE_BATCH_SIZE
 
 router = APIRouter()
 
 
 @router.get('/{image_id}', response_model=GetImageResponse)
-async def get_image(
+def get_image(
     image_id: UUID4,
     service: ImageService = Depends(get_image_service),
 ):
@@ -28,42 +39,292 @@ async def get_image(
 
 
 @router.get('/', response_model=GetImagesResponse)
-async def get_images(
-    limit: int = 10,
-    page: int = 0,
+def get_images(
+    limit: int = Query(10, ge=1),
+    page: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
     service: ImageService = Depends(get_image_service),
 ) -> dict:
-    return GetImagesResponse(**service.get_all(limit, page).model_dump())
+    # offset pages with their total stay the default, a client opts in to the keyset walk by sending next_cursor
+    if cursor is None:
+        return GetImagesResponse(**service.get_all(limit, page).model_dump())
+    return GetImagesResponse(**service.get_page(limit, cursor, include_total).model_dump())
 
 
-def preprocess(service: ImageService, image_bytes: bytes) -> tuple[UUID4, bytes, ImageServiceOutput]:
-    preprocessed_image = service.preprocess(image_bytes)
-    preprocessed_filename = create_save_path(get_image_format(preprocessed_image))
+def deduplicate(service: ImageService, image: ImageContext) -> Optional[ImageServiceOutput]:
+    duplicate = service.find_duplicate(image.content_hash)
+    if not duplicate:
+        return None
+    # the same bytes were converted before, the stored original and svg are shared instead of converting again
+    return service.save_with_log(
+        duplicate.original_url, ImageProcessingType.DEDUPLICATED, image.content_hash, duplicate.svg_url
+    )
+
+
+def preprocess(service: ImageService, image: ImageContext) -> tuple[str, str]:
+    preprocessed_image = service.preprocess(image)
+    # the preprocessed image keeps the format of the upload, so it is not decoded again to name it
+    preprocessed_filename = create_save_path(image.extension)
     original_url = service.upload(preprocessed_filename, preprocessed_image)
-    original_image_model = service.save(original_url)
-    original_id = original_image_model.id
-    service.save_log(SaveLogInput(original_id=original_id, status=ImageProcessingType.READY))
-    refresh_image_model = service.get(original_id)
-    return (original_id, preprocessed_image, refresh_image_model)
+    return preprocessed_filename, original_url
+
+
+def save(service: ImageService, image: ImageContext, original_url: str) -> ImageServiceOutput:
+    # a visually identical image was converted before, its svg is shared and no conversion is needed
+    similar = service.find_similar(image)
+    svg_url = similar.svg_url if similar else None
+    status = ImageProcessingType.DEDUPLICATED if similar else ImageProcessingType.READY
+    preprocessed = image.preprocessed
+    return service.save_with_log(
+        original_url,
+        status,
+        image.content_hash,
+        svg_url,
+        image.perceptual_hash,
+        preprocessed.width,
+        preprocessed.height,
+    )
+
+
+# a saved image and the storage key its conversion is published with, None when there is nothing to convert
+AcceptedImage = tuple[ImageServiceOutput, Optional[str]]
+
+
+async def accept_image(service: ImageService, image: ImageContext, session_lock: asyncio.Lock) -> AcceptedImage:
+    # 1. reuse a completed conversion of the same upload
+    async with session_lock:
+        duplicated_image_model = await run_blocking(deduplicate, service, image)
+    if duplicated_image_model:
+        return duplicated_image_model, None
+    # 2. the upload is kept as it is, its url is where the worker stores the preprocessed image
+    storage_key = create_save_path(image.extension)
+    original_url = await run_blocking(service.stash, storage_key, image.data)
+    try:
+        async with session_lock:
+            original_image_model = await run_blocking(
+                service.save_with_log, original_url, ImageProcessingType.RECEIVED, image.content_hash
+            )
+    except Exception as e:
+        await run_blocking(service.unspool, storage_key)
+        raise e
+    # 3. preprocessing and conversion send to task queue
+    return original_image_model, storage_key
+
+
+async def upload_image(service: ImageService, image: ImageContext, session_lock: asyncio.Lock) -> AcceptedImage:
+    # the request's db session is not thread safe, its calls take turns while preprocessing and s3 run in parallel
+    # 1. reuse a completed conversion of the same upload
+    async with session_lock:
+        duplicated_image_model = await run_blocking(deduplicate, service, image)
+    if duplicated_image_model:
+        return duplicated_image_model, None
+    # 2. image preprocessing
+    storage_key, original_url = await run_blocking(preprocess, service, image)
+    async with session_lock:
+        original_image_model = await run_blocking(save, service, image, original_url)
+    # 3. image processing send to task queue, the message carries the storage key instead of the image
+    if original_image_model.status != ImageProcessingType.READY:
+        return original_image_model, None
+    return original_image_model, storage_key
+
+
+def publish(service: ImageService, image: ImageContext, original_id: UUID4, storage_key: str, mode: UploadMode) -> None:
+    # the preprocessed image is spooled only for a conversion that is published, a stashed upload is dropped
+    # when publishing fails. either way no spool file is left without a task to read it
+    try:
+        if mode == UploadMode.ACCEPT:
+            process_image_task.apply_async(
+                args=[original_id, storage_key], kwargs={'preprocess': True}, ignore_result=True
+            )
+        else:
+            service.spool(storage_key, image.preprocessed.data)
+            process_image_task.apply_async(args=[original_id, storage_key], ignore_result=True)
+    except Exception as e:
+        service.unspool(storage_key)
+        raise e
+
+
+def abandon(service: ImageService, images: list[AcceptedImage]) -> None:
+    # saved images of a failed request are never converted, they are marked failed instead of waiting forever
+    for image, storage_key in images:
+        service.unspool(storage_key)
+        service.save_log(SaveLogInput(original_id=image.id, status=ImageProcessingType.FAILED))
 
 
 @router.post('/', response_model=List[UploadImageResponse])
 async def upload_multiple_images(
+    http_response: Response,
     files: List[UploadFile] = File(...),
+    mode: UploadMode = UploadMode.SYNC,
     service: ImageService = Depends(get_image_service),
 ):
-    images = [file.file.read() for file in files]
-    # 1. validate images
-    service.validate(images)
+    # 1. read and validate images chunk by chunk, each upload is parsed once and its context is reused below
+    images = await run_blocking(service.receive, [file.file for file in files])
 
-    response: list[ImageServiceOutput] = []
+    # 2. the images of one request are processed concurrently, the response keeps the upload order.
+    # every image finishes with the request's session before the request may fail
+    session_lock = asyncio.Lock()
+    accept = accept_image if mode == UploadMode.ACCEPT else upload_image
+    results = await asyncio.gather(*[accept(service, image, session_lock) for image in images], return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        pending = [result for result in results if not isinstance(result, BaseException) and result[1]]
+        await run_blocking(abandon, service, pending)
+        raise errors[0]
+
+    # 3. conversions are published only once every image of the request is saved
+    pending = [(image, result) for image, result in zip(images, results) if result[1]]
+    published = await asyncio.gather(
+        *[run_blocking(publish, service, image, model.id, key, mode) for image, (model, key) in pending],
+        return_exceptions=True,
+    )
+    errors = [error for error in published if isinstance(error, BaseException)]
+    if errors:
+        failed = [result for (_, result), error in zip(pending, published) if isinstance(error, BaseException)]
+        await run_blocking(abandon, service, failed)
+        raise errors[0]
+    if mode == UploadMode.ACCEPT:
+        http_response.status_code = HTTPStatus.ACCEPTED
+    return [UploadImageResponse(**image.model_dump()) for image, _ in results]
+
+
+def save_bulk(
+    service: ImageService,
+    images: list[ImageContext],
+    duplicates: dict[str, ImageServiceOutput],
+    original_urls: dict[int, str],
+) -> list[ImageServiceOutput]:
+    payloads = []
+    for index, image in enumerate(images):
+        duplicate = duplicates.get(image.content_hash)
+        if duplicate:
+            payloads.append(
+                SaveImageInput(
+                    upload_url=duplicate.original_url,
+                    status=ImageProcessingType.DEDUPLICATED,
+                    content_hash=image.content_hash,
+                    svg_url=duplicate.svg_url,
+                )
+            )
+            continue
+        similar = service.find_similar(image)
+        payloads.append(
+            SaveImageInput(
+                upload_url=original_urls[index],
+                status=ImageProcessingType.DEDUPLICATED if similar else ImageProcessingType.READY,
+                content_hash=image.content_hash,
+                svg_url=similar.svg_url if similar else None,
+                perceptual_hash=image.perceptual_hash,
+                width=image.preprocessed.width,
+                height=image.preprocessed.height,
+            )
+        )
+    return service.save_many_with_log(payloads)
+
+
+def enqueue_many(service: ImageService, tasks: list[tuple[UUID4, str, bytes]]) -> None:
+    # one group, published over a single broker connection.
+    # the preprocessed images are spooled only now, deduplicated images never leave a spool file
+    if not tasks:
+        return
+    try:
+        for _, storage_key, image_data in tasks:
+            service.spool(storage_key, image_data)
+        group(process_image_task.s(original_id, storage_key) for original_id, storage_key, _ in tasks).apply_async()
+    except Exception as e:
+        for _, storage_key, _ in tasks:
+            service.unspool(storage_key)
+        raise e
 
-    for image in images:
-        # 2. image preprocessing
-        original_id, preprocessed_image, original_image_model = preprocess(service, image)
-        # 3. image processing send to task queue
-        process_image_task.apply_async(args=[original_id, preprocessed_image], ignore_result=True)
-        # 4. append response
+
+@router.post('/bulk', response_model=List[UploadImageResponse])
+async def upload_bulk_images(
+    files: List[UploadFile] = File(...),
+    service: ImageService = Depends(get_image_service),
+):
+    # 1. read and validate up to MAX_ALLOWED_BULK_IMAGE_COUNT images
+    images = await run_blocking(service.receive, [file.file for file in files], bulk=True)
+    # 2. completed conversions of the same uploads are found with one query
+    duplicates = await run_blocking(service.find_duplicates, [image.content_hash for image in images])
+    # 3. preprocessing and s3 uploads run on the executor
+    # every upload finishes before the request may fail, the stored originals are removed again
+    indexes = [index for index, image in enumerate(images) if image.content_hash not in duplicates]
+    stored = await asyncio.gather(
+        *[run_blocking(preprocess, service, images[index]) for index in indexes], return_exceptions=True
+    )
+    errors = [result for result in stored if isinstance(result, BaseException)]
+    uploaded = [result[0] for result in stored if not isinstance(result, BaseException)]
+    if errors:
+        await run_blocking(service.discard, uploaded)
+        raise errors[0]
+    storage_keys = {index: storage_key for index, (storage_key, _) in zip(indexes, stored)}
+    original_urls = {index: original_url for index, (_, original_url) in zip(indexes, stored)}
+    # 4. every image and its log in one transaction, then every conversion in one batch
+    try:
+        response = await run_blocking(save_bulk, service, images, duplicates, original_urls)
+    except Exception as e:
+        await run_blocking(service.discard, uploaded)
+        raise e
+    ready = [(index, item) for index, item in enumerate(response) if item.status == ImageProcessingType.READY.value]
+    try:
+        await run_blocking(
+            enqueue_many,
+            service,
+            [(item.id, storage_keys[index], images[index].preprocessed.data) for index, item in ready],
+        )
+    except Exception as e:
+        await run_blocking(abandon, service, [(item, storage_keys[index]) for index, item in ready])
+        raise e
+
+    return [UploadImageResponse(**item.model_dump()) for item in response]
+
+
+@router.post('/uploads', response_model=List[UploadUrlOutput])
+def create_uploads(
+    request: CreateUploadsRequest,
+    service: ImageService = Depends(get_image_service),
+):
+    # the client PUTs each image to its url, then calls /uploads/complete with the keys
+    return service.create_upload_urls(request.extensions)
+
+
+@router.post('/uploads/complete', response_model=List[UploadImageResponse])
+def complete_uploads(
+    request: CompleteUploadsRequest,
+    service: ImageService = Depends(get_image_service),
+):
+    # 1. validate the uploaded objects from their size and header
+    original_urls = service.inspect_uploads(request.keys)
+    # a repeated completion returns the images created the first time
+    completed = {image.original_url: image for image in service.get_by_original_urls(original_urls)}
+
+    response: list[ImageServiceOutput] = []
+    for key, original_url in zip(request.keys, original_urls):
+        if original_url in completed:
+            response.append(completed[original_url])
+            continue
+        # 2. the raw upload is preprocessed by the worker, which replaces it with the preprocessed image
+        original_image_model = service.save_with_log(original_url, ImageProcessingType.READY)
+        try:
+            process_image_task.apply_async(
+                args=[original_image_model.id, key], kwargs={'preprocess': True}, ignore_result=True
+            )
+        except Exception as e:
+            abandon(service, [(original_image_model, key)])
+            raise e
         response.append(original_image_model)
 
     return [UploadImageResponse(**item.model_dump()) for item in response]
+
+
+@router.post('/delete', response_model=DeleteImagesResponse)
+def delete_images(
+    request: DeleteImagesRequest,
+    service: ImageService = Depends(get_image_service),
+):
+    # rows go first in one transaction, the stored files are removed by the worker in delete_objects sized batches
+    result = service.delete_many(request.ids)
+    if result.storage_keys:
+        group(delete_files_task.s(batch) for batch in batched(result.storage_keys, DELETE_BATCH_SIZE)).apply_async()
+    return DeleteImagesResponse(deleted=result.deleted)
@@ -1,5 +1,11 @@
+from importlib.util import find_spec
+from typing import Optional
+
+from pydantic import field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from app.schema.enum.image import StorageBackendType, SvgEncodingType, SvgOptimizerType
+
 
 class EnvironmentContainer(BaseSettings):
     AWS_ACCESS_KEY_ID: str
@@ -8,8 +14,33 @@ class EnvironmentContainer(BaseSettings):
     DB_URL: str
     BUCKET_NAME: str
     MESSAGES_BROKER_URL: str
+    MAXIMUM_IMAGE_PIXELS: int = 8000 * 8000  # decoded bitmap budget, checked from the header before any decode
+    SVG_OPTIMIZER: SvgOptimizerType = SvgOptimizerType.BUILTIN
+    SVG_SIMPLIFY_TOLERANCE: float = 0.0  # pixels, 0 keeps every contour point
+    SVG_MIN_CONTOUR_AREA: float = 0.0  # square pixels, smaller contours are dropped
+    SVG_ENCODING: SvgEncodingType = SvgEncodingType.GZIP  # content encoding of stored svgs
+    SVG_COMPRESSION_LEVEL: int = 6  # gzip 1-9, brotli 0-11, see benchmark.svg_compression
+    STORAGE_BACKEND: StorageBackendType = StorageBackendType.S3
+    LOCAL_STORAGE_DIR: str = '/volume/storage'  # root of the local backend, one directory per bucket
+    LOCAL_STORAGE_URL: str = 'http://localhost:8000/api/v1/files'  # public base url of the local backend's files
+    STORAGE_KEY_SHARD_LENGTH: int = 2  # leading hex characters of a new key used as its prefix, 0 for none
+    SPOOL_DIR: Optional[str] = None  # volume shared by api and worker, images are handed over here before s3
+    BLOCKING_WORKERS: int = 8  # threads for preprocessing, s3 and db calls made from the event loop
+    S3_MAX_POOL_CONNECTIONS: int = 32  # open connections kept by the shared s3 client, at least BLOCKING_WORKERS
+    S3_MULTIPART_THRESHOLD: int = 1024 * 1024 * 8  # bytes, larger transfers are split into concurrent parts
+    S3_MULTIPART_CHUNKSIZE: int = 1024 * 1024 * 8  # bytes per part, s3 requires at least 5MB
+    S3_TRANSFER_CONCURRENCY: int = 4  # parts in flight per transfer
+    EVENT_LOOP_LAG_THRESHOLD: float = 0.1  # seconds, a longer stall of the event loop is logged as a warning
 
     model_config = SettingsConfigDict(env_file='.env', case_sensitive=False)
 
+    @field_validator('SVG_ENCODING')
+    @classmethod
+    def check_svg_encoding(cls, encoding: SvgEncodingType) -> SvgEncodingType:
+        # fails at start-up rather than on every conversion
+        if encoding == SvgEncodingType.BROTLI and find_spec('brotli') is None:
+            raise ValueError('SVG_ENCODING=br needs the brotli package')
+        return encoding
+
 
 env = EnvironmentContainer()
@@ -19,6 +19,10 @@ class UploadException(ImageServiceException):
     pass
 
 
+class DownloadException(ImageServiceException):
+    pass
+
+
 class SaveException(ImageServiceException):
     pass
 
@@ -46,6 +50,14 @@ class ContentsNotFoundException(ImageServiceCustomException):
     pass
 
 
+class InvalidCursorException(ImageServiceCustomException):
+    pass
+
+
+class NotSupportedUploadException(ImageServiceCustomException):
+    pass
+
+
 # response for controller
 async def not_supperted_type_exception_handler(request, exc: NotSupportedTypeException):
     return JSONResponse(
@@ -68,6 +80,20 @@ async def out_of_allowed_count_exception_handler(request, exc: OutOfAllowedCount
     )
 
 
+async def invalid_cursor_exception_handler(request, exc: InvalidCursorException):
+    return JSONResponse(
+        status_code=400,
+        content={'message': exc.message, 'error_code': exc.error_code},
+    )
+
+
+async def not_supported_upload_exception_handler(request, exc: NotSupportedUploadException):
+    return JSONResponse(
+        status_code=400,
+        content={'message': exc.message, 'error_code': exc.error_code},
+    )
+
+
 async def contents_not_found_exception_handler(request, exc: ContentsNotFoundException):
     return JSONResponse(
         status_code=404,
@@ -79,5 +105,7 @@ exceptions = [
     (NotSupportedTypeException, not_supperted_type_exception_handler),
     (OutOfAllowedSizeException, out_of_allowed_size_exception_handler),
     (OutOfAllowedCountException, out_of_allowed_count_exception_handler),
+    (InvalidCursorException, invalid_cursor_exception_handler),
+    (NotSupportedUploadException, not_supported_upload_exception_handler),
     (ContentsNotFoundException, contents_not_found_exception_handler),
 ]
@@ -2,22 +2,28 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 
-from app.api.v1 import images
+from app.api.v1 import files, images
+from app.config.env import env
 from app.exception.common import exceptions as common_exceptions
 from app.exception.image import exceptions as image_exceptions
+from app.util.event_loop import EventLoopLagMonitor
 from app.util.init_db import create_tables
 
 
 @asynccontextmanager
 async def lifecycle(app: FastAPI):
     create_tables()
+    app.state.event_loop_lag = EventLoopLagMonitor(threshold=env.EVENT_LOOP_LAG_THRESHOLD)
+    app.state.event_loop_lag.start()
     yield
+    await app.state.event_loop_lag.stop()
 
 
 app = FastAPI(lifespan=lifecycle)
 
 # Include routers
 app.include_router(images.router, prefix='/api/v1/images', tags=['Images'])
+app.include_router(files.router, prefix='/api/v1/files', tags=['Files'])
 
 # Include exception handlers
 [app.add_exception_handler(exception, handler) for exception, handler in common_exceptions + image_exceptions]
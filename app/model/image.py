@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import UUID, Column, DateTime, ForeignKey, String
+from sqlalchemy import UUID, Column, DateTime, Float, ForeignKey, Index, Integer, String
 from sqlalchemy.orm import relationship
 
 from app.config.database import Base
@@ -9,24 +9,51 @@ from app.config.database import Base
 
 class Image(Base):
     __tablename__ = 'image'
+    # keyset pagination walks this index from the newest row, (created_at, id) is unique even for equal timestamps
+    __table_args__ = (Index('ix_image_created_at_id', 'created_at', 'id'),)
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     original_url = Column(String, nullable=False)
     svg_url = Column(String, nullable=True)
+    svg_size = Column(Integer, nullable=True)  # stored bytes, after SVG_ENCODING
+    svg_compression_time = Column(Float, nullable=True)  # seconds spent encoding the svg
+    content_hash = Column(String(64), nullable=True, index=True)  # sha256 of the uploaded bytes
+    perceptual_hash = Column(String(16), nullable=True)  # 64 bit dHash of the preprocessed image, hex
+    width = Column(Integer, nullable=True)  # preprocessed image, near duplicates must have the same size
+    height = Column(Integer, nullable=True)
+    current_status = Column(String, nullable=True)  # status of the newest processing_log, written with it
+    status_updated_at = Column(DateTime, nullable=True)  # created_at of that log
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
     processing_log = relationship(
         'ProcessingLog', back_populates='image', lazy='selectin', cascade='all, delete-orphan'
     )
+    perceptual_hash_index = relationship(
+        'ImagePerceptualHash', back_populates='image', uselist=False, cascade='all, delete-orphan'
+    )
 
 
 class ProcessingLog(Base):
     __tablename__ = 'processing_log'
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    original_id = Column(UUID(as_uuid=True), ForeignKey('image.id'), nullable=False)
+    original_id = Column(UUID(as_uuid=True), ForeignKey('image.id'), nullable=False, index=True)
     status = Column(String, nullable=False, default='ready')
     created_at = Column(DateTime, default=datetime.now)
 
     image = relationship('Image', back_populates='processing_log')
+
+
+class ImagePerceptualHash(Base):
+    # multi-index hashing: the 64 bit hash split into four indexed 16 bit bands,
+    # two hashes within hamming distance 3 always share at least one band
+    __tablename__ = 'image_perceptual_hash'
+
+    original_id = Column(UUID(as_uuid=True), ForeignKey('image.id'), primary_key=True)
+    band_0 = Column(Integer, nullable=False, index=True)
+    band_1 = Column(Integer, nullable=False, index=True)
+    band_2 = Column(Integer, nullable=False, index=True)
+    band_3 = Column(Integer, nullable=False, index=True)
+
+    image = relationship('Image', back_populates='perceptual_hash_index')
@@ -2,6 +2,7 @@ from abc import ABC
 from typing import Generic, List, Optional, Type, TypeVar, Union
 
 from pydantic import UUID4
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 
 from app.schema.dao.common import CommonInput, CommonOutput
@@ -27,6 +28,18 @@ class BaseRepository(ABC, Generic[T, InputDAO, OutputDAO]):
         self.session.commit()
         return self._convert_to_output(model)
 
+    def add_many(self, models: List[T]) -> List[OutputDAO]:
+        # one multi-row INSERT per table (insertmanyvalues), the outputs are read before the commit expires them
+        try:
+            self.session.add_all(models)
+            self.session.flush()
+            outputs = [self._convert_to_output(model) for model in models]
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            raise e
+        return outputs
+
     def get(self, id: UUID4) -> Optional[OutputDAO]:
         model = self.session.query(self.model).filter_by(id=id).first()
         return self._convert_to_output(model) if model else None
@@ -43,6 +56,19 @@ class BaseRepository(ABC, Generic[T, InputDAO, OutputDAO]):
         updated_model = self.get(id)
         return self._convert_to_output(updated_model) if updated_model else None
 
+    def update_many(self, values: List[dict], commit: bool = True) -> None:
+        # bulk UPDATE by primary key, every dict carries the 'id' and the columns to set.
+        # commit=False leaves the transaction open for the caller's next write
+        if not values:
+            return
+        try:
+            self.session.execute(update(self.model), values)
+            if commit:
+                self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            raise e
+
     def delete(self, id: UUID4) -> None:
         deleted_model = self.session.query(self.model).filter_by(id=id).first()
         if deleted_model:
@@ -1,9 +1,10 @@
+from datetime import datetime
 from typing import Optional
 
 from pydantic import UUID4
-from sqlalchemy import func
+from sqlalchemy import and_, bindparam, or_, select, update
 
-from app.model.image import Image, ProcessingLog
+from app.model.image import Image, ImagePerceptualHash, ProcessingLog
 from app.repository.common import BaseRepository
 from app.schema.dao.image import (
     ImageInput,
@@ -13,63 +14,269 @@ from app.schema.dao.image import (
     ProcessingLogInput,
     ProcessingLogOutput,
 )
+from app.schema.enum.image import ImageProcessingType
+from app.util.helper import encode_cursor
+from app.util.image_util import hamming_distance, perceptual_hash_bands
 
 
 class ImageRepository(BaseRepository[Image, ImageInput, ImageOutput]):
-    def get_latest_image(self, id: UUID4) -> Optional[MixinImageProcessingLogOutput | None]:
-        result = (
-            self.session.query(
-                self.model.id,
-                self.model.original_url,
-                self.model.svg_url,
-                ProcessingLog.status,
-                self.model.created_at,
-                self.model.updated_at,
+    def _index_perceptual_hash(self, model: Image) -> None:
+        # the near-duplicate index grows with every image, in the same commit
+        if model.perceptual_hash and model.perceptual_hash_index is None:
+            bands = perceptual_hash_bands(model.perceptual_hash)
+            model.perceptual_hash_index = ImagePerceptualHash(**{f'band_{i}': band for i, band in enumerate(bands)})
+
+    def _set_current_status(self, model: Image) -> None:
+        # the newest log's status is kept on the row, so reads need no join over processing_log
+        for log in model.processing_log:
+            log.created_at = log.created_at or datetime.now()
+        if model.processing_log:
+            model.current_status = model.processing_log[-1].status
+            model.status_updated_at = model.processing_log[-1].created_at
+
+    def add(self, model: Image) -> ImageOutput:
+        self._index_perceptual_hash(model)
+        self._set_current_status(model)
+        return super().add(model)
+
+    def add_many(self, models: list[Image]) -> list[ImageOutput]:
+        for model in models:
+            self._index_perceptual_hash(model)
+            self._set_current_status(model)
+        return super().add_many(models)
+
+    def add_with_log(self, model: Image, status: ImageProcessingType) -> ImageOutput:
+        return self.add_many_with_log([(model, status)])[0]
+
+    def add_many_with_log(self, models: list[tuple[Image, ImageProcessingType]]) -> list[ImageOutput]:
+        # images, first logs and hash index in one transaction
+        for model, status in models:
+            model.processing_log.append(ProcessingLog(status=status.value))
+        return self.add_many([model for model, _ in models])
+
+    def index(self, id: UUID4, perceptual_hash: str, width: int, height: int) -> Optional[ImageOutput]:
+        # images preprocessed by the worker get their hash and size after they are saved
+        model = self.session.get(self.model, id)
+        if model is None:
+            return None
+        try:
+            model.perceptual_hash, model.width, model.height = perceptual_hash, width, height
+            self._index_perceptual_hash(model)
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            raise e
+        return self._convert_to_output(model)
+
+    def delete_many_with_log(self, ids: list[UUID4]) -> list[ImageOutput]:
+        # logs, hash index and images are deleted set-based in one transaction, the deleted rows are returned
+        try:
+            rows = (
+                self.session.query(
+                    self.model.id,
+                    self.model.original_url,
+                    self.model.svg_url,
+                    self.model.content_hash,
+                    self.model.perceptual_hash,
+                    self.model.created_at,
+                    self.model.updated_at,
+                )
+                .filter(self.model.id.in_(ids))
+                .all()
             )
-            .outerjoin(ProcessingLog)
-            .filter(self.model.id == id)
-            .order_by(ProcessingLog.created_at.desc())
-            .first()
+            deleted_ids = [row.id for row in rows]
+            if deleted_ids:
+                for table in [ProcessingLog, ImagePerceptualHash]:
+                    self.session.query(table).filter(table.original_id.in_(deleted_ids)).delete(
+                        synchronize_session=False
+                    )
+                self.session.query(self.model).filter(self.model.id.in_(deleted_ids)).delete(synchronize_session=False)
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            raise e
+        return [self._convert_to_output(row) for row in rows]
+
+    def get_svg_urls(self, image_ids: list[UUID4]) -> set[str]:
+        rows = self.session.query(self.model.svg_url).filter(self.model.id.in_(image_ids)).all()
+        return {row.svg_url for row in rows if row.svg_url}
+
+    def get_referenced_urls(self, urls: list[str]) -> set[str]:
+        # deduplicated rows share the original and svg of another image
+        rows = (
+            self.session.query(self.model.original_url, self.model.svg_url)
+            .filter(or_(self.model.original_url.in_(urls), self.model.svg_url.in_(urls)))
+            .all()
+        )
+        return {url for row in rows for url in row if url in urls}
+
+    def _query_with_status(self):
+        return self.session.query(
+            self.model.id,
+            self.model.original_url,
+            self.model.svg_url,
+            self.model.current_status.label('status'),
+            self.model.created_at,
+            self.model.updated_at,
         )
+
+    def get_latest_image(self, id: UUID4) -> Optional[MixinImageProcessingLogOutput | None]:
+        result = self._query_with_status().filter(self.model.id == id).first()
         return self._convert_to_output(result, MixinImageProcessingLogOutput) if result else None
 
-    def get_images_with_pagination(self, limit: int, offset: int) -> ImagePaginationOutput:
-        total = self.session.query(self.model).count()
-        subquery = (
-            self.session.query(
-                ProcessingLog.id,
-                ProcessingLog.original_id,
-                ProcessingLog.status,
-                func.max(ProcessingLog.created_at).label('created_at'),
+    def get_by_original_urls(self, original_urls: list[str]) -> list[ImageOutput]:
+        models = self.session.query(self.model).filter(self.model.original_url.in_(original_urls)).all()
+        return [self._convert_to_output(model) for model in models]
+
+    def get_completed_by_content_hash(self, content_hash: str) -> Optional[ImageOutput]:
+        model = (
+            self.session.query(self.model)
+            .filter(self.model.content_hash == content_hash, self.model.svg_url.isnot(None))
+            .order_by(self.model.created_at.desc())
+            .first()
+        )
+        return self._convert_to_output(model) if model else None
+
+    def get_completed_by_content_hashes(self, content_hashes: list[str]) -> dict[str, ImageOutput]:
+        models = (
+            self.session.query(self.model)
+            .filter(self.model.content_hash.in_(content_hashes), self.model.svg_url.isnot(None))
+            .order_by(self.model.created_at)
+            .all()
+        )
+        # the newest conversion of each hash wins, like get_completed_by_content_hash
+        return {model.content_hash: self._convert_to_output(model) for model in models}
+
+    def get_completed_by_perceptual_hash(
+        self, perceptual_hash: str, width: int, height: int, max_distance: int, limit: Optional[int] = None
+    ) -> list[ImageOutput]:
+        # candidates share at least one band through the index, the exact distance is checked on those only.
+        # they are returned closest and newest first, one per stored original, the caller confirms them
+        # before reusing a svg
+        bands = perceptual_hash_bands(perceptual_hash)
+        candidates = (
+            self.session.query(self.model)
+            .join(ImagePerceptualHash)
+            .filter(
+                or_(*[getattr(ImagePerceptualHash, f'band_{i}') == band for i, band in enumerate(bands)]),
+                self.model.width == width,
+                self.model.height == height,
+                self.model.svg_url.isnot(None),
             )
-            .group_by(ProcessingLog.original_id)
-            .subquery()
+            .all()
+        )
+        distances = [(hamming_distance(perceptual_hash, model.perceptual_hash), model) for model in candidates]
+        matches = sorted(
+            [(distance, model) for distance, model in distances if distance <= max_distance],
+            key=lambda match: (match[0], -match[1].created_at.timestamp()),
         )
+        # deduplicated rows share their original, it is compared once
+        originals = {}
+        for _, model in matches:
+            originals.setdefault(model.original_url, model)
+        return [self._convert_to_output(model) for model in list(originals.values())[:limit]]
 
+    def get_images_with_pagination(self, limit: int, offset: int) -> ImagePaginationOutput:
+        total = self.session.query(self.model).count()
         result = (
-            self.session.query(
-                self.model.id,
-                self.model.original_url,
-                self.model.svg_url,
-                subquery.c.id.label('processing_log_id'),
-                subquery.c.status,
-                self.model.created_at,
-                self.model.updated_at,
-            )
-            .outerjoin(subquery, subquery.c.original_id == self.model.id)
-            .order_by(self.model.created_at.desc())
+            self._query_with_status()
+            .order_by(self.model.created_at.desc(), self.model.id.desc())
             .limit(limit)
             .offset(offset * limit)
             .all()
         )
+        # pages share the keyset order, so a client can continue from any page with next_cursor
+        has_next = bool(result) and offset * limit + len(result) < total
 
         return ImagePaginationOutput(
             total=total,
             limit=limit,
             page=offset,
+            next_cursor=encode_cursor(result[-1].created_at, result[-1].id) if has_next else None,
             items=[self._convert_to_output(image, MixinImageProcessingLogOutput) for image in result],
         )
 
+    def get_images_after(
+        self, limit: int, after: Optional[tuple[datetime, UUID4]] = None, include_total: bool = False
+    ) -> ImagePaginationOutput:
+        # keyset pagination: the page starts below the cursor on ix_image_created_at_id, however deep it is
+        query = self._query_with_status()
+        if after:
+            created_at, id = after
+            # the redundant created_at <= bound lets the database seek the index instead of filtering from the top
+            query = query.filter(
+                self.model.created_at <= created_at,
+                or_(self.model.created_at < created_at, and_(self.model.created_at == created_at, self.model.id < id)),
+            )
+        # one extra row tells whether there is a next page
+        rows = query.order_by(self.model.created_at.desc(), self.model.id.desc()).limit(limit + 1).all()
+        rows, has_next = rows[:limit], len(rows) > limit
+
+        return ImagePaginationOutput(
+            total=self.session.query(self.model).count() if include_total else None,
+            limit=limit,
+            next_cursor=encode_cursor(rows[-1].created_at, rows[-1].id) if has_next else None,
+            items=[self._convert_to_output(row, MixinImageProcessingLogOutput) for row in rows],
+        )
+
+    def backfill_current_status(self, batch_size: int = 1000) -> int:
+        # rows written before current_status existed take the status of their newest log, a batch per commit
+        latest_log = (
+            select(ProcessingLog.status, ProcessingLog.created_at)
+            .where(ProcessingLog.original_id == self.model.id)
+            .order_by(ProcessingLog.created_at.desc())
+            .limit(1)
+        )
+        updated = 0
+        while True:
+            ids = [
+                row.id
+                for row in self.session.query(self.model.id)
+                .filter(self.model.current_status.is_(None), self.model.processing_log.any())
+                .limit(batch_size)
+            ]
+            if not ids:
+                return updated
+            self.session.execute(
+                update(self.model)
+                .where(self.model.id.in_(ids))
+                .values(
+                    current_status=latest_log.with_only_columns(ProcessingLog.status).scalar_subquery(),
+                    status_updated_at=latest_log.with_only_columns(ProcessingLog.created_at).scalar_subquery(),
+                )
+                .execution_options(synchronize_session=False)
+            )
+            self.session.commit()
+            updated += len(ids)
+
 
 class ProcessingLogRepository(BaseRepository[ProcessingLog, ProcessingLogInput, ProcessingLogOutput]):
-    pass
+    def _set_current_status(self, models: list[ProcessingLog]) -> None:
+        # the image row follows its newest log in the same transaction, an older log never overwrites a newer one
+        if not models:
+            return
+        image = Image.__table__
+        values = []
+        for model in models:
+            model.created_at = model.created_at or datetime.now()
+            values.append({'_id': model.original_id, '_status': model.status, '_at': model.created_at})
+        self.session.execute(
+            update(image)
+            .where(
+                image.c.id == bindparam('_id'),
+                or_(image.c.status_updated_at.is_(None), image.c.status_updated_at <= bindparam('_at')),
+            )
+            .values(current_status=bindparam('_status'), status_updated_at=bindparam('_at')),
+            values,
+        )
+
+    def add(self, model: ProcessingLog) -> ProcessingLogOutput:
+        return self.add_many([model])[0]
+
+    def add_many(self, models: list[ProcessingLog]) -> list[ProcessingLogOutput]:
+        try:
+            self._set_current_status(models)
+        except Exception as e:
+            self.session.rollback()
+            raise e
+        return super().add_many(models)
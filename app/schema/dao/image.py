@@ -14,6 +14,9 @@ database related input schema
 class ImageInput(CommonInput):
     original_url: Optional[str] = None
     svg_url: Optional[str] = None
+    svg_size: Optional[int] = None
+    svg_compression_time: Optional[float] = None
+    content_hash: Optional[str] = None
 
 
 class ProcessingLogInput(CommonInput):
@@ -46,6 +49,14 @@ class ImageOutput(CommonOutput):
     id: UUID4
     original_url: str
     svg_url: Optional[str] = None
+    svg_size: Optional[int] = None
+    svg_compression_time: Optional[float] = None
+    content_hash: Optional[str] = None
+    perceptual_hash: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    current_status: Optional[ImageProcessingType] = None
+    status_updated_at: Optional[datetime] = None
     processing_log: list[ProcessingLogOutput] = []
     created_at: datetime
     updated_at: datetime
@@ -73,7 +84,8 @@ class MixinImageProcessingLogOutput(CommonOutput):
 
 
 class ImagePaginationOutput(CommonOutput):
-    total: int
-    page: int
+    total: Optional[int] = None
+    page: Optional[int] = None
     limit: int
+    next_cursor: Optional[str] = None
     items: list[MixinImageProcessingLogOutput] = []
@@ -1,9 +1,9 @@
 from datetime import datetime
 from typing import Optional
 
-from pydantic import UUID4, BaseModel, ConfigDict
+from pydantic import UUID4, BaseModel, ConfigDict, computed_field
 
-from app.schema.enum.image import ImageProcessingType
+from app.schema.enum.image import ImageProcessingType, SvgEncodingType
 
 
 class ImageServiceInput(BaseModel):
@@ -15,6 +15,22 @@ class SaveLogInput(BaseModel):
     status: ImageProcessingType
 
 
+class SaveImageInput(BaseModel):
+    upload_url: str
+    status: ImageProcessingType
+    content_hash: Optional[str] = None
+    svg_url: Optional[str] = None
+    perceptual_hash: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+
+class StoredSvgOutput(BaseModel):
+    url: str
+    size: int
+    compression_time: float
+
+
 class ImageServiceOutput(BaseModel):
     id: UUID4
     original_url: str
@@ -25,9 +41,10 @@ class ImageServiceOutput(BaseModel):
 
 
 class ImageServicePaginationOutput(BaseModel):
-    total: int
+    total: Optional[int] = None
     limit: int
-    page: int
+    page: Optional[int] = None
+    next_cursor: Optional[str] = None
     items: list[ImageServiceOutput]
 
     def model_dump(self):
@@ -44,6 +61,33 @@ class UploadImageResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class CreateUploadsRequest(BaseModel):
+    extensions: list[str]
+
+
+class UploadUrlOutput(BaseModel):
+    key: str
+    url: str
+    expires_in: int
+
+
+class CompleteUploadsRequest(BaseModel):
+    keys: list[str]
+
+
+class DeleteImagesRequest(BaseModel):
+    ids: list[UUID4]
+
+
+class DeleteImagesOutput(BaseModel):
+    deleted: int
+    storage_keys: list[str] = []
+
+
+class DeleteImagesResponse(BaseModel):
+    deleted: int
+
+
 class GetImageResponse(BaseModel):
     id: UUID4
     original_url: str
@@ -53,11 +97,18 @@ class GetImageResponse(BaseModel):
 
     model_config = ConfigDict(from_attributes=True)
 
+    @computed_field
+    @property
+    def svg_encoding(self) -> Optional[SvgEncodingType]:
+        # the Content-Encoding the svg is served with, known from its key
+        return SvgEncodingType.of(self.svg_url) if self.svg_url else None
+
 
 class GetImagesResponse(BaseModel):
-    total: int
+    total: Optional[int] = None
     limit: int
-    page: int
+    page: Optional[int] = None
+    next_cursor: Optional[str] = None
     items: list[GetImageResponse] = []
 
     model_config = ConfigDict(from_attributes=True)
@@ -1,11 +1,25 @@
 from enum import Enum
 
-from app.util.contants import MAX_ALLOWED_IMAGE_COUNT, MAXIMUM_IMAGE_SIZE
+from app.config.env import env
+from app.util.contants import (
+    MAX_ALLOWED_BULK_IMAGE_COUNT,
+    MAX_ALLOWED_DELETE_IMAGE_COUNT,
+    MAX_ALLOWED_IMAGE_COUNT,
+    MAXIMUM_IMAGE_SIZE,
+)
 
 
 class ErrorType(tuple, Enum):
     INVALID_IMAGE_TYPE = (40001, 'The image type should be jpg or png')
     INVALID_IMAGE_SIZE = (40002, f'The image size should be less than {MAXIMUM_IMAGE_SIZE} bytes')
+    INVALID_IMAGE_PIXELS = (40003, f'The image should have less than {env.MAXIMUM_IMAGE_PIXELS} pixels')
     OUT_OF_ALLOWED_MAXIMUM_COUNT = (40004, f'The number of images should be less than {MAX_ALLOWED_IMAGE_COUNT}')
     OUT_OF_ALLOWED_MINIMUM_COUNT = (40005, 'At least one image is required')
+    OUT_OF_ALLOWED_BULK_COUNT = (40006, f'The number of images should be less than {MAX_ALLOWED_BULK_IMAGE_COUNT}')
+    OUT_OF_ALLOWED_DELETE_COUNT = (
+        40007,
+        f'The number of images should be less than {MAX_ALLOWED_DELETE_IMAGE_COUNT}',
+    )
+    INVALID_CURSOR = (40008, 'The cursor is not valid')
+    PRESIGNED_UPLOAD_NOT_SUPPORTED = (40009, 'Presigned uploads need the s3 storage backend')
     CONTENTS_NOT_FOUND = (40401, 'The contents not found')
@@ -2,7 +2,42 @@ from enum import Enum
 
 
 class ImageProcessingType(str, Enum):
+    RECEIVED = 'received'  # stored as uploaded, the worker preprocesses it
     READY = 'ready'
     PROCESSING = 'processing'
     COMPLETED = 'completed'
     FAILED = 'failed'
+    DEDUPLICATED = 'deduplicated'
+
+
+class UploadMode(str, Enum):
+    SYNC = 'sync'  # preprocessed and stored before the response
+    ACCEPT = 'accept'  # 202 once the upload is spooled, preprocessing moves to the worker
+
+
+class SvgOptimizerType(str, Enum):
+    BUILTIN = 'builtin'
+    SCOUR = 'scour'  # max compression, noticeably slower on large outputs
+
+
+class SvgEncodingType(str, Enum):
+    IDENTITY = 'identity'
+    GZIP = 'gzip'  # svgz
+    BROTLI = 'br'  # smaller than gzip at the same speed, needs the brotli package
+
+    @property
+    def suffix(self) -> str:
+        # appended to the key, so the encoding of a stored svg is known from its url
+        return {'identity': '', 'gzip': '.gz', 'br': '.br'}[self.value]
+
+    @classmethod
+    def of(cls, file_name: str) -> 'SvgEncodingType':
+        for encoding in [cls.GZIP, cls.BROTLI]:
+            if file_name.endswith(encoding.suffix):
+                return encoding
+        return cls.IDENTITY
+
+
+class StorageBackendType(str, Enum):
+    S3 = 's3'
+    LOCAL = 'local'  # files on this host, for single node deployments and local runs
@@ -1,9 +1,18 @@
-from typing import Optional
+import hashlib
+import logging
+import re
+import time
+from io import BytesIO
+from typing import BinaryIO, Optional, Union
+
+from pydantic import UUID4
 
 from app.config.env import env
 from app.exception.image import (
     ContentsNotFoundException,
+    DownloadException,
     ImageServiceException,
+    InvalidCursorException,
     NotSupportedTypeException,
     OutOfAllowedCountException,
     OutOfAllowedSizeException,
@@ -15,12 +24,71 @@ from app.exception.image import (
 from app.model.image import Image, ProcessingLog
 from app.repository.image import ImageRepository, ProcessingLogRepository
 from app.schema.dao.image import ImageInput
-from app.schema.dto.image import ImageServiceOutput, ImageServicePaginationOutput, SaveLogInput
+from app.schema.dto.image import (
+    DeleteImagesOutput,
+    ImageServiceOutput,
+    ImageServicePaginationOutput,
+    SaveImageInput,
+    SaveLogInput,
+    StoredSvgOutput,
+    UploadUrlOutput,
+)
 from app.schema.enum.exception import ErrorType
-from app.util.contants import MAX_ALLOWED_IMAGE_COUNT, MAXIMUM_IMAGE_SIZE
-from app.util.helper import exception_handler
-from app.util.image_util import get_image_size, is_jpg_or_png, preprocess_image, process_image
-from app.util.s3_uploder import S3Uploader
+from app.schema.enum.image import ImageProcessingType
+from app.util.contants import (
+    IMAGE_HEADER_READ_SIZE,
+    MAX_ALLOWED_BULK_IMAGE_COUNT,
+    MAX_ALLOWED_DELETE_IMAGE_COUNT,
+    MAX_ALLOWED_IMAGE_COUNT,
+    MAXIMUM_IMAGE_SIZE,
+    PERCEPTUAL_HASH_DISTANCE,
+    PERCEPTUAL_HASH_MIN_BITS,
+    PRESIGNED_URL_EXPIRES_IN,
+    SIMILAR_MAX_CANDIDATES,
+    SIMILAR_PIXEL_RATIO,
+    SIMILAR_PIXEL_TOLERANCE,
+    UPLOAD_CHUNK_SIZE,
+)
+from app.util.helper import decode_cursor, exception_handler
+from app.util.image_util import (
+    ImageContext,
+    create_save_path,
+    encode_svg,
+    get_image_pixels,
+    get_image_size,
+    has_image_signature,
+    is_jpg_or_png,
+    is_near_blank,
+    pixel_difference,
+    preprocess_image,
+    process_image,
+)
+from app.util.spool import read_spool, remove_spool, write_spool
+from app.util.storage import FileMetadata, Storage, get_storage
+
+# presigned uploads are named by create_save_path, the client picks only the extension
+PRESIGNED_EXTENSIONS = {'png': 'png', 'jpg': 'jpeg', 'jpeg': 'jpeg'}
+# sharded uuid names, or the timestamped names issued before them
+PRESIGNED_KEY_NAME = r'(([0-9a-f]+/)?[0-9a-f]{32}|\d{8}/[\d-]+)'
+PRESIGNED_KEY_PATTERN = re.compile(rf'(PNG/{PRESIGNED_KEY_NAME}\.png)|(JPEG/{PRESIGNED_KEY_NAME}\.jpeg)')
+SVG_CONTENT_TYPE = 'image/svg+xml'
+
+
+def store_svg(storage: Storage, svg_data: bytes) -> StoredSvgOutput:
+    # svg is text and compresses well, it is stored encoded and served with the matching Content-Encoding
+    encoding = env.SVG_ENCODING
+    started = time.perf_counter()
+    encoded = encode_svg(svg_data, encoding, env.SVG_COMPRESSION_LEVEL)
+    compression_time = time.perf_counter() - started
+
+    name = create_save_path('svg') + encoding.suffix
+    metadata = FileMetadata(SVG_CONTENT_TYPE, encoding.value if encoding.suffix else None)
+    url = storage.upload_stream(env.BUCKET_NAME, name, BytesIO(encoded), len(encoded), metadata)
+    logging.info(
+        f'{name}: {len(svg_data)} -> {len(encoded)} bytes, {encoding.value} level {env.SVG_COMPRESSION_LEVEL}, '
+        f'{compression_time * 1000:.1f} ms'
+    )
+    return StoredSvgOutput(url=url, size=len(encoded), compression_time=compression_time)
 
 
 class ImageService:
@@ -32,42 +100,278 @@ class ImageService:
         self.image_repository = image_repository
         self.processing_log_repository = processing_log_repository
 
-    def validate(self, images: list[bytes]) -> bool:
-        if not images:
+    def _check_count(self, count: int, bulk: bool = False) -> None:
+        if not count:
             raise OutOfAllowedCountException(ErrorType.OUT_OF_ALLOWED_MINIMUM_COUNT)
 
-        if len(images) > MAX_ALLOWED_IMAGE_COUNT:
+        if bulk and count > MAX_ALLOWED_BULK_IMAGE_COUNT:
+            raise OutOfAllowedCountException(ErrorType.OUT_OF_ALLOWED_BULK_COUNT)
+
+        if not bulk and count > MAX_ALLOWED_IMAGE_COUNT:
             raise OutOfAllowedCountException(ErrorType.OUT_OF_ALLOWED_MAXIMUM_COUNT)
 
-        # 이미지 중 하나라도 예외가 발생하면 바로 예외를 발생시키고, 모두 통과하면 True를 반환합니다.
-        for image in images:
-            if not is_jpg_or_png(image):
+    def validate(self, images: list[Union[bytes, ImageContext]], bulk: bool = False) -> list[ImageContext]:
+        self._check_count(len(images), bulk)
+
+        # 이미지 중 하나라도 예외가 발생하면 바로 예외를 발생시키고, 모두 통과하면 이미지 컨텍스트 목록을 반환합니다.
+        contexts = [ImageContext.of(image) for image in images]
+        for context in contexts:
+            if not is_jpg_or_png(context):
                 raise NotSupportedTypeException(ErrorType.INVALID_IMAGE_TYPE)
 
-            if get_image_size(image) > MAXIMUM_IMAGE_SIZE:
+            if get_image_size(context) > MAXIMUM_IMAGE_SIZE:
+                raise OutOfAllowedSizeException(ErrorType.INVALID_IMAGE_SIZE)
+
+            # 헤더의 가로, 세로만으로 디코딩 전에 압축 폭탄을 걸러냅니다.
+            if get_image_pixels(context) > env.MAXIMUM_IMAGE_PIXELS:
+                raise OutOfAllowedSizeException(ErrorType.INVALID_IMAGE_PIXELS)
+        return contexts
+
+    def receive(self, streams: list[BinaryIO], bulk: bool = False) -> list[ImageContext]:
+        self._check_count(len(streams), bulk)
+        return self.validate([self._receive(stream) for stream in streams], bulk)
+
+    def _receive(self, stream: BinaryIO) -> ImageContext:
+        # 청크 단위로 읽으면서 형식과 크기를 확인하고, 통과한 바이트만 해시하고 보관합니다.
+        chunks, byte_size, digest = [], 0, hashlib.sha256()
+        while chunk := stream.read(UPLOAD_CHUNK_SIZE):
+            if not byte_size and not has_image_signature(chunk):
+                raise NotSupportedTypeException(ErrorType.INVALID_IMAGE_TYPE)
+            byte_size += len(chunk)
+            if byte_size > MAXIMUM_IMAGE_SIZE:
                 raise OutOfAllowedSizeException(ErrorType.INVALID_IMAGE_SIZE)
-        return True
+            digest.update(chunk)
+            chunks.append(chunk)
+        return ImageContext(b''.join(chunks), digest.hexdigest())
 
     @exception_handler(PreProcessImageException)
-    def preprocess(self, image: bytes) -> bytes:
+    def preprocess(self, image: Union[bytes, ImageContext]) -> bytes:
         return preprocess_image(image)
 
     @exception_handler(ProcessImageException)
-    def process(self, image: bytes) -> bytes:
-        return process_image(image)
+    def process(self, image: bytes, tolerance: Optional[float] = None, min_area: Optional[float] = None) -> bytes:
+        # the deployment's quality/size point, unless the caller tunes it
+        tolerance = env.SVG_SIMPLIFY_TOLERANCE if tolerance is None else tolerance
+        min_area = env.SVG_MIN_CONTOUR_AREA if min_area is None else min_area
+        return process_image(image, tolerance, min_area)
+
+    @exception_handler(UploadException)
+    def upload(self, name: str, image: Union[bytes, BinaryIO]) -> str:
+        storage = get_storage()
+        storage.create_bucket(env.BUCKET_NAME)
+        # large svgs and streamed bodies go up in concurrent parts
+        if isinstance(image, bytes):
+            return storage.upload_stream(env.BUCKET_NAME, name, BytesIO(image), len(image))
+        return storage.upload_stream(env.BUCKET_NAME, name, image)
 
     @exception_handler(UploadException)
-    def upload(self, name: str, image: bytes) -> str:
-        s3_uploader = S3Uploader()
-        s3_uploader.create_bucket(env.BUCKET_NAME)
-        return s3_uploader.upload_file(env.BUCKET_NAME, name, image)
+    def upload_svg(self, svg_data: bytes) -> StoredSvgOutput:
+        storage = get_storage()
+        storage.create_bucket(env.BUCKET_NAME)
+        return store_svg(storage, svg_data)
+
+    @exception_handler(UploadException)
+    def spool(self, name: str, image: bytes) -> None:
+        # api and worker share a volume, the worker reads the image from here instead of the storage
+        if env.SPOOL_DIR:
+            write_spool(env.SPOOL_DIR, name, image)
+
+    @exception_handler(UploadException)
+    def unspool(self, name: str) -> None:
+        # the image is in the storage or will not be converted, the spooled copy is not needed anymore
+        if env.SPOOL_DIR:
+            remove_spool(env.SPOOL_DIR, name)
+
+    @exception_handler(UploadException)
+    def stash(self, name: str, image: bytes) -> str:
+        # keeps an upload for the worker, on the shared volume when there is one, otherwise in the bucket
+        storage = get_storage()
+        if not env.SPOOL_DIR:
+            storage.create_bucket(env.BUCKET_NAME)
+            return storage.upload_file(env.BUCKET_NAME, name, image)
+        write_spool(env.SPOOL_DIR, name, image)
+        return storage.get_url(env.BUCKET_NAME, name)
+
+    @exception_handler(UploadException)
+    def discard(self, names: list[str]) -> None:
+        # stored objects of a failed request, no row points to them
+        if not names:
+            return
+        failed = get_storage().delete_files(env.BUCKET_NAME, names)
+        if failed:
+            logging.error(f'{len(failed)} of {len(names)} files are not deleted')
+
+    @exception_handler(DownloadException)
+    def download(self, name: str, size: Optional[int] = None) -> bytes:
+        image = read_spool(env.SPOOL_DIR, name) if env.SPOOL_DIR else None
+        if image is not None:
+            return image
+        storage = get_storage()
+        # a managed transfer costs an extra HeadObject, so only objects known to be large come down in ranged parts
+        if size is None or size < env.S3_MULTIPART_THRESHOLD:
+            return storage.download_file(env.BUCKET_NAME, name)
+        output = BytesIO()
+        storage.download_stream(env.BUCKET_NAME, name, output)
+        return output.getvalue()
+
+    @exception_handler(UploadException)
+    def create_upload_urls(self, extensions: list[str]) -> list[UploadUrlOutput]:
+        self._check_count(len(extensions))
+
+        extensions = [PRESIGNED_EXTENSIONS.get(extension.lower()) for extension in extensions]
+        if not all(extensions):
+            raise NotSupportedTypeException(ErrorType.INVALID_IMAGE_TYPE)
+
+        storage = get_storage()
+        storage.create_bucket(env.BUCKET_NAME)
+        keys = [create_save_path(extension) for extension in extensions]
+        return [
+            UploadUrlOutput(
+                key=key,
+                url=storage.create_upload_url(env.BUCKET_NAME, key, PRESIGNED_URL_EXPIRES_IN),
+                expires_in=PRESIGNED_URL_EXPIRES_IN,
+            )
+            for key in keys
+        ]
+
+    def _inspect_upload(self, storage: Storage, key: str, byte_size: int) -> None:
+        if byte_size > MAXIMUM_IMAGE_SIZE:
+            raise OutOfAllowedSizeException(ErrorType.INVALID_IMAGE_SIZE)
+
+        context = ImageContext(storage.download_file_head(env.BUCKET_NAME, key, IMAGE_HEADER_READ_SIZE))
+        if not is_jpg_or_png(context) or context.extension != key.rsplit('.', 1)[-1]:
+            raise NotSupportedTypeException(ErrorType.INVALID_IMAGE_TYPE)
+
+        if get_image_pixels(context) > env.MAXIMUM_IMAGE_PIXELS:
+            raise OutOfAllowedSizeException(ErrorType.INVALID_IMAGE_PIXELS)
+
+    @exception_handler(DownloadException)
+    def inspect_uploads(self, keys: list[str]) -> list[str]:
+        self._check_count(len(keys))
+
+        # 업로드된 객체는 내려받지 않고, 크기와 앞부분의 헤더만으로 검사합니다.
+        storage = get_storage()
+        for key in keys:
+            if not PRESIGNED_KEY_PATTERN.fullmatch(key):
+                raise ContentsNotFoundException(ErrorType.CONTENTS_NOT_FOUND)
+
+            byte_size = storage.get_file_size(env.BUCKET_NAME, key)
+            if byte_size is None:
+                raise ContentsNotFoundException(ErrorType.CONTENTS_NOT_FOUND)
+
+            try:
+                self._inspect_upload(storage, key, byte_size)
+            except (OutOfAllowedSizeException, NotSupportedTypeException) as e:
+                # a rejected upload is never completed, its object would stay in the bucket
+                storage.delete_file(env.BUCKET_NAME, key)
+                raise e
+        return [storage.get_url(env.BUCKET_NAME, key) for key in keys]
+
+    @exception_handler(ImageServiceException)
+    def find_duplicate(self, content_hash: str) -> Optional[ImageServiceOutput]:
+        duplicate = self.image_repository.get_completed_by_content_hash(content_hash)
+        return ImageServiceOutput(**duplicate.model_dump()) if duplicate else None
+
+    @exception_handler(ImageServiceException)
+    def find_duplicates(self, content_hashes: list[str]) -> dict[str, ImageServiceOutput]:
+        duplicates = self.image_repository.get_completed_by_content_hashes(content_hashes)
+        return {content_hash: ImageServiceOutput(**image.model_dump()) for content_hash, image in duplicates.items()}
+
+    @exception_handler(ImageServiceException)
+    def find_similar(self, image: ImageContext) -> Optional[ImageServiceOutput]:
+        # a 64 bit hash only finds candidates, near-blank hashes say nothing about line art and are never matched
+        preprocessed = image.preprocessed
+        if (
+            not preprocessed
+            or not image.perceptual_hash
+            or is_near_blank(image.perceptual_hash, PERCEPTUAL_HASH_MIN_BITS)
+        ):
+            return None
+        candidates = self.image_repository.get_completed_by_perceptual_hash(
+            image.perceptual_hash,
+            preprocessed.width,
+            preprocessed.height,
+            PERCEPTUAL_HASH_DISTANCE,
+            SIMILAR_MAX_CANDIDATES,
+        )
+        # a candidate's svg is reused only when its stored preprocessed image matches pixel by pixel
+        storage = get_storage()
+        for candidate in candidates:
+            key = storage.get_file_name(env.BUCKET_NAME, candidate.original_url)
+            try:
+                stored = storage.download_file(env.BUCKET_NAME, key) if key else None
+            except Exception as e:
+                logging.warning(f'{candidate.original_url} is not compared: {e}')
+                continue
+            if stored and pixel_difference(preprocessed.data, stored, SIMILAR_PIXEL_TOLERANCE) <= SIMILAR_PIXEL_RATIO:
+                return ImageServiceOutput(**candidate.model_dump())
+        return None
 
     @exception_handler(SaveException)
-    def save(self, upload_url: str) -> ImageServiceOutput:
-        new_image = Image(original_url=upload_url)
+    def save(
+        self,
+        upload_url: str,
+        content_hash: Optional[str] = None,
+        svg_url: Optional[str] = None,
+        perceptual_hash: Optional[str] = None,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+    ) -> ImageServiceOutput:
+        new_image = Image(
+            original_url=upload_url,
+            content_hash=content_hash,
+            svg_url=svg_url,
+            perceptual_hash=perceptual_hash,
+            width=width,
+            height=height,
+        )
         save_result = self.image_repository.add(new_image)
         return ImageServiceOutput(**save_result.model_dump())
 
+    @exception_handler(SaveException)
+    def save_with_log(
+        self,
+        upload_url: str,
+        status: ImageProcessingType,
+        content_hash: Optional[str] = None,
+        svg_url: Optional[str] = None,
+        perceptual_hash: Optional[str] = None,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+    ) -> ImageServiceOutput:
+        new_image = Image(
+            original_url=upload_url,
+            content_hash=content_hash,
+            svg_url=svg_url,
+            perceptual_hash=perceptual_hash,
+            width=width,
+            height=height,
+        )
+        save_result = self.image_repository.add_with_log(new_image, status)
+        return ImageServiceOutput(**save_result.model_dump(), status=status.value)
+
+    @exception_handler(SaveException)
+    def save_many_with_log(self, payloads: list[SaveImageInput]) -> list[ImageServiceOutput]:
+        new_images = [
+            (
+                Image(
+                    original_url=payload.upload_url,
+                    content_hash=payload.content_hash,
+                    svg_url=payload.svg_url,
+                    perceptual_hash=payload.perceptual_hash,
+                    width=payload.width,
+                    height=payload.height,
+                ),
+                payload.status,
+            )
+            for payload in payloads
+        ]
+        save_results = self.image_repository.add_many_with_log(new_images)
+        return [
+            ImageServiceOutput(**save_result.model_dump(), status=payload.status.value)
+            for save_result, payload in zip(save_results, payloads)
+        ]
+
     @exception_handler(SaveException)
     def save_log(self, payload: SaveLogInput):
         new_log = ProcessingLog(original_id=payload.original_id, status=payload.status.value)
@@ -80,13 +384,85 @@ class ImageService:
             raise ContentsNotFoundException(ErrorType.CONTENTS_NOT_FOUND)
         return ImageServiceOutput(**latest_image.model_dump())
 
+    @exception_handler(ImageServiceException)
+    def get_by_original_urls(self, original_urls: list[str]) -> list[ImageServiceOutput]:
+        images = self.image_repository.get_by_original_urls(original_urls)
+        return [ImageServiceOutput(**image.model_dump()) for image in images]
+
     @exception_handler(ImageServiceException)
     def get_all(self, limit: int, offset: int) -> ImageServicePaginationOutput:
         images = self.image_repository.get_images_with_pagination(limit, offset)
         return ImageServicePaginationOutput(**images.model_dump())
 
     @exception_handler(ImageServiceException)
-    def update(self, image_id: str, svg_url: str) -> ImageServiceOutput:
-        update_data = ImageInput(svg_url=svg_url)
+    def get_page(
+        self, limit: int, cursor: Optional[str] = None, include_total: bool = False
+    ) -> ImageServicePaginationOutput:
+        try:
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError:
+            raise InvalidCursorException(ErrorType.INVALID_CURSOR)
+        images = self.image_repository.get_images_after(limit, after, include_total)
+        return ImageServicePaginationOutput(**images.model_dump())
+
+    @exception_handler(ImageServiceException)
+    def update(
+        self,
+        image_id: str,
+        svg_url: str,
+        svg_size: Optional[int] = None,
+        svg_compression_time: Optional[float] = None,
+    ) -> ImageServiceOutput:
+        update_data = ImageInput(svg_url=svg_url, svg_size=svg_size, svg_compression_time=svg_compression_time)
         updated_image = self.image_repository.update(image_id, update_data)
         return ImageServiceOutput(**updated_image.model_dump())
+
+    @exception_handler(ImageServiceException)
+    def index(self, image_id: UUID4, image: ImageContext) -> ImageServiceOutput:
+        # a preprocessed image joins the near-duplicate index like the ones preprocessed by the api
+        preprocessed = image.preprocessed
+        indexed_image = self.image_repository.index(
+            image_id, image.perceptual_hash, preprocessed.width, preprocessed.height
+        )
+        return ImageServiceOutput(**indexed_image.model_dump())
+
+    @exception_handler(ImageServiceException)
+    def delete_many(self, image_ids: list[UUID4]) -> DeleteImagesOutput:
+        if not image_ids:
+            raise OutOfAllowedCountException(ErrorType.OUT_OF_ALLOWED_MINIMUM_COUNT)
+
+        if len(image_ids) > MAX_ALLOWED_DELETE_IMAGE_COUNT:
+            raise OutOfAllowedCountException(ErrorType.OUT_OF_ALLOWED_DELETE_COUNT)
+
+        deleted = self.image_repository.delete_many_with_log(image_ids)
+        # objects still referenced by a remaining row are kept
+        urls = {url for image in deleted for url in (image.original_url, image.svg_url) if url}
+        unreferenced = urls - self.image_repository.get_referenced_urls(list(urls))
+        storage = get_storage()
+        storage_keys = [storage.get_file_name(env.BUCKET_NAME, url) for url in sorted(unreferenced)]
+        return DeleteImagesOutput(deleted=len(deleted), storage_keys=[key for key in storage_keys if key])
+
+    @exception_handler(SaveException)
+    def complete_many(self, svgs: dict[UUID4, StoredSvgOutput]) -> list[str]:
+        # bulk counterpart of update + save_log(COMPLETED), used by the backfill.
+        # the svgs and their logs are one transaction, the logs' commit covers the update
+        replaced = self.image_repository.get_svg_urls(list(svgs))
+        self.image_repository.update_many(
+            [
+                {'id': image_id, 'svg_url': svg.url, 'svg_size': svg.size, 'svg_compression_time': svg.compression_time}
+                for image_id, svg in svgs.items()
+            ],
+            commit=False,
+        )
+        self.processing_log_repository.add_many([
+            ProcessingLog(original_id=image_id, status=ImageProcessingType.COMPLETED.value) for image_id in svgs
+        ])
+        # the keys of the svgs no row points to anymore
+        unreferenced = replaced - self.image_repository.get_referenced_urls(list(replaced))
+        storage = get_storage()
+        storage_keys = [storage.get_file_name(env.BUCKET_NAME, url) for url in sorted(unreferenced)]
+        return [key for key in storage_keys if key]
+
+    @exception_handler(SaveException)
+    def backfill_current_status(self, batch_size: int = 1000) -> int:
+        return self.image_repository.backfill_current_status(batch_size)
@@ -0,0 +1,165 @@
+import argparse
+import logging
+import os
+import time
+from collections import defaultdict
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Iterator, Optional
+
+from app.config.database import get_db
+from app.config.env import env
+from app.model.image import Image, ProcessingLog
+from app.repository.image import ImageRepository, ProcessingLogRepository
+from app.schema.dao.image import ImageOutput, ProcessingLogOutput
+from app.schema.dto.image import StoredSvgOutput
+from app.service.image import ImageService, store_svg
+from app.util.helper import batched
+from app.util.image_util import process_image
+from app.util.storage import Storage, get_storage
+
+S3_SCHEME = 's3://'
+DEFAULT_BATCH_SIZE = 100
+
+# per process state, set once by _init_worker so every image reuses the same client
+_worker: dict = {}
+
+
+class BackfillSource:
+    """
+    SOURCE is either a local directory, whose relative paths are treated as keys of env.BUCKET_NAME,
+    or s3://bucket/prefix of the configured storage
+    """
+
+    def __init__(self, source: str):
+        if source.startswith(S3_SCHEME):
+            self.bucket_name, _, self.prefix = source[len(S3_SCHEME) :].partition('/')
+            self.directory = None
+        else:
+            self.bucket_name, self.prefix = env.BUCKET_NAME, ''
+            self.directory = Path(source)
+
+    def keys(self, storage: Storage) -> Iterator[str]:
+        if self.directory is None:
+            yield from storage.list_files(self.bucket_name, self.prefix)
+            return
+        for root, _, files in os.walk(self.directory):
+            for file in sorted(files):
+                yield Path(root, file).relative_to(self.directory).as_posix()
+
+    def read(self, storage: Storage, key: str) -> bytes:
+        if self.directory is None:
+            return storage.download_file(self.bucket_name, key)
+        return (self.directory / key).read_bytes()
+
+
+def _init_worker(source: BackfillSource, tolerance: float, min_area: float) -> None:
+    storage = get_storage()
+    storage.create_bucket(env.BUCKET_NAME)
+    _worker.update(source=source, storage=storage, tolerance=tolerance, min_area=min_area)
+
+
+def _convert(key: str) -> tuple[str, Optional[StoredSvgOutput]]:
+    storage: Storage = _worker['storage']
+    try:
+        # the stored original is already preprocessed, it is converted as it is like process_image_task does
+        image_data = _worker['source'].read(storage, key)
+        svg_data = process_image(image_data, _worker['tolerance'], _worker['min_area'])
+        return key, store_svg(storage, svg_data)
+    except Exception as e:
+        logging.error(f'{key}: {e}')
+        return key, None
+
+
+def _read_checkpoint(checkpoint: Optional[Path]) -> set[str]:
+    if checkpoint is None or not checkpoint.exists():
+        return set()
+    return set(checkpoint.read_text().splitlines())
+
+
+def run_backfill(
+    service: ImageService,
+    source: str,
+    checkpoint: Optional[Path] = None,
+    workers: Optional[int] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    tolerance: Optional[float] = None,
+    min_area: Optional[float] = None,
+) -> int:
+    """
+    Convert every image under SOURCE that has an Image row and store the new svg_url of all rows sharing it.
+    Converted keys are appended to the checkpoint file, failed ones are retried on the next run.
+    """
+    backfill_source = BackfillSource(source)
+    tolerance = env.SVG_SIMPLIFY_TOLERANCE if tolerance is None else tolerance
+    min_area = env.SVG_MIN_CONTOUR_AREA if min_area is None else min_area
+    initargs = (backfill_source, tolerance, min_area)
+    done = _read_checkpoint(checkpoint)
+    storage = get_storage()
+
+    # workers=1 runs in this process, which keeps small runs and tests free of the pool start-up
+    pool = Pool(workers, _init_worker, initargs) if workers != 1 else None
+    if pool is None:
+        _init_worker(*initargs)
+    converted, started = 0, time.perf_counter()
+    try:
+        keys = (key for key in backfill_source.keys(storage) if key not in done)
+        for batch in batched(keys, batch_size):
+            urls = {storage.get_url(backfill_source.bucket_name, key): key for key in batch}
+            image_ids = defaultdict(list)
+            for image in service.get_by_original_urls(list(urls)):
+                image_ids[urls[image.original_url]].append(image.id)
+            if not image_ids:
+                continue
+
+            results = pool.imap_unordered(_convert, image_ids) if pool else map(_convert, image_ids)
+            svgs, completed = {}, []
+            for key, svg in results:
+                if svg is None:
+                    continue
+                svgs.update({image_id: svg for image_id in image_ids[key]})
+                completed.append(key)
+
+            replaced = service.complete_many(svgs)
+            # a re-run replaces the svgs of the previous one, their objects go once the rows point to the new ones
+            if replaced:
+                failed = storage.delete_files(env.BUCKET_NAME, replaced)
+                if failed:
+                    logging.error(f'{len(failed)} of {len(replaced)} replaced svgs are not deleted')
+            if checkpoint is not None and completed:
+                with checkpoint.open('a') as f:
+                    f.writelines(f'{key}\n' for key in completed)
+            converted += len(completed)
+            elapsed = time.perf_counter() - started
+            logging.info(f'{converted} images converted, {converted / elapsed:.1f} images/s')
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return converted
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Re-run the svg conversion over stored, already preprocessed images')
+    parser.add_argument('source', help='local directory or s3://bucket/prefix')
+    parser.add_argument('--checkpoint', type=Path, help='file of converted keys, skipped when resuming')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--tolerance', type=float)
+    parser.add_argument('--min-area', type=float)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    db = next(get_db())
+    service = ImageService(
+        ImageRepository(db, Image, ImageOutput),
+        ProcessingLogRepository(db, ProcessingLog, ProcessingLogOutput),
+    )
+    converted = run_backfill(
+        service, args.source, args.checkpoint, args.workers, args.batch_size, args.tolerance, args.min_area
+    )
+    logging.info(f'backfill finished, {converted} images converted')
+
+
+if __name__ == '__main__':
+    main()
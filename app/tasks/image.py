@@ -11,24 +11,41 @@ from app.schema.dao.image import ImageOutput, ProcessingLogOutput
 from app.schema.dto.image import SaveLogInput
 from app.schema.enum.image import ImageProcessingType
 from app.service.image import ImageService
-from app.util.image_util import create_save_path
+from app.util.image_util import ImageContext
+from app.util.storage import get_storage
 
 celery = Celery('tasks', broker=env.MESSAGES_BROKER_URL)
 
 
 @celery.task(ignore_result=True, name='이미지를 svg로 변환하는 작업')
-def process_image_task(original_id: UUID4, image_bytes: bytes):
+def process_image_task(original_id: UUID4, storage_key: str, preprocess: bool = False):
+    # claim check: the message carries the storage key only, the image is fetched here
     image_repo = ImageRepository(next(get_db()), Image, ImageOutput)
     processing_log_repo = ProcessingLogRepository(next(get_db()), ProcessingLog, ProcessingLogOutput)
     service = ImageService(image_repo, processing_log_repo)
 
     try:
         service.save_log(SaveLogInput(original_id=original_id, status=ImageProcessingType.PROCESSING))
+        image_bytes = service.download(storage_key)
+        if preprocess:
+            # uploaded straight to storage, the raw image is preprocessed here and replaces the stored one
+            image = ImageContext(image_bytes)
+            image_bytes = service.preprocess(image)
+            service.upload(storage_key, image_bytes)
+            service.index(original_id, image)
+        # the spooled copy goes once the image is in the storage, a failure before keeps the only copy of an upload
+        service.unspool(storage_key)
         processed_image = service.process(image_bytes)
-        processed_filename = create_save_path('svg')
-        svg_url = service.upload(processed_filename, processed_image)
-        service.update(original_id, svg_url)
+        svg = service.upload_svg(processed_image)
+        service.update(original_id, svg.url, svg.size, svg.compression_time)
         service.save_log(SaveLogInput(original_id=original_id, status=ImageProcessingType.COMPLETED))
     except Exception as e:
         service.save_log(SaveLogInput(original_id=original_id, status=ImageProcessingType.FAILED))
         logging.error(str(e))
+
+
+@celery.task(ignore_result=True, name='저장소의 파일을 삭제하는 작업')
+def delete_files_task(storage_keys: list[str]):
+    failed = get_storage().delete_files(env.BUCKET_NAME, storage_keys)
+    if failed:
+        logging.error(f'{len(failed)} of {len(storage_keys)} files are not deleted')
@@ -0,0 +1,30 @@
+import argparse
+import logging
+from typing import Optional
+
+from app.config.database import get_db
+from app.model.image import Image, ProcessingLog
+from app.repository.image import ImageRepository, ProcessingLogRepository
+from app.schema.dao.image import ImageOutput, ProcessingLogOutput
+from app.service.image import ImageService
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Fill image.current_status from the newest processing log')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    db = next(get_db())
+    service = ImageService(
+        ImageRepository(db, Image, ImageOutput),
+        ProcessingLogRepository(db, ProcessingLog, ProcessingLogOutput),
+    )
+    updated = service.backfill_current_status(args.batch_size)
+    logging.info(f'status backfill finished, {updated} images updated')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import gzip
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config.env import env
+from app.schema.enum.image import StorageBackendType
+from app.util.storage import get_storage
+
+
+class TestFileRouter:
+    @pytest.fixture(autouse=True)
+    def local_storage(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(env, 'STORAGE_BACKEND', StorageBackendType.LOCAL)
+        monkeypatch.setattr(env, 'LOCAL_STORAGE_DIR', str(tmp_path))
+
+    def test_get_file(self, client: TestClient):
+        get_storage().upload_file(env.BUCKET_NAME, 'SVG/20240101/1.svg', b'<svg/>')
+
+        response = client.get(f'/api/v1/files/{env.BUCKET_NAME}/SVG/20240101/1.svg')
+        assert response.status_code == 200
+        assert response.content == b'<svg/>'
+        assert response.headers['content-type'] == 'image/svg+xml'
+
+    def test_get_file_fail_not_found(self, client: TestClient):
+        response = client.get(f'/api/v1/files/{env.BUCKET_NAME}/SVG/missing.svg')
+        assert response.status_code == 404
+
+    def test_get_file_fail_outside_bucket(self, client: TestClient, tmp_path, monkeypatch):
+        monkeypatch.setattr(env, 'LOCAL_STORAGE_DIR', str(tmp_path / 'storage'))
+        (tmp_path / 'secret').mkdir()
+        (tmp_path / 'secret' / 'db.sqlite').write_bytes(b'secret')
+        get_storage().upload_file('other', 'a.svg', b'<svg/>')
+        get_storage().upload_file(env.BUCKET_NAME, 'a.svg', b'<svg/>')
+
+        # 인코딩된 .. 나 다른 버킷으로 저장소 밖의 파일을 내려받을 수 없습니다.
+        for path in [
+            '%2e%2e/secret/db.sqlite',
+            '..%2Fsecret/db.sqlite',
+            f'{env.BUCKET_NAME}/..%2Fsecret/db.sqlite',
+            f'{env.BUCKET_NAME}/%2e%2e/%2e%2e/secret/db.sqlite',
+            'other/a.svg',
+        ]:
+            response = client.get(f'/api/v1/files/{path}')
+            assert response.status_code == 404, path
+        assert client.get(f'/api/v1/files/{env.BUCKET_NAME}/a.svg').status_code == 200
+
+    def test_get_file_fail_s3_backend(self, client: TestClient, monkeypatch):
+        get_storage().upload_file(env.BUCKET_NAME, 'a.svg', b'<svg/>')
+        monkeypatch.setattr(env, 'STORAGE_BACKEND', StorageBackendType.S3)
+
+        response = client.get(f'/api/v1/files/{env.BUCKET_NAME}/a.svg')
+        assert response.status_code == 404
+
+    def test_get_encoded_file(self, client: TestClient):
+        get_storage().upload_file(env.BUCKET_NAME, 'SVG/ab/ab12.svg.gz', gzip.compress(b'<svg/>'))
+
+        response = client.get(f'/api/v1/files/{env.BUCKET_NAME}/SVG/ab/ab12.svg.gz')
+        assert response.headers['content-encoding'] == 'gzip'
+        assert response.headers['content-type'] == 'image/svg+xml'
+        assert response.content == b'<svg/>'
+
+        # gzip을 받지 않는 클라이언트에게는 풀어서 내려줍니다.
+        response = client.get(
+            f'/api/v1/files/{env.BUCKET_NAME}/SVG/ab/ab12.svg.gz', headers={'Accept-Encoding': 'identity'}
+        )
+        assert 'content-encoding' not in response.headers
+        assert response.content == b'<svg/>'
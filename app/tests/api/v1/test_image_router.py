@@ -1,10 +1,22 @@
+import threading
 import uuid
+from io import BytesIO
+from types import SimpleNamespace
 
+import httpx
+import numpy as np
 import pytest
 from fastapi.testclient import TestClient
+from PIL import Image
 
+from app.config.env import env
+from app.exception.image import SaveException, UploadException
 from app.schema.enum.exception import ErrorType
+from app.schema.enum.image import ImageProcessingType, StorageBackendType
+from app.service.image import ImageService
 from app.tests.helper import create_test_image, create_test_text, delete_test_image, delete_test_text
+from app.util.image_util import ImageContext, create_save_path
+from app.util.s3_uploder import S3Uploader
 
 
 class TestImageRouter:
@@ -25,7 +37,24 @@ class TestImageRouter:
             get_response = client.get(f'/api/v1/images/{post_response[0]["id"]}')
 
             assert get_response.status_code == 200
-            assert set(get_response.json().keys()) == {'id', 'original_url', 'svg_url', 'status', 'created_at'}
+            assert set(get_response.json().keys()) == {
+                'id',
+                'original_url',
+                'svg_url',
+                'svg_encoding',
+                'status',
+                'created_at',
+            }
+
+    def test_get_image_svg_encoding(self, client: TestClient, image_service: ImageService):
+        # 저장된 svg의 인코딩은 키의 확장자로 알 수 있습니다.
+        gzip_image = image_service.save('original.png', svg_url='SVG/ab/ab12.svg.gz')
+        plain_image = image_service.save('original.png', svg_url='SVG/20240101/1.svg')
+        ready_image = image_service.save('original.png')
+
+        assert client.get(f'/api/v1/images/{gzip_image.id}').json()['svg_encoding'] == 'gzip'
+        assert client.get(f'/api/v1/images/{plain_image.id}').json()['svg_encoding'] == 'identity'
+        assert client.get(f'/api/v1/images/{ready_image.id}').json()['svg_encoding'] is None
 
     def test_get_image_fail_not_found(self, client: TestClient):
         response = client.get(f'/api/v1/images/{uuid.uuid4()}')
@@ -60,6 +89,27 @@ class TestImageRouter:
             assert page1_response.json()['total'] == 3
             assert len(page3_response.json()['items']) == 0
 
+    def test_get_images_cursor(self, client: TestClient, image_service: ImageService):
+        for index in range(3):
+            image_service.save(f'test{index}.png')
+
+        # 기본 응답은 기존처럼 첫 페이지와 전체 개수이고, next_cursor로 이어서 조회할 수 있습니다.
+        first = client.get('/api/v1/images?limit=2').json()
+        assert first['total'] == 3 and first['page'] == 0
+        assert [item['original_url'] for item in first['items']] == ['test2.png', 'test1.png']
+
+        second = client.get(f'/api/v1/images?limit=2&cursor={first["next_cursor"]}').json()
+        assert second['total'] is None and second['next_cursor'] is None
+        assert [item['original_url'] for item in second['items']] == ['test0.png']
+
+        second = client.get(f'/api/v1/images?limit=2&include_total=true&cursor={first["next_cursor"]}').json()
+        assert second['total'] == 3 and second['page'] is None
+
+    def test_get_images_fail_invalid_cursor(self, client: TestClient):
+        response = client.get('/api/v1/images?cursor=not-a-cursor')
+        assert response.status_code == 400
+        assert response.json()['error_code'] == ErrorType.INVALID_CURSOR.value[0]
+
     def test_post_image(self, client: TestClient):
         with open('app/tests/util/test_image.jpg', 'rb') as f:
             image_data = f.read()
@@ -69,6 +119,164 @@ class TestImageRouter:
             assert response.status_code == 200
             assert set(response.json()[0].keys()) == {'id', 'original_url', 'status'}
 
+    def test_post_image_deduplicated(self, client: TestClient, image_service: ImageService, monkeypatch):
+        with open('app/tests/util/test_image.jpg', 'rb') as f:
+            image_data = f.read()
+            # 같은 이미지가 이미 변환되어 있는 경우
+            converted_image = image_service.save(
+                'original.jpeg', ImageContext(image_data).content_hash, 'converted.svg'
+            )
+            enqueued = []
+            monkeypatch.setattr(
+                'app.api.v1.images.process_image_task.apply_async', lambda *args, **kwargs: enqueued.append(1)
+            )
+            files = [('files', ('test_image.jpg', image_data, 'image/jpeg'))]
+
+            response = client.post('/api/v1/images', files=files)
+            assert response.status_code == 200
+            assert response.json()[0]['id'] != str(converted_image.id)
+            assert response.json()[0]['original_url'] == 'original.jpeg'
+            assert response.json()[0]['status'] == ImageProcessingType.DEDUPLICATED.value
+            assert not enqueued
+
+            get_response = client.get(f'/api/v1/images/{response.json()[0]["id"]}')
+            assert get_response.json()['svg_url'] == 'converted.svg'
+
+    def test_post_image_similar(self, client: TestClient, image_service: ImageService, monkeypatch):
+        pattern = np.random.default_rng(0).integers(0, 256, (6, 8), dtype=np.uint8)
+        image = Image.fromarray(pattern).resize((400, 300), Image.Resampling.BICUBIC)
+        output = BytesIO()
+        image.save(output, 'JPEG', quality=95)
+        image_data = output.getvalue()
+        # 다시 저장된 같은 이미지가 이미 변환되어 있는 경우
+        resaved_image = ImageContext(image_data)
+        image_service.preprocess(resaved_image)
+        preprocessed = resaved_image.preprocessed
+        original_url = image_service.upload(create_save_path('jpeg'), preprocessed.data)
+        image_service.save(
+            original_url, None, 'converted.svg', resaved_image.perceptual_hash, preprocessed.width, preprocessed.height
+        )
+        enqueued = []
+        monkeypatch.setattr(
+            'app.api.v1.images.process_image_task.apply_async', lambda *args, **kwargs: enqueued.append(1)
+        )
+        files = [('files', ('test_image.jpg', image_data, 'image/jpeg'))]
+
+        response = client.post('/api/v1/images', files=files)
+        assert response.status_code == 200
+        assert response.json()[0]['original_url'] != original_url
+        assert response.json()[0]['status'] == ImageProcessingType.DEDUPLICATED.value
+        assert not enqueued
+
+        get_response = client.get(f'/api/v1/images/{response.json()[0]["id"]}')
+        assert get_response.json()['svg_url'] == 'converted.svg'
+
+    def test_post_image_accept_mode(self, client: TestClient, monkeypatch, tmp_path):
+        monkeypatch.setattr(env, 'SPOOL_DIR', str(tmp_path))
+        enqueued = []
+        monkeypatch.setattr(
+            'app.api.v1.images.process_image_task.apply_async', lambda *args, **kwargs: enqueued.append(kwargs)
+        )
+        with open('app/tests/util/test_image.jpg', 'rb') as f:
+            image_data = f.read()
+            files = [('files', ('test_image.jpg', image_data, 'image/jpeg'))]
+
+            response = client.post('/api/v1/images?mode=accept', files=files)
+
+            # 원본을 그대로 스풀에 쓰고 바로 응답하며, 전처리는 작업에서 합니다.
+            assert response.status_code == 202
+            assert response.json()[0]['status'] == ImageProcessingType.RECEIVED.value
+            storage_key = enqueued[0]['args'][1]
+            assert response.json()[0]['original_url'].endswith(storage_key)
+            assert enqueued[0]['kwargs'] == {'preprocess': True}
+            assert (tmp_path / storage_key).read_bytes() == image_data
+
+    def test_post_image_spools_enqueued_only(
+        self, client: TestClient, image_service: ImageService, monkeypatch, tmp_path
+    ):
+        monkeypatch.setattr(env, 'SPOOL_DIR', str(tmp_path))
+        enqueued = []
+        monkeypatch.setattr(
+            'app.api.v1.images.process_image_task.apply_async', lambda *args, **kwargs: enqueued.append(kwargs['args'])
+        )
+        with open('app/tests/util/test_image.jpg', 'rb') as f:
+            files = [('files', ('test_image.jpg', f.read(), 'image/jpeg'))]
+
+            client.post('/api/v1/images', files=files)
+            # 변환 작업이 발행된 이미지만 스풀에 남습니다.
+            assert [path.relative_to(tmp_path).as_posix() for path in tmp_path.rglob('*.jpeg')] == [enqueued[0][1]]
+
+            def save_with_log(*args, **kwargs):
+                raise SaveException('save failed')
+
+            monkeypatch.setattr('app.api.v1.images.ImageService.save_with_log', save_with_log)
+            for mode in ['sync', 'accept']:
+                with pytest.raises(SaveException):
+                    client.post(f'/api/v1/images?mode={mode}', files=files)
+            # 저장에 실패한 이미지는 스풀에 남지 않습니다.
+            assert len(list(tmp_path.rglob('*.jpeg'))) == 1
+
+    def test_post_image_enqueues_storage_key(self, client: TestClient, monkeypatch):
+        enqueued = []
+        monkeypatch.setattr(
+            'app.api.v1.images.process_image_task.apply_async', lambda *args, **kwargs: enqueued.append(kwargs['args'])
+        )
+        with open('app/tests/util/test_image.jpg', 'rb') as f:
+            files = [('files', ('test_image.jpg', f.read(), 'image/jpeg'))]
+
+            response = client.post('/api/v1/images', files=files)
+
+            # 메시지에는 이미지 대신 저장 위치만 담깁니다.
+            original_id, storage_key = enqueued[0]
+            assert str(original_id) == response.json()[0]['id']
+            assert response.json()[0]['original_url'].endswith(storage_key)
+
+    def test_post_images_concurrently(self, client: TestClient, monkeypatch):
+        # 한 요청의 이미지 3개가 동시에 업로드되지 않으면 barrier가 시간 초과로 깨집니다.
+        barrier = threading.Barrier(3, timeout=5)
+        original_upload = ImageService.upload
+        monkeypatch.setattr(
+            'app.api.v1.images.ImageService.upload',
+            lambda service, name, image: barrier.wait() is not None and original_upload(service, name, image),
+        )
+        monkeypatch.setattr('app.api.v1.images.process_image_task.apply_async', lambda *args, **kwargs: None)
+        images = [Image.new('RGB', (200, 200), (index * 100, 0, 0)) for index in range(3)]
+        files = []
+        for index, image in enumerate(images):
+            output = BytesIO()
+            image.save(output, 'PNG')
+            files.append(('files', (f'test_image0{index}.png', output.getvalue(), 'image/png')))
+
+        response = client.post('/api/v1/images', files=files)
+        assert response.status_code == 200
+        assert len({item['id'] for item in response.json()}) == 3
+        assert all(item['original_url'].endswith('.png') for item in response.json())
+
+    def test_post_images_fail_one_of_many(self, client: TestClient, image_service: ImageService, monkeypatch):
+        enqueued = []
+        monkeypatch.setattr(
+            'app.api.v1.images.process_image_task.apply_async', lambda *args, **kwargs: enqueued.append(kwargs)
+        )
+        original_upload = ImageService.upload
+
+        def upload(service, name, image):
+            if Image.open(BytesIO(image)).getpixel((0, 0)) != 0:
+                raise UploadException('upload failed')
+            return original_upload(service, name, image)
+
+        monkeypatch.setattr('app.api.v1.images.ImageService.upload', upload)
+        files = []
+        for index in range(3):
+            output = BytesIO()
+            Image.new('L', (200, 200), index * 100).save(output, 'PNG')
+            files.append(('files', (f'test_image0{index}.png', output.getvalue(), 'image/png')))
+
+        # 하나라도 실패하면 나머지 이미지도 끝난 뒤 실패로 기록되고, 변환 작업은 발행되지 않습니다.
+        with pytest.raises(UploadException):
+            client.post('/api/v1/images', files=files)
+        assert not enqueued
+        assert [image.status for image in image_service.get_page(10).items] == [ImageProcessingType.FAILED.value]
+
     def test_post_image_fail_invalid_image_type(self, client: TestClient):
         # 텍스트 파일을 전송하여 이미지 타입이 아닌 경우를 테스트합니다.
         with open('app/tests/util/test_text.txt', 'rb') as f:
@@ -92,6 +300,17 @@ class TestImageRouter:
             assert response.json()['error_code'] == ErrorType.INVALID_IMAGE_SIZE.value[0]
             assert response.json()['message'] == ErrorType.INVALID_IMAGE_SIZE.value[1]
 
+    def test_post_image_fail_invalid_image_pixels(self, client: TestClient, monkeypatch):
+        monkeypatch.setattr(env, 'MAXIMUM_IMAGE_PIXELS', 1024)
+        with open('app/tests/util/test_image.jpg', 'rb') as f:
+            image_data = f.read()
+            files = [('files', ('test_image.jpg', image_data, 'image/jpeg'))]
+
+            response = client.post('/api/v1/images', files=files)
+            assert response.status_code == 400
+            assert response.json()['error_code'] == ErrorType.INVALID_IMAGE_PIXELS.value[0]
+            assert response.json()['message'] == ErrorType.INVALID_IMAGE_PIXELS.value[1]
+
     def test_post_image_fail_invalid_image_count(self, client: TestClient):
         with open('app/tests/util/test_image.jpg', 'rb') as f:
             image_data = f.read()
@@ -107,3 +326,198 @@ class TestImageRouter:
             assert response.status_code == 400
             assert response.json()['error_code'] == ErrorType.OUT_OF_ALLOWED_MAXIMUM_COUNT.value[0]
             assert response.json()['message'] == ErrorType.OUT_OF_ALLOWED_MAXIMUM_COUNT.value[1]
+
+    def test_presigned_upload(self, client: TestClient, monkeypatch):
+        enqueued = []
+        monkeypatch.setattr(
+            'app.api.v1.images.process_image_task.apply_async', lambda *args, **kwargs: enqueued.append(kwargs)
+        )
+        # 1. 업로드 주소를 발급받고, 2. 스토리지에 직접 올린 뒤, 3. 완료를 알립니다.
+        uploads = client.post('/api/v1/images/uploads', json={'extensions': ['jpg']})
+        assert uploads.status_code == 200
+        upload = uploads.json()[0]
+        assert upload['key'].startswith('JPEG/') and upload['key'].endswith('.jpeg')
+
+        with open('app/tests/util/test_image.jpg', 'rb') as f:
+            assert httpx.put(upload['url'], content=f.read()).status_code == 200
+
+        response = client.post('/api/v1/images/uploads/complete', json={'keys': [upload['key']]})
+        assert response.status_code == 200
+        assert response.json()[0]['status'] == ImageProcessingType.READY.value
+        assert response.json()[0]['original_url'].endswith(upload['key'])
+        assert enqueued[0]['args'][1] == upload['key']
+        assert enqueued[0]['kwargs'] == {'preprocess': True}
+
+        # 완료를 다시 알려도 같은 이미지가 반환됩니다.
+        repeated = client.post('/api/v1/images/uploads/complete', json={'keys': [upload['key']]})
+        assert repeated.json()[0]['id'] == response.json()[0]['id']
+        assert len(enqueued) == 1
+
+    def test_presigned_upload_fail_invalid_type(self, client: TestClient):
+        response = client.post('/api/v1/images/uploads', json={'extensions': ['gif']})
+        assert response.status_code == 400
+        assert response.json()['error_code'] == ErrorType.INVALID_IMAGE_TYPE.value[0]
+
+        # 확장자와 다른 내용이 올라온 경우
+        upload = client.post('/api/v1/images/uploads', json={'extensions': ['png']}).json()[0]
+        with open('app/tests/util/test_image.jpg', 'rb') as f:
+            httpx.put(upload['url'], content=f.read())
+        response = client.post('/api/v1/images/uploads/complete', json={'keys': [upload['key']]})
+        assert response.status_code == 400
+        assert response.json()['error_code'] == ErrorType.INVALID_IMAGE_TYPE.value[0]
+        # 거부된 객체는 버킷에서 지워집니다.
+        assert S3Uploader().get_file_size(env.BUCKET_NAME, upload['key']) is None
+
+    def test_presigned_upload_fail_invalid_size(self, client: TestClient, monkeypatch):
+        monkeypatch.setattr('app.service.image.MAXIMUM_IMAGE_SIZE', 1024)
+        upload = client.post('/api/v1/images/uploads', json={'extensions': ['jpeg']}).json()[0]
+        with open('app/tests/util/test_image.jpg', 'rb') as f:
+            httpx.put(upload['url'], content=f.read())
+
+        response = client.post('/api/v1/images/uploads/complete', json={'keys': [upload['key']]})
+        assert response.status_code == 400
+        assert response.json()['error_code'] == ErrorType.INVALID_IMAGE_SIZE.value[0]
+        assert S3Uploader().get_file_size(env.BUCKET_NAME, upload['key']) is None
+
+    def test_presigned_upload_fail_enqueue(self, client: TestClient, image_service: ImageService, monkeypatch):
+        def apply_async(*args, **kwargs):
+            raise ConnectionError('broker is down')
+
+        monkeypatch.setattr('app.api.v1.images.process_image_task.apply_async', apply_async)
+        upload = client.post('/api/v1/images/uploads', json={'extensions': ['jpeg']}).json()[0]
+        with open('app/tests/util/test_image.jpg', 'rb') as f:
+            httpx.put(upload['url'], content=f.read())
+
+        # 발행에 실패한 이미지는 READY로 남지 않고 실패로 기록됩니다.
+        with pytest.raises(ConnectionError):
+            client.post('/api/v1/images/uploads/complete', json={'keys': [upload['key']]})
+        assert [image.status for image in image_service.get_page(10).items] == [ImageProcessingType.FAILED.value]
+
+    def test_presigned_upload_timestamped_key(self, client: TestClient, image_service: ImageService, monkeypatch):
+        monkeypatch.setattr('app.api.v1.images.process_image_task.apply_async', lambda *args, **kwargs: None)
+        # 샤딩 이전 형식의 키도 그대로 완료됩니다.
+        key = 'JPEG/20240101/20240101123456-12345-123-1.jpeg'
+        with open('app/tests/util/test_image.jpg', 'rb') as f:
+            image_service.upload(key, f.read())
+
+        response = client.post('/api/v1/images/uploads/complete', json={'keys': [key]})
+        assert response.status_code == 200
+        assert response.json()[0]['original_url'].endswith(key)
+
+    def test_presigned_upload_fail_not_uploaded(self, client: TestClient):
+        upload = client.post('/api/v1/images/uploads', json={'extensions': ['png']}).json()[0]
+
+        for key in [upload['key'], 'other/bucket/key.png']:
+            response = client.post('/api/v1/images/uploads/complete', json={'keys': [key]})
+            assert response.status_code == 404
+
+    def test_presigned_upload_fail_local_storage(self, client: TestClient, monkeypatch, tmp_path):
+        monkeypatch.setattr(env, 'STORAGE_BACKEND', StorageBackendType.LOCAL)
+        monkeypatch.setattr(env, 'LOCAL_STORAGE_DIR', str(tmp_path))
+
+        response = client.post('/api/v1/images/uploads', json={'extensions': ['png']})
+        assert response.status_code == 400
+        assert response.json()['error_code'] == ErrorType.PRESIGNED_UPLOAD_NOT_SUPPORTED.value[0]
+
+    def test_post_bulk_images(self, client: TestClient, image_service: ImageService, monkeypatch):
+        published = []
+        monkeypatch.setattr(
+            'app.api.v1.images.group',
+            lambda signatures: SimpleNamespace(apply_async=lambda: published.append(list(signatures))),
+        )
+        files = []
+        for index in range(10):
+            output = BytesIO()
+            Image.new('RGB', (200, 200), (index * 20, 0, 0)).save(output, 'PNG')
+            files.append(('files', (f'test_image{index}.png', output.getvalue(), 'image/png')))
+        # 첫 번째 이미지는 이미 변환되어 있습니다.
+        image_service.save('original.png', ImageContext(files[0][1][1]).content_hash, 'converted.svg')
+
+        response = client.post('/api/v1/images/bulk', files=files)
+        assert response.status_code == 200
+        assert [item['status'] for item in response.json()] == [ImageProcessingType.DEDUPLICATED.value] + [
+            ImageProcessingType.READY.value
+        ] * 9
+        assert response.json()[0]['original_url'] == 'original.png'
+        # 변환 작업은 한 번에 묶어서 발행됩니다.
+        assert len(published) == 1
+        assert [signature.args[0] for signature in published[0]] == [
+            uuid.UUID(item['id']) for item in response.json()[1:]
+        ]
+        assert all(
+            response.json()[1 + index]['original_url'].endswith(signature.args[1])
+            for index, signature in enumerate(published[0])
+        )
+
+    def test_post_bulk_images_fail_one_upload(self, client: TestClient, image_service: ImageService, monkeypatch):
+        original_upload = ImageService.upload
+
+        def upload(service, name, image):
+            if Image.open(BytesIO(image)).getpixel((0, 0)) != 0:
+                raise UploadException('upload failed')
+            return original_upload(service, name, image)
+
+        monkeypatch.setattr('app.api.v1.images.ImageService.upload', upload)
+        discarded = []
+        monkeypatch.setattr('app.api.v1.images.ImageService.discard', lambda service, names: discarded.extend(names))
+        files = []
+        for index in range(3):
+            output = BytesIO()
+            Image.new('L', (200, 200), index * 100).save(output, 'PNG')
+            files.append(('files', (f'test_image0{index}.png', output.getvalue(), 'image/png')))
+
+        # 업로드가 하나라도 실패하면 먼저 올라간 원본도 지우고, 이미지는 저장하지 않습니다.
+        with pytest.raises(UploadException):
+            client.post('/api/v1/images/bulk', files=files)
+        assert len(discarded) == 1
+        assert image_service.get_page(10).items == []
+
+    def test_post_bulk_images_fail_enqueue(self, client: TestClient, image_service: ImageService, monkeypatch):
+        def apply_async():
+            raise ConnectionError('broker is down')
+
+        monkeypatch.setattr('app.api.v1.images.group', lambda signatures: SimpleNamespace(apply_async=apply_async))
+        files = []
+        for index in range(2):
+            output = BytesIO()
+            Image.new('L', (200, 200), index * 100).save(output, 'PNG')
+            files.append(('files', (f'test_image0{index}.png', output.getvalue(), 'image/png')))
+
+        # 발행에 실패한 이미지는 READY로 남지 않고 실패로 기록됩니다.
+        with pytest.raises(ConnectionError):
+            client.post('/api/v1/images/bulk', files=files)
+        statuses = [image.status for image in image_service.get_page(10).items]
+        assert statuses == [ImageProcessingType.FAILED.value] * 2
+
+    def test_post_bulk_images_fail_invalid_image_count(self, client: TestClient):
+        files = [('files', (f'test_image{index}.png', b'', 'image/png')) for index in range(101)]
+
+        response = client.post('/api/v1/images/bulk', files=files)
+        assert response.status_code == 400
+        assert response.json()['error_code'] == ErrorType.OUT_OF_ALLOWED_BULK_COUNT.value[0]
+
+    def test_delete_images(self, client: TestClient, image_service: ImageService, monkeypatch):
+        published = []
+        monkeypatch.setattr('app.api.v1.images.DELETE_BATCH_SIZE', 1)
+        monkeypatch.setattr(
+            'app.api.v1.images.group',
+            lambda signatures: SimpleNamespace(apply_async=lambda: published.append(list(signatures))),
+        )
+        urls = [image_service.upload(f'delete/{index}.png', b'test') for index in range(3)]
+        images = [image_service.save(url) for url in urls]
+        # 중복 제거된 이미지가 원본을 공유하면 파일은 남겨둡니다.
+        shared = image_service.save(urls[0])
+
+        response = client.post('/api/v1/images/delete', json={'ids': [str(image.id) for image in images]})
+        assert response.status_code == 200
+        assert response.json() == {'deleted': 3}
+        assert image_service.get(shared.id).original_url == urls[0]
+        assert len(published) == 1
+        assert [signature.args[0] for signature in published[0]] == [['delete/1.png'], ['delete/2.png']]
+
+    def test_delete_images_fail_invalid_count(self, client: TestClient, monkeypatch):
+        monkeypatch.setattr('app.service.image.MAX_ALLOWED_DELETE_IMAGE_COUNT', 2)
+
+        response = client.post('/api/v1/images/delete', json={'ids': [str(uuid.uuid4()) for _ in range(3)]})
+        assert response.status_code == 400
+        assert response.json()['error_code'] == ErrorType.OUT_OF_ALLOWED_DELETE_COUNT.value[0]
@@ -0,0 +1,17 @@
+import pytest
+from pydantic import ValidationError
+
+from app.config.env import EnvironmentContainer
+from app.schema.enum.image import SvgEncodingType
+
+
+class TestEnvironment:
+    def test_svg_encoding(self):
+        assert EnvironmentContainer(SVG_ENCODING='gzip').SVG_ENCODING == SvgEncodingType.GZIP
+
+    def test_svg_encoding_fail_without_brotli(self, monkeypatch):
+        monkeypatch.setattr('app.config.env.find_spec', lambda name: None)
+
+        # brotli 패키지 없이 br 압축을 설정하면 시작할 때 실패합니다.
+        with pytest.raises(ValidationError):
+            EnvironmentContainer(SVG_ENCODING='br')
@@ -1,7 +1,15 @@
-from app.model.image import Image, ProcessingLog
+import uuid
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from app.model.image import Image, ImagePerceptualHash, ProcessingLog
 from app.repository.image import ImageRepository, ProcessingLogRepository
 from app.schema.dao.image import ImageInput, ProcessingLogInput
 from app.schema.enum.image import ImageProcessingType
+from app.util.helper import decode_cursor
 
 
 class TestRepository:
@@ -35,6 +43,58 @@ class TestRepository:
         assert retrieved_processing_log.id == created_processing_log.id
         assert retrieved_processing_log.status == 'processing'
 
+    def test_create_image_with_log(self, image_repository: ImageRepository):
+        commits, statements = [], []
+        event.listen(image_repository.session, 'after_commit', lambda session: commits.append(1))
+        event.listen(
+            image_repository.session.get_bind(),
+            'before_cursor_execute',
+            lambda connection, cursor, statement, *args: statements.append(statement),
+        )
+
+        created_image = image_repository.add_with_log(
+            Image(original_url='test', perceptual_hash='0123456789abcdef'), ImageProcessingType.READY
+        )
+
+        # 이미지, 로그, 해시 색인을 한 번의 커밋으로 저장하고 다시 조회하지 않습니다.
+        assert len(commits) == 1
+        assert not [statement for statement in statements if statement.lstrip().upper().startswith('SELECT')]
+        assert created_image.processing_log[0].status == ImageProcessingType.READY
+        assert image_repository.get_latest_image(created_image.id).status == ImageProcessingType.READY
+
+    def test_create_image_with_log_rollback(self, image_repository: ImageRepository):
+        with pytest.raises(IntegrityError):
+            image_repository.add_with_log(Image(original_url=None), ImageProcessingType.READY)
+
+        # 실패하면 이미지도 로그도 남지 않고, 세션은 계속 사용할 수 있습니다.
+        assert image_repository.get_all() == []
+        assert image_repository.session.query(ProcessingLog).count() == 0
+        assert image_repository.add_with_log(Image(original_url='test'), ImageProcessingType.READY).id is not None
+
+    def test_create_images_with_log(self, image_repository: ImageRepository):
+        created_images = image_repository.add_many_with_log([
+            (Image(original_url='test', perceptual_hash='0123456789abcdef'), ImageProcessingType.READY),
+            (Image(original_url='test2', svg_url='test2.svg'), ImageProcessingType.DEDUPLICATED),
+        ])
+
+        assert [image_repository.get_latest_image(image.id).status for image in created_images] == [
+            ImageProcessingType.READY,
+            ImageProcessingType.DEDUPLICATED,
+        ]
+        assert image_repository.session.query(ImagePerceptualHash).count() == 1
+
+    def test_get_completed_images_by_content_hashes(self, image_repository: ImageRepository):
+        image_repository.add(Image(original_url='old', svg_url='old.svg', content_hash='a'))
+        image_repository.add_many([
+            Image(original_url='new', svg_url='new.svg', content_hash='a'),
+            Image(original_url='ready', content_hash='b'),
+        ])
+
+        duplicates = image_repository.get_completed_by_content_hashes(['a', 'b', 'c'])
+
+        assert list(duplicates) == ['a']
+        assert duplicates['a'].original_url == 'new'
+
     def test_get_images(self, image_repository: ImageRepository):
         new_image01 = Image(original_url='test')
         new_image02 = Image(original_url='test2')
@@ -47,6 +107,30 @@ class TestRepository:
         assert created_images[0].original_url == 'test'
         assert created_images[1].original_url == 'test2'
 
+    def test_create_images(self, image_repository: ImageRepository):
+        created_images = image_repository.add_many([Image(original_url='test'), Image(original_url='test2')])
+
+        assert [image.original_url for image in created_images] == ['test', 'test2']
+        assert all(image.id is not None for image in created_images)
+        assert len(image_repository.get_all()) == 2
+
+    def test_get_images_by_original_urls(self, image_repository: ImageRepository):
+        image_repository.add_many([Image(original_url='test'), Image(original_url='test'), Image(original_url='test2')])
+
+        images = image_repository.get_by_original_urls(['test', 'test3'])
+
+        assert len(images) == 2
+        assert all(image.original_url == 'test' for image in images)
+
+    def test_update_images(self, image_repository: ImageRepository):
+        created_images = image_repository.add_many([Image(original_url='test'), Image(original_url='test2')])
+
+        image_repository.update_many([
+            {'id': image.id, 'svg_url': f'{image.original_url}.svg'} for image in created_images
+        ])
+
+        assert [image_repository.get(image.id).svg_url for image in created_images] == ['test.svg', 'test2.svg']
+
     def test_update_image(self, image_repository: ImageRepository):
         new_image = Image(original_url='test')
         created_image = image_repository.add(new_image)
@@ -119,6 +203,27 @@ class TestRepository:
         assert image_repository.get(created_image.id) is None
         assert processing_log_repository.get(created_processing_log.id) is None
 
+    def test_delete_images_with_log(
+        self, image_repository: ImageRepository, processing_log_repository: ProcessingLogRepository
+    ):
+        created_images = image_repository.add_many_with_log([
+            (Image(original_url=f'test{index}', perceptual_hash='0f0f0f0f0f0f0f0f'), ImageProcessingType.READY)
+            for index in range(3)
+        ])
+
+        deleted = image_repository.delete_many_with_log([created_images[0].id, created_images[1].id, uuid.uuid4()])
+
+        assert sorted(image.original_url for image in deleted) == ['test0', 'test1']
+        assert image_repository.get(created_images[0].id) is None
+        assert image_repository.get(created_images[2].id) is not None
+        assert [log.original_id for log in processing_log_repository.get_all()] == [created_images[2].id]
+        assert image_repository.session.query(ImagePerceptualHash).count() == 1
+
+    def test_get_referenced_urls(self, image_repository: ImageRepository):
+        image_repository.add(Image(original_url='original', svg_url='converted'))
+
+        assert image_repository.get_referenced_urls(['original', 'converted', 'other']) == {'original', 'converted'}
+
     def test_get_image_with_processing_log(
         self,
         image_repository: ImageRepository,
@@ -172,6 +277,71 @@ class TestRepository:
         assert latest_image.created_at is not None
         assert latest_image.updated_at is not None
 
+    def test_get_completed_by_content_hash(self, image_repository: ImageRepository):
+        image_repository.add(Image(original_url='test', content_hash='a' * 64))
+        image_repository.add(Image(original_url='test2', svg_url='test2.svg', content_hash='a' * 64))
+        image_repository.add(Image(original_url='test3', svg_url='test3.svg', content_hash='b' * 64))
+
+        # svg가 있는 이미지만 재사용 대상입니다.
+        completed_image = image_repository.get_completed_by_content_hash('a' * 64)
+
+        assert completed_image.original_url == 'test2'
+        assert completed_image.svg_url == 'test2.svg'
+        assert image_repository.get_completed_by_content_hash('c' * 64) is None
+
+    def test_create_image_indexes_perceptual_hash(self, image_repository: ImageRepository):
+        created_image = image_repository.add(Image(original_url='test', perceptual_hash='0123456789abcdef'))
+
+        perceptual_hash_index = image_repository.session.get(ImagePerceptualHash, created_image.id)
+
+        assert created_image.perceptual_hash == '0123456789abcdef'
+        assert [perceptual_hash_index.band_0, perceptual_hash_index.band_1] == [0x0123, 0x4567]
+        assert [perceptual_hash_index.band_2, perceptual_hash_index.band_3] == [0x89AB, 0xCDEF]
+
+    def test_index_image(self, image_repository: ImageRepository):
+        created_image = image_repository.add(Image(original_url='test'))
+
+        indexed_image = image_repository.index(created_image.id, '0123456789abcdef', 200, 150)
+
+        assert (indexed_image.perceptual_hash, indexed_image.width, indexed_image.height) == (
+            '0123456789abcdef',
+            200,
+            150,
+        )
+        assert image_repository.session.get(ImagePerceptualHash, created_image.id).band_0 == 0x0123
+        assert image_repository.index(uuid.uuid4(), '0123456789abcdef', 200, 150) is None
+
+    def test_get_completed_by_perceptual_hash(self, image_repository: ImageRepository):
+        size = {'width': 200, 'height': 150}
+        image_repository.add(Image(original_url='pending', perceptual_hash='ffffffffffffffff', **size))
+        image_repository.add(Image(original_url='near', svg_url='near.svg', perceptual_hash='0123456789abcdef', **size))
+        image_repository.add(Image(original_url='far', svg_url='far.svg', perceptual_hash='fedcba9876543210', **size))
+        image_repository.add(
+            Image(original_url='wide', svg_url='wide.svg', perceptual_hash='0123456789abcdef', width=1000, height=150)
+        )
+
+        # 3비트 차이는 찾고, 4비트 차이는 찾지 않습니다.
+        similar_images = image_repository.get_completed_by_perceptual_hash('0123456789abcde8', 200, 150, 3)
+        assert [image.original_url for image in similar_images] == ['near']
+        assert image_repository.get_completed_by_perceptual_hash('0123456789abcd10', 200, 150, 3) == []
+        # svg가 없는 이미지는 제외됩니다.
+        assert image_repository.get_completed_by_perceptual_hash('ffffffffffffffff', 200, 150, 3) == []
+        # 크기가 다른 이미지는 제외됩니다.
+        wide_images = image_repository.get_completed_by_perceptual_hash('0123456789abcdef', 1000, 150, 3)
+        assert [image.original_url for image in wide_images] == ['wide']
+
+    def test_get_completed_by_perceptual_hash_limit(self, image_repository: ImageRepository):
+        size = {'width': 200, 'height': 150}
+        for index, perceptual_hash in enumerate(['0123456789abcdef', '0123456789abcdee', '0123456789abcdec']):
+            image_repository.add(
+                Image(original_url=f'{index}', svg_url='a.svg', perceptual_hash=perceptual_hash, **size)
+            )
+        image_repository.add(Image(original_url='0', svg_url='a.svg', perceptual_hash='0123456789abcdef', **size))
+
+        # 원본을 공유하는 행은 한 번만, 가까운 순서로 limit개까지 반환됩니다.
+        similar_images = image_repository.get_completed_by_perceptual_hash('0123456789abcdef', 200, 150, 3, 2)
+        assert [image.original_url for image in similar_images] == ['0', '1']
+
     def test_pagination(self, image_repository: ImageRepository):
         new_image01 = Image(original_url='test')
         new_image02 = Image(original_url='test2')
@@ -184,9 +354,81 @@ class TestRepository:
         assert created_images.page == 0
         assert created_images.limit == 1
         assert created_images.items[0].original_url == 'test2'
+        # 다음 페이지는 커서로도 이어서 조회할 수 있습니다.
+        next_images = image_repository.get_images_after(limit=1, after=decode_cursor(created_images.next_cursor))
+        assert next_images.items[0].original_url == 'test'
 
         created_images = image_repository.get_images_with_pagination(limit=1, offset=1)
         assert created_images.total == 2
         assert created_images.page == 1
         assert created_images.limit == 1
         assert created_images.items[0].original_url == 'test'
+        assert created_images.next_cursor is None
+
+    def test_cursor_pagination(
+        self, image_repository: ImageRepository, processing_log_repository: ProcessingLogRepository
+    ):
+        # 같은 시각에 만들어진 이미지도 id 순으로 빠짐없이 한 번씩 조회됩니다.
+        created_at = datetime(2024, 1, 1)
+        created_images = image_repository.add_many_with_log([
+            (Image(original_url=f'test{index}', created_at=created_at), ImageProcessingType.READY) for index in range(5)
+        ])
+        image_repository.add_many_with_log([(Image(original_url='newest'), ImageProcessingType.READY)])
+        processing_log_repository.add(ProcessingLog(original_id=created_images[0].id, status='completed'))
+
+        pages, after = [], None
+        while True:
+            page = image_repository.get_images_after(limit=2, after=after)
+            pages.append(page)
+            if page.next_cursor is None:
+                break
+            after = decode_cursor(page.next_cursor)
+
+        items = [item for page in pages for item in page.items]
+        assert [len(page.items) for page in pages] == [2, 2, 2]
+        assert items[0].original_url == 'newest'
+        assert [item.id for item in items[1:]] == sorted([image.id for image in created_images], reverse=True)
+        assert {item.id: item.status for item in items}[created_images[0].id] == ImageProcessingType.COMPLETED
+        assert pages[0].total is None
+        assert image_repository.get_images_after(limit=2, include_total=True).total == 6
+
+    def test_current_status_with_log(self, image_repository: ImageRepository):
+        created_image = image_repository.add_with_log(Image(original_url='test'), ImageProcessingType.READY)
+
+        image = image_repository.get(created_image.id)
+        assert image.current_status == ImageProcessingType.READY
+        assert image.status_updated_at is not None
+
+    def test_current_status_follows_log(
+        self, image_repository: ImageRepository, processing_log_repository: ProcessingLogRepository
+    ):
+        created_image = image_repository.add_with_log(Image(original_url='test'), ImageProcessingType.READY)
+        processing_log_repository.add(ProcessingLog(original_id=created_image.id, status='processing'))
+        # 먼저 만들어진 로그가 늦게 저장되어도 최신 상태를 덮어쓰지 않습니다.
+        processing_log_repository.add(
+            ProcessingLog(original_id=created_image.id, status='failed', created_at=datetime(2024, 1, 1))
+        )
+
+        assert image_repository.get(created_image.id).current_status == ImageProcessingType.PROCESSING
+        assert image_repository.get_latest_image(created_image.id).status == ImageProcessingType.PROCESSING
+
+    def test_create_processing_logs_empty(self, processing_log_repository: ProcessingLogRepository):
+        assert processing_log_repository.add_many([]) == []
+
+    def test_backfill_current_status(
+        self, image_repository: ImageRepository, processing_log_repository: ProcessingLogRepository
+    ):
+        created_images = image_repository.add_many([Image(original_url=f'test{index}') for index in range(3)])
+        # current_status 컬럼이 생기기 전에 저장된 로그처럼 image 행을 거치지 않고 넣습니다.
+        image_repository.session.add_all([
+            ProcessingLog(original_id=created_images[0].id, status='ready', created_at=datetime(2024, 1, 1)),
+            ProcessingLog(original_id=created_images[0].id, status='completed', created_at=datetime(2024, 1, 2)),
+            ProcessingLog(original_id=created_images[1].id, status='failed', created_at=datetime(2024, 1, 1)),
+        ])
+        image_repository.session.commit()
+
+        assert image_repository.backfill_current_status(batch_size=1) == 2
+        assert image_repository.backfill_current_status() == 0
+        images = [image_repository.get(image.id) for image in created_images]
+        assert [image.current_status for image in images] == ['completed', 'failed', None]
+        assert images[0].status_updated_at == datetime(2024, 1, 2)
@@ -1,9 +1,15 @@
+import hashlib
 import uuid
+from io import BytesIO
 
+import numpy as np
 import pytest
+from PIL import Image, ImageDraw
 
+from app.config.env import env
 from app.exception.image import (
     ContentsNotFoundException,
+    DownloadException,
     NotSupportedTypeException,
     OutOfAllowedCountException,
     OutOfAllowedSizeException,
@@ -12,8 +18,9 @@ from app.exception.image import (
     SaveException,
     UploadException,
 )
-from app.schema.dto.image import ImageServiceOutput, SaveLogInput
-from app.schema.enum.image import ImageProcessingType
+from app.schema.dto.image import ImageServiceOutput, SaveLogInput, StoredSvgOutput
+from app.schema.enum.exception import ErrorType
+from app.schema.enum.image import ImageProcessingType, StorageBackendType
 from app.service.image import ImageService
 from app.tests.helper import (
     create_test_image,
@@ -22,7 +29,8 @@ from app.tests.helper import (
     delete_test_image,
     delete_test_text,
 )
-from app.util.image_util import create_save_path, get_image_format
+from app.util.image_util import ImageContext, create_save_path, get_image_format
+from app.util.s3_uploder import S3Uploader
 
 
 class TestImageService:
@@ -46,6 +54,15 @@ class TestImageService:
             payload = [bytes_image]
             assert image_service.validate(payload)
 
+    def test_check_image_returns_context(self, image_service: ImageService):
+        with open('app/tests/util/test_image.png', 'rb') as f:
+            bytes_image = f.read()
+            contexts = image_service.validate([bytes_image])
+
+            assert len(contexts) == 1
+            assert contexts[0].data == bytes_image
+            assert contexts[0].extension == 'png'
+
     def test_check_image_type_fail(self, image_service: ImageService):
         with open('app/tests/util/test_text.txt', 'rb') as f:
             bytes_image = f.read()
@@ -67,6 +84,23 @@ class TestImageService:
             with pytest.raises(OutOfAllowedSizeException):
                 image_service.validate(payload)
 
+    def test_check_image_pixels_fail(self, image_service: ImageService, monkeypatch):
+        monkeypatch.setattr(env, 'MAXIMUM_IMAGE_PIXELS', 1024)
+        with open('app/tests/util/test_image.jpg', 'rb') as f:
+            bytes_image = f.read()
+            payload = [bytes_image]
+            with pytest.raises(OutOfAllowedSizeException) as e:
+                image_service.validate(payload)
+            assert e.value.error_code == ErrorType.INVALID_IMAGE_PIXELS.value[0]
+
+    def test_check_image_pixels_fail_without_decoding(self, image_service: ImageService):
+        # 20000 x 20000 PNG 헤더만 있는 압축 폭탄은 디코딩 없이 거절됩니다.
+        ihdr = (20000).to_bytes(4, 'big') * 2 + bytes([8, 2, 0, 0, 0])
+        payload = [b'\x89PNG\r\n\x1a\n' + len(ihdr).to_bytes(4, 'big') + b'IHDR' + ihdr + b'\x00' * 4]
+        with pytest.raises(OutOfAllowedSizeException) as e:
+            image_service.validate(payload)
+        assert e.value.error_code == ErrorType.INVALID_IMAGE_PIXELS.value[0]
+
     def test_check_image_count_success(self, image_service: ImageService):
         with open('app/tests/util/test_image.jpg', 'rb') as f:
             bytes_image = f.read()
@@ -85,6 +119,36 @@ class TestImageService:
         with pytest.raises(OutOfAllowedCountException):
             image_service.validate(payload)
 
+    def test_receive_image_stream(self, image_service: ImageService):
+        with open('app/tests/util/test_image.png', 'rb') as f:
+            bytes_image = f.read()
+            contexts = image_service.receive([BytesIO(bytes_image)])
+
+            assert contexts[0].data == bytes_image
+            assert contexts[0].content_hash == hashlib.sha256(bytes_image).hexdigest()
+
+    def test_receive_image_stream_size_fail_early(self, image_service: ImageService, monkeypatch):
+        monkeypatch.setattr('app.service.image.MAXIMUM_IMAGE_SIZE', 1024)
+        monkeypatch.setattr('app.service.image.UPLOAD_CHUNK_SIZE', 512)
+        stream = BytesIO(b'\x89PNG\r\n\x1a\n' + b'\x00' * 1024 * 1024)
+        with pytest.raises(OutOfAllowedSizeException) as e:
+            image_service.receive([stream])
+        # 크기 제한을 넘은 청크에서 읽기를 멈춥니다.
+        assert e.value.error_code == ErrorType.INVALID_IMAGE_SIZE.value[0]
+        assert stream.tell() == 1536
+
+    def test_receive_image_stream_type_fail_on_first_chunk(self, image_service: ImageService):
+        stream = BytesIO(b'GIF89a' + b'\x00' * 1024 * 1024)
+        with pytest.raises(NotSupportedTypeException):
+            image_service.receive([stream])
+        assert stream.tell() <= 1024 * 64
+
+    def test_receive_image_stream_count_fail(self, image_service: ImageService):
+        streams = [BytesIO(b'') for _ in range(4)]
+        with pytest.raises(OutOfAllowedCountException):
+            image_service.receive(streams)
+        assert all(stream.tell() == 0 for stream in streams)
+
     def test_image_service_preprocessing_success(self, image_service: ImageService):
         with open('app/tests/util/test_image.jpg', 'rb') as f:
             bytes_image = f.read()
@@ -170,6 +234,70 @@ class TestImageService:
                 # 함수 중간에서 억지로 예외를 발생시키기 위해 file_name을 None으로 설정
                 image_service.upload(payload)
 
+    def test_image_service_download_from_s3(self, image_service: ImageService):
+        with open('app/tests/util/test_image.png', 'rb') as f:
+            bytes_image = f.read()
+            file_name = create_save_path('png')
+            image_service.upload(file_name, bytes_image)
+
+            assert image_service.download(file_name) == bytes_image
+
+    def test_image_service_download_small_object_with_single_get(self, image_service: ImageService, monkeypatch):
+        file_name = create_save_path('png')
+        image_service.upload(file_name, b'small')
+        monkeypatch.setattr(env, 'S3_MULTIPART_THRESHOLD', 1024)
+        calls = []
+        monkeypatch.setattr(S3Uploader, 'download_stream', lambda *args: calls.append(args))
+
+        # 크기를 모르거나 임계값보다 작은 객체는 GetObject 한 번으로 받습니다.
+        assert image_service.download(file_name) == b'small'
+        assert image_service.download(file_name, size=5) == b'small'
+        assert calls == []
+
+    def test_image_service_download_large_object_as_stream(self, image_service: ImageService, monkeypatch):
+        file_name = create_save_path('png')
+        image_service.upload(file_name, b'large')
+        monkeypatch.setattr(env, 'S3_MULTIPART_THRESHOLD', 4)
+
+        assert image_service.download(file_name, size=5) == b'large'
+
+    def test_image_service_download_from_spool(self, image_service: ImageService, monkeypatch, tmp_path):
+        monkeypatch.setattr(env, 'SPOOL_DIR', str(tmp_path))
+        file_name = create_save_path('png')
+
+        image_service.spool(file_name, b'spooled')
+
+        # 공유 볼륨에 있는 이미지는 s3를 거치지 않고 읽히며, unspool 전까지 남아 있습니다.
+        assert image_service.download(file_name) == b'spooled'
+        assert (tmp_path / file_name).exists()
+        image_service.unspool(file_name)
+        assert not (tmp_path / file_name).exists()
+
+    def test_image_service_download_from_local_storage(self, image_service: ImageService, monkeypatch, tmp_path):
+        monkeypatch.setattr(env, 'STORAGE_BACKEND', StorageBackendType.LOCAL)
+        monkeypatch.setattr(env, 'LOCAL_STORAGE_DIR', str(tmp_path))
+        file_name = create_save_path('png')
+
+        url = image_service.upload(file_name, b'stored')
+
+        assert url == f'{env.LOCAL_STORAGE_URL}/{env.BUCKET_NAME}/{file_name}'
+        assert (tmp_path / env.BUCKET_NAME / file_name).read_bytes() == b'stored'
+        assert image_service.download(file_name) == b'stored'
+
+    def test_image_service_discard(self, image_service: ImageService):
+        names = [create_save_path('png') for _ in range(2)]
+        for name in names:
+            image_service.upload(name, b'stored')
+
+        image_service.discard(names)
+
+        s3_uploader = S3Uploader()
+        assert [s3_uploader.get_file_size(env.BUCKET_NAME, name) for name in names] == [None, None]
+
+    def test_image_service_download_fail(self, image_service: ImageService):
+        with pytest.raises(DownloadException):
+            image_service.download('PNG/not-found.png')
+
     def test_image_service_save(self, image_service: ImageService):
         with open('app/tests/util/test_image.jpg', 'rb') as f:
             bytes_image = f.read()
@@ -193,6 +321,17 @@ class TestImageService:
         with pytest.raises(SaveException):
             image_service.save(None)
 
+    def test_image_service_save_with_log(self, image_service: ImageService):
+        save_result = image_service.save_with_log('original.png', ImageProcessingType.READY, 'content-hash')
+
+        retrived_result = image_service.get(save_result.id)
+        assert save_result.status == ImageProcessingType.READY.value
+        assert retrived_result.model_dump() == save_result.model_dump()
+
+    def test_image_service_save_with_log_fail(self, image_service: ImageService):
+        with pytest.raises(SaveException):
+            image_service.save_with_log(None, ImageProcessingType.READY)
+
     def test_image_service_save_log_fail(self, image_service: ImageService):
         with pytest.raises(SaveException):
             image_service.save_log(None)
@@ -229,6 +368,35 @@ class TestImageService:
             assert result.svg_url == processed_url
             assert result.status == ImageProcessingType.COMPLETED
 
+    def test_image_service_complete_many(self, image_service: ImageService):
+        s3_uploader = S3Uploader()
+        old_url, shared_url = (s3_uploader.get_url(env.BUCKET_NAME, key) for key in ['old.svg', 'shared.svg'])
+        images = [image_service.save_with_log(f'{i}.png', ImageProcessingType.READY) for i in range(3)]
+        image_service.update(images[0].id, old_url)
+        image_service.update(images[1].id, shared_url)
+        image_service.update(images[2].id, shared_url)
+
+        new_svg = StoredSvgOutput(url='new.svg', size=1, compression_time=0.1)
+        replaced = image_service.complete_many({images[0].id: new_svg, images[1].id: new_svg})
+
+        # images[2]가 아직 참조하는 svg는 삭제 대상에서 빠집니다.
+        assert replaced == ['old.svg']
+        assert [image_service.get(image.id).svg_url for image in images] == ['new.svg', 'new.svg', shared_url]
+        assert image_service.get(images[0].id).status == ImageProcessingType.COMPLETED
+
+    def test_image_service_complete_many_in_one_transaction(self, image_service: ImageService, monkeypatch):
+        image = image_service.save_with_log('original.png', ImageProcessingType.READY)
+
+        def fail(models):
+            raise RuntimeError('log insert failed')
+
+        monkeypatch.setattr(image_service.processing_log_repository, '_set_current_status', fail)
+        with pytest.raises(SaveException):
+            image_service.complete_many({image.id: StoredSvgOutput(url='new.svg', size=1, compression_time=0.1)})
+
+        # 로그 저장이 실패하면 svg 갱신도 함께 롤백됩니다.
+        assert image_service.get(image.id).svg_url is None
+
     def test_image_service_get_all(self, image_service: ImageService):
         # 이미지 3개 생성 후 limit 2, offset 0, 1로 각각 조회
         # total 3, limit 2, offset 0 -> 2개 조회
@@ -272,6 +440,74 @@ class TestImageService:
             assert result.page == 2
             assert len(result.items) == 0
 
+    def test_image_service_find_duplicate(self, image_service: ImageService):
+        saved_image = image_service.save('test.png', 'a' * 64)
+        assert image_service.find_duplicate('a' * 64) is None
+
+        image_service.update(saved_image.id, 'test.svg')
+        duplicate = image_service.find_duplicate('a' * 64)
+
+        assert duplicate.id == saved_image.id
+        assert duplicate.svg_url == 'test.svg'
+
+    def _jpeg(self, image: Image.Image, quality: int = 95) -> ImageContext:
+        output = BytesIO()
+        image.save(output, 'JPEG', quality=quality)
+        return ImageContext(output.getvalue())
+
+    def _save_converted(self, image_service: ImageService, image: ImageContext, stored: ImageContext) -> None:
+        # 변환이 끝난 이미지처럼 전처리된 이미지를 저장소에 두고 svg와 함께 저장합니다.
+        image_service.preprocess(stored)
+        original_url = image_service.upload(create_save_path('jpeg'), stored.preprocessed.data)
+        image_service.save(
+            original_url,
+            None,
+            'converted.svg',
+            image.perceptual_hash,
+            stored.preprocessed.width,
+            stored.preprocessed.height,
+        )
+
+    def test_image_service_find_similar(self, image_service: ImageService):
+        pattern = np.random.default_rng(0).integers(0, 256, (6, 8), dtype=np.uint8)
+        image = Image.fromarray(pattern).resize((400, 300), Image.Resampling.BICUBIC)
+        converted = self._jpeg(image)
+        image_service.preprocess(converted)
+        self._save_converted(image_service, converted, converted)
+        # 다시 압축된 같은 이미지는 기존 svg를 사용합니다.
+        recompressed = self._jpeg(image, quality=60)
+        image_service.preprocess(recompressed)
+
+        assert image_service.find_similar(recompressed).svg_url == 'converted.svg'
+
+    def test_image_service_find_similar_confirms_pixels(self, image_service: ImageService):
+        pattern = np.random.default_rng(0).integers(0, 256, (6, 8), dtype=np.uint8)
+        image = Image.fromarray(pattern).resize((400, 300), Image.Resampling.BICUBIC)
+        lined = image.copy()
+        ImageDraw.Draw(lined).line((50, 150, 350, 150), fill=0)
+        converted, upload = self._jpeg(image), self._jpeg(lined)
+        image_service.preprocess(upload)
+        self._save_converted(image_service, converted, converted)
+
+        # 선 하나만 다른 이미지는 해시가 같아도 픽셀 비교에서 걸러집니다.
+        assert converted.perceptual_hash == upload.perceptual_hash
+        assert image_service.find_similar(upload) is None
+
+    def test_image_service_find_similar_skips_near_blank(self, image_service: ImageService):
+        blank = Image.new('L', (400, 400), 255)
+        lined, text = blank.copy(), blank.copy()
+        ImageDraw.Draw(lined).line((50, 200, 350, 200), fill=0)
+        ImageDraw.Draw(text).text((100, 200), 'hello world', fill=0)
+        converted = self._jpeg(blank)
+        image_service.preprocess(converted)
+        self._save_converted(image_service, converted, converted)
+
+        # 빈 이미지, 가는 선, 작은 글자는 해시가 거의 0이라 비교하지 않습니다.
+        for image in [blank, lined, text, Image.new('L', (2000, 300), 255)]:
+            upload = self._jpeg(image)
+            image_service.preprocess(upload)
+            assert image_service.find_similar(upload) is None
+
     def test_image_service_get_fail(self, image_service: ImageService):
         with pytest.raises(ContentsNotFoundException):
             image_service.get(uuid.uuid4())
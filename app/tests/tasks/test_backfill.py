@@ -0,0 +1,87 @@
+from pathlib import Path
+
+import pytest
+from PIL import Image as PILImage
+
+from app.config.env import env
+from app.model.image import Image
+from app.schema.enum.image import SvgEncodingType
+from app.service.image import ImageService
+from app.tasks.backfill import BackfillSource, run_backfill
+from app.util.image_util import decode_svg
+from app.util.s3_uploder import S3Uploader
+
+
+class TestBackfill:
+    @pytest.fixture
+    def source(self, tmp_path: Path) -> Path:
+        for name in ['a.png', 'nested/b.png', 'unknown.png']:
+            path = tmp_path / 'images' / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            PILImage.new('L', (200, 200), 255).save(path, 'PNG')
+        (tmp_path / 'images' / 'broken.png').write_bytes(b'not an image')
+        return tmp_path / 'images'
+
+    @pytest.fixture
+    def images(self, image_service: ImageService) -> list:
+        s3_uploader = S3Uploader()
+        urls = [s3_uploader.get_url(env.BUCKET_NAME, key) for key in ['a.png', 'a.png', 'nested/b.png', 'broken.png']]
+        return image_service.image_repository.add_many([Image(original_url=url) for url in urls])
+
+    def test_local_source_keys(self, source: Path):
+        keys = list(BackfillSource(str(source)).keys(S3Uploader()))
+
+        assert sorted(keys) == ['a.png', 'broken.png', 'nested/b.png', 'unknown.png']
+
+    def test_s3_source(self):
+        backfill_source = BackfillSource('s3://bucket/some/prefix')
+
+        assert (backfill_source.bucket_name, backfill_source.prefix) == ('bucket', 'some/prefix')
+
+    def test_run_backfill(self, image_service: ImageService, images: list, source: Path, tmp_path: Path):
+        checkpoint = tmp_path / 'checkpoint'
+
+        converted = run_backfill(image_service, str(source), checkpoint, workers=1, batch_size=2)
+
+        svg_urls = [image_service.get(image.id).svg_url for image in images]
+        assert converted == 2
+        # rows sharing an original get the same svg, the broken one is left for the next run
+        assert svg_urls[0] == svg_urls[1] and svg_urls[0].endswith('.svg.gz')
+        assert svg_urls[2].endswith('.svg.gz')
+        assert svg_urls[3] is None
+        assert image_service.get(images[0].id).status == 'completed'
+        assert sorted(checkpoint.read_text().splitlines()) == ['a.png', 'nested/b.png']
+        # the stored originals are preprocessed already, the svg keeps their size
+        s3_uploader = S3Uploader()
+        svg_key = s3_uploader.get_file_name(env.BUCKET_NAME, svg_urls[0])
+        svg = decode_svg(s3_uploader.download_file(env.BUCKET_NAME, svg_key), SvgEncodingType.GZIP)
+        assert b'width="200"' in svg and b'height="200"' in svg
+
+    def test_run_backfill_deletes_replaced_svgs(self, image_service: ImageService, images: list, source: Path):
+        run_backfill(image_service, str(source), workers=1)
+        s3_uploader = S3Uploader()
+        old_key = s3_uploader.get_file_name(env.BUCKET_NAME, image_service.get(images[2].id).svg_url)
+
+        # 다시 변환하면 이전 svg는 새 svg로 바뀐 뒤 저장소에서 지워집니다.
+        run_backfill(image_service, str(source), workers=1)
+
+        assert image_service.get(images[2].id).svg_url != s3_uploader.get_url(env.BUCKET_NAME, old_key)
+        with pytest.raises(s3_uploader.s3.exceptions.NoSuchKey):
+            s3_uploader.download_file(env.BUCKET_NAME, old_key)
+
+    def test_run_backfill_all_failed(self, image_service: ImageService, images: list, source: Path):
+        # 한 배치의 변환이 모두 실패해도 다음 배치로 넘어갑니다.
+        converted = run_backfill(image_service, str(source), workers=1, batch_size=1)
+
+        assert converted == 2
+        assert image_service.get(images[3].id).svg_url is None
+
+    def test_run_backfill_resume(self, image_service: ImageService, images: list, source: Path, tmp_path: Path):
+        checkpoint = tmp_path / 'checkpoint'
+        checkpoint.write_text('a.png\n')
+
+        converted = run_backfill(image_service, str(source), checkpoint, workers=1)
+
+        assert converted == 1
+        assert image_service.get(images[0].id).svg_url is None
+        assert image_service.get(images[2].id).svg_url is not None
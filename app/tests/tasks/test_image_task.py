@@ -0,0 +1,91 @@
+import gzip
+from io import BytesIO
+
+import pytest
+from PIL import Image as PILImage
+
+from app.config.env import env
+from app.model.image import ImagePerceptualHash
+from app.schema.enum.image import ImageProcessingType
+from app.service.image import ImageService
+from app.tasks.image import process_image_task
+from app.util.image_util import create_save_path
+from app.util.s3_uploder import S3Uploader
+
+
+class TestImageTask:
+    @pytest.fixture(autouse=True)
+    def task_db(self, test_db, monkeypatch):
+        monkeypatch.setattr('app.tasks.image.get_db', lambda: iter([test_db]))
+
+    def test_process_image_task(self, image_service: ImageService, tmp_path):
+        PILImage.new('L', (200, 200), 255).save(tmp_path / 'image.png', 'PNG')
+        storage_key = create_save_path('png')
+        original_url = image_service.upload(storage_key, (tmp_path / 'image.png').read_bytes())
+        original_id = image_service.save(original_url).id
+
+        process_image_task(original_id, storage_key)
+
+        image = image_service.get(original_id)
+        assert image.status == ImageProcessingType.COMPLETED.value
+        assert image.svg_url.endswith('.svg.gz')
+        # 압축된 크기와 시간이 함께 기록되고, 객체에는 인코딩 메타데이터가 붙습니다.
+        stored = image_service.image_repository.get(original_id)
+        svg_key = S3Uploader().get_file_name(env.BUCKET_NAME, image.svg_url)
+        head = S3Uploader().s3.head_object(Bucket=env.BUCKET_NAME, Key=svg_key)
+        assert stored.svg_size == head['ContentLength'] and stored.svg_compression_time >= 0
+        assert (head['ContentType'], head['ContentEncoding']) == ('image/svg+xml', 'gzip')
+        assert gzip.decompress(image_service.download(svg_key)).startswith(b'<svg')
+
+    def test_process_image_task_preprocess(self, image_service: ImageService, tmp_path):
+        # 직접 업로드된 원본은 작업에서 전처리되어 교체됩니다.
+        PILImage.new('RGB', (400, 300), 'white').save(tmp_path / 'image.png', 'PNG')
+        storage_key = create_save_path('png')
+        original_url = image_service.upload(storage_key, (tmp_path / 'image.png').read_bytes())
+        original_id = image_service.save(original_url).id
+
+        process_image_task(original_id, storage_key, preprocess=True)
+
+        preprocessed = PILImage.open(BytesIO(image_service.download(storage_key)))
+        assert (preprocessed.size, preprocessed.mode) == ((200, 150), 'L')
+        assert image_service.get(original_id).status == ImageProcessingType.COMPLETED.value
+        # 작업에서 전처리된 이미지도 유사 이미지 색인에 들어갑니다.
+        stored = image_service.image_repository.get(original_id)
+        assert (stored.width, stored.height) == (200, 150) and stored.perceptual_hash
+        assert image_service.image_repository.session.get(ImagePerceptualHash, original_id) is not None
+
+    def test_process_image_task_received(self, image_service: ImageService, monkeypatch, tmp_path):
+        monkeypatch.setattr(env, 'SPOOL_DIR', str(tmp_path))
+        output = BytesIO()
+        PILImage.new('RGB', (400, 300), 'white').save(output, 'JPEG')
+        storage_key = create_save_path('jpeg')
+        original_url = image_service.stash(storage_key, output.getvalue())
+        original_id = image_service.save_with_log(original_url, ImageProcessingType.RECEIVED).id
+
+        process_image_task(original_id, storage_key, preprocess=True)
+
+        # 스풀의 원본은 전처리되어 버킷에 저장되고, 스풀에서는 지워집니다.
+        assert not (tmp_path / storage_key).exists()
+        monkeypatch.setattr(env, 'SPOOL_DIR', None)
+        preprocessed = PILImage.open(BytesIO(image_service.download(storage_key)))
+        assert (preprocessed.size, preprocessed.mode) == ((200, 150), 'L')
+        assert image_service.get(original_id).status == ImageProcessingType.COMPLETED.value
+
+    def test_process_image_task_received_fail(self, image_service: ImageService, monkeypatch, tmp_path):
+        monkeypatch.setattr(env, 'SPOOL_DIR', str(tmp_path))
+        storage_key = create_save_path('png')
+        original_url = image_service.stash(storage_key, b'not an image')
+        original_id = image_service.save_with_log(original_url, ImageProcessingType.RECEIVED).id
+
+        process_image_task(original_id, storage_key, preprocess=True)
+
+        # 전처리나 업로드에 실패하면 스풀의 원본은 남아 있습니다.
+        assert (tmp_path / storage_key).read_bytes() == b'not an image'
+        assert image_service.get(original_id).status == ImageProcessingType.FAILED.value
+
+    def test_process_image_task_fail(self, image_service: ImageService):
+        original_id = image_service.save('original.png').id
+
+        process_image_task(original_id, 'PNG/not-found.png')
+
+        assert image_service.get(original_id).status == ImageProcessingType.FAILED.value
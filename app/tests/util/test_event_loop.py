@@ -0,0 +1,24 @@
+import asyncio
+import time
+
+from app.util.event_loop import EventLoopLagMonitor
+from app.util.helper import run_blocking
+
+
+class TestEventLoop:
+    def test_event_loop_lag(self):
+        async def measure(blocking: bool) -> float:
+            monitor = EventLoopLagMonitor(interval=0.01)
+            monitor.start()
+            await asyncio.sleep(0.02)
+            if blocking:
+                time.sleep(0.2)
+            else:
+                await run_blocking(time.sleep, 0.2)
+            await asyncio.sleep(0.02)
+            await monitor.stop()
+            return monitor.max_lag
+
+        # 이벤트 루프에서 직접 sleep하면 지연이 측정되고, executor로 넘기면 측정되지 않습니다.
+        assert asyncio.run(measure(blocking=True)) >= 0.15
+        assert asyncio.run(measure(blocking=False)) < 0.15
@@ -1,15 +1,28 @@
+import re
 from io import BytesIO
 
 import pytest
 from PIL import Image
 
+from app.config.env import env
+from app.schema.enum.image import SvgEncodingType
 from app.tests.helper import create_test_image, create_test_svg, create_test_text, delete_test_image, delete_test_text
 from app.util.image_util import (
-    convert_image_to_svg as _image_to_svg,
-)
-from app.util.image_util import (
+    ImageContext,
+    compute_perceptual_hash,
     create_save_path,
+    decode_svg,
+    encode_svg,
+    get_image_pixels,
     get_image_size,
+    hamming_distance,
+    is_near_blank,
+    perceptual_hash_bands,
+    pixel_difference,
+    read_image_header,
+)
+from app.util.image_util import (
+    convert_image_to_svg as _image_to_svg,
 )
 from app.util.image_util import (
     is_jpg_or_png as is_image_type_jpg_or_png,
@@ -51,6 +64,71 @@ class TestImageTools:
             text_data = f.read()
             assert not is_image_type_jpg_or_png(text_data)
 
+    def test_image_context(self, monkeypatch):
+        with open('app/tests/util/test_image.png', 'rb') as f:
+            image_data = f.read()
+
+        opened = []
+        original_open = Image.open
+        monkeypatch.setattr('app.util.image_util.Image.open', lambda *args: opened.append(1) or original_open(*args))
+
+        context = ImageContext(image_data)
+        assert context.format == 'PNG'
+        assert context.extension == 'png'
+        assert (context.width, context.height) == (1000, 1000)
+        assert context.mode == 'RGB'
+        assert context.byte_size == len(image_data)
+        assert is_image_type_jpg_or_png(context)
+        basic_image_preprocessor(context)
+
+        # header, validation and preprocessing share a single open
+        assert len(opened) == 1
+        assert ImageContext.of(context) is context
+
+    def test_image_context_invalid(self):
+        with open('app/tests/util/test_text.txt', 'rb') as f:
+            context = ImageContext(f.read())
+
+        assert context.format is None
+        assert not is_image_type_jpg_or_png(context)
+
+    @pytest.mark.parametrize(
+        'image_format, mode, options',
+        [
+            ('JPEG', 'RGB', {}),
+            ('JPEG', 'L', {}),
+            ('JPEG', 'RGB', {'progressive': True}),
+            ('PNG', 'RGB', {}),
+            ('PNG', 'RGBA', {}),
+            ('PNG', 'L', {}),
+            ('PNG', 'P', {}),
+        ],
+    )
+    def test_read_image_header(self, image_format: str, mode: str, options: dict):
+        output = BytesIO()
+        Image.new(mode, (321, 123)).save(output, image_format, **options)
+
+        header = read_image_header(output.getvalue())
+
+        assert header == (image_format, 321, 123, Image.open(BytesIO(output.getvalue())).mode)
+
+    def test_read_image_header_invalid(self):
+        with open('app/tests/util/test_image.jpg', 'rb') as f:
+            image_data = f.read()
+            # SOF가 잘려나간 JPEG
+            assert read_image_header(image_data[:20]) is None
+
+        with open('app/tests/util/test_image.svg', 'rb') as f:
+            assert read_image_header(f.read()) is None
+
+        with open('app/tests/util/test_text.txt', 'rb') as f:
+            assert read_image_header(f.read()) is None
+
+    def test_image_pixels_checker(self):
+        with open('app/tests/util/test_image.jpg', 'rb') as f:
+            image_data = f.read()
+            assert get_image_pixels(image_data) == 1000 * 1000
+
     def test_jpg_image_preprocess(self):
         with open('app/tests/util/test_image.jpg', 'rb') as f:
             image_data = f.read()
@@ -87,6 +165,71 @@ class TestImageTools:
             svg = _image_to_svg(image_data)
             assert not is_image_type_jpg_or_png(svg)
 
+    @pytest.mark.parametrize(
+        'image_format, mode, size',
+        [
+            ('JPEG', 'RGB', (1001, 777)),
+            ('JPEG', 'CMYK', (640, 480)),
+            ('JPEG', 'RGB', (150, 90)),
+            ('PNG', 'RGB', (1001, 777)),
+            ('PNG', 'P', (640, 480)),
+            ('PNG', 'RGBA', (150, 90)),
+        ],
+    )
+    def test_image_preprocess_scaling(self, image_format: str, mode: str, size: tuple[int, int]):
+        # JPEG은 디코딩 단계에서 축소되고, PNG는 reduce로 축소되어도 결과 크기와 모드는 동일해야 합니다.
+        image_data = BytesIO()
+        Image.new(mode, size).save(image_data, image_format)
+
+        processed_image = Image.open(BytesIO(basic_image_preprocessor(image_data.getvalue())))
+
+        assert processed_image.format == image_format
+        assert processed_image.mode == 'L'
+        assert processed_image.size == (max(size[0] // 2, 100), max(size[1] // 2, 100))
+
+    def test_perceptual_hash(self):
+        gradient = Image.linear_gradient('L').rotate(90).resize((400, 300))
+        recompressed = BytesIO()
+        gradient.save(recompressed, 'JPEG', quality=30)
+        mirrored = gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+
+        perceptual_hash = compute_perceptual_hash(gradient)
+
+        assert len(perceptual_hash) == 16
+        # 재압축된 이미지는 가깝고, 좌우 반전된 이미지는 멉니다.
+        assert hamming_distance(perceptual_hash, compute_perceptual_hash(Image.open(recompressed))) <= 3
+        assert hamming_distance(perceptual_hash, compute_perceptual_hash(mirrored)) > 3
+        assert perceptual_hash_bands('0123456789abcdef') == [0x0123, 0x4567, 0x89AB, 0xCDEF]
+
+    def test_image_preprocess_records_perceptual_hash(self):
+        with open('app/tests/util/test_image.jpg', 'rb') as f:
+            context = ImageContext(f.read())
+            preprocessed_image = basic_image_preprocessor(context)
+
+            assert context.perceptual_hash is not None
+            assert context.preprocessed.data == preprocessed_image
+            assert (context.preprocessed.width, context.preprocessed.height) == (500, 500)
+
+    def test_near_blank_perceptual_hash(self):
+        assert is_near_blank('0000000000000000', 8)
+        assert is_near_blank('8000000030000000', 8)
+        assert is_near_blank('ffffffffffffff7f', 8)
+        assert not is_near_blank('e9d9d89a9ad94b77', 8)
+
+    def test_pixel_difference(self):
+        blank = Image.new('L', (200, 200), 255)
+        lined = blank.copy()
+        lined.paste(0, (0, 100, 200, 101))
+        encoded = []
+        for image in [blank, lined, Image.new('L', (200, 100), 255)]:
+            output = BytesIO()
+            image.save(output, 'PNG')
+            encoded.append(output.getvalue())
+
+        assert pixel_difference(encoded[0], encoded[0], 48) == 0.0
+        assert pixel_difference(encoded[0], encoded[1], 48) == 200 / (200 * 200)
+        assert pixel_difference(encoded[0], encoded[2], 48) == 1.0
+
     def test_image_size_checker(self):
         with open('app/tests/util/test_image.jpg', 'rb') as f:
             image_data = f.read()
@@ -108,3 +251,32 @@ class TestImageTools:
         assert jpeg_path.endswith('.jpeg')
         assert png_path.endswith('.png')
         assert svg_path.endswith('.svg')
+
+    @pytest.mark.parametrize('encoding', list(SvgEncodingType))
+    def test_encode_svg(self, encoding: SvgEncodingType):
+        if encoding == SvgEncodingType.BROTLI:
+            pytest.importorskip('brotli')
+        svg = b'<svg xmlns="http://www.w3.org/2000/svg">' + b'<path d="M0 0h10v10h-10z"/>' * 100 + b'</svg>'
+
+        encoded = encode_svg(svg, encoding, 9)
+
+        assert decode_svg(encoded, encoding) == svg
+        assert encode_svg(svg, encoding, 9) == encoded
+        if encoding == SvgEncodingType.IDENTITY:
+            assert encoded == svg
+        else:
+            assert len(encoded) < len(svg) / 10
+        assert SvgEncodingType.of(f'SVG/ab/ab12.svg{encoding.suffix}') == encoding
+
+    def test_create_save_path_sharded(self, monkeypatch):
+        paths = [create_save_path('svg') for _ in range(1000)]
+
+        # 이미지타입/샤드/uuid.확장자, 샤드는 uuid의 앞 두 글자입니다.
+        assert len(set(paths)) == len(paths)
+        for path in paths:
+            image_type, shard, file_name = path.split('/')
+            assert image_type == 'SVG' and file_name.startswith(shard) and len(shard) == 2
+        assert len({path.split('/')[1] for path in paths}) > 200
+
+        monkeypatch.setattr(env, 'STORAGE_KEY_SHARD_LENGTH', 0)
+        assert re.fullmatch(r'SVG/[0-9a-f]{32}\.svg', create_save_path('svg'))
@@ -0,0 +1,101 @@
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+
+from app.config.env import env
+from app.schema.enum.image import StorageBackendType
+from app.util.s3_uploder import S3Uploader
+from app.util.storage import LocalStorage, get_storage
+
+
+class TestLocalStorage:
+    @pytest.fixture
+    def storage(self, tmp_path: Path) -> LocalStorage:
+        storage = LocalStorage(str(tmp_path))
+        storage.create_bucket('bucket')
+        return storage
+
+    def test_get_storage(self, tmp_path: Path, monkeypatch):
+        assert isinstance(get_storage(), S3Uploader)
+
+        monkeypatch.setattr(env, 'STORAGE_BACKEND', StorageBackendType.LOCAL)
+        assert isinstance(get_storage(), LocalStorage)
+
+    def test_upload_and_download(self, storage: LocalStorage):
+        url = storage.upload_file('bucket', 'SVG/1.svg', b'<svg/>')
+
+        assert url == f'{env.LOCAL_STORAGE_URL}/bucket/SVG/1.svg'
+        assert storage.get_file_name('bucket', url) == 'SVG/1.svg'
+        assert storage.download_file('bucket', 'SVG/1.svg') == b'<svg/>'
+        assert storage.download_file_head('bucket', 'SVG/1.svg', 4) == b'<svg'
+        assert storage.get_file_size('bucket', 'SVG/1.svg') == 6
+        assert storage.get_file_size('bucket', 'SVG/2.svg') is None
+
+    def test_upload_stream(self, storage: LocalStorage):
+        storage.upload_stream('bucket', 'a.bin', BytesIO(b'a' * 100_000))
+        storage.upload_stream('bucket', 'b.bin', iter([b'b', b'c']))
+
+        assert storage.download_file('bucket', 'a.bin') == b'a' * 100_000
+        assert storage.download_file('bucket', 'b.bin') == b'bc'
+
+    def test_download_stream(self, storage: LocalStorage):
+        storage.upload_file('bucket', 'a.bin', b'a' * 100_000)
+        output = BytesIO()
+
+        storage.download_stream('bucket', 'a.bin', output)
+
+        assert output.getvalue() == b'a' * 100_000
+        assert [len(chunk) for chunk in storage.iter_file('bucket', 'a.bin', 1024 * 64)] == [
+            1024 * 64,
+            100_000 - 1024 * 64,
+        ]
+
+    def test_upload_is_atomic(self, storage: LocalStorage):
+        storage.upload_file('bucket', 'a.bin', b'old')
+
+        def chunks():
+            yield b'new'
+            raise OSError('connection reset')
+
+        with pytest.raises(OSError):
+            storage.upload_stream('bucket', 'a.bin', chunks())
+
+        # 실패한 업로드는 기존 파일을 덮어쓰지 않고, 임시 파일도 남기지 않습니다.
+        assert storage.download_file('bucket', 'a.bin') == b'old'
+        assert list(storage.list_files('bucket')) == ['a.bin']
+        assert len(list((storage.root / 'bucket').iterdir())) == 1
+
+    def test_list_and_delete_files(self, storage: LocalStorage):
+        for key in ['PNG/1.png', 'PNG/2.png', 'SVG/1.svg']:
+            storage.upload_file('bucket', key, b'test')
+
+        assert list(storage.list_files('bucket', 'PNG/')) == ['PNG/1.png', 'PNG/2.png']
+        assert storage.delete_files('bucket', ['PNG/1.png', 'PNG/3.png', '../escape']) == ['../escape']
+        assert list(storage.list_files('bucket')) == ['PNG/2.png', 'SVG/1.svg']
+
+    def test_invalid_key(self, storage: LocalStorage):
+        with pytest.raises(ValueError):
+            storage.upload_file('bucket', '../other/a.png', b'test')
+        assert storage.get_file_path('bucket', '../other/a.png') is None
+        assert storage.get_file_path('bucket', 'missing.png') is None
+
+    def test_invalid_bucket(self, storage: LocalStorage):
+        (storage.root.parent / 'secret').mkdir(exist_ok=True)
+        (storage.root.parent / 'secret' / 'db.sqlite').write_bytes(b'secret')
+
+        # 버킷 이름으로도 저장소 밖의 경로에 접근할 수 없습니다.
+        for bucket_name in ['..', '../secret', 'bucket/..', '.', '']:
+            assert storage.get_file_path(bucket_name, 'secret/db.sqlite') is None
+            with pytest.raises(ValueError):
+                storage.get_path(bucket_name, 'db.sqlite')
+        with pytest.raises(ValueError):
+            storage.delete_bucket('..')
+        assert (storage.root.parent / 'secret' / 'db.sqlite').exists()
+
+    def test_delete_bucket(self, storage: LocalStorage):
+        storage.upload_file('bucket', 'a.png', b'test')
+
+        storage.delete_bucket('bucket')
+
+        assert not (storage.root / 'bucket').exists()
@@ -1,7 +1,10 @@
+from io import BytesIO
+
 import pytest
 
+from app.config.env import env
 from app.tests.helper import create_test_image, delete_test_bucket, delete_test_image
-from app.util.s3_uploder import S3Uploader
+from app.util.s3_uploder import S3Uploader, get_transfer_config
 
 
 class TestS3Uploader:
@@ -51,3 +54,91 @@ class TestS3Uploader:
         s3_uploader.delete_file(bucket_name, image_key)
 
         assert not s3_uploader._has_file(bucket_name, image_key)
+
+    def test_delete_files(self, s3_uploader: S3Uploader, bucket_name: str, monkeypatch):
+        monkeypatch.setattr('app.util.s3_uploder.DELETE_BATCH_SIZE', 3)
+        s3_uploader.create_bucket(bucket_name)
+        keys = [f'delete/{index}.txt' for index in range(7)]
+        for key in keys:
+            s3_uploader.upload_file(bucket_name, key, b'test')
+        requests = []
+        s3_uploader.s3.meta.events.register(
+            'before-send', lambda request, **kwargs: requests.append(request.method), unique_id='count-requests'
+        )
+        try:
+            failed = s3_uploader.delete_files(bucket_name, keys)
+        finally:
+            s3_uploader.s3.meta.events.unregister('before-send', unique_id='count-requests')
+
+        # 키 7개가 3개씩 요청 3번으로 삭제됩니다.
+        assert failed == []
+        assert requests == ['POST'] * 3
+        assert list(s3_uploader.list_files(bucket_name, 'delete/')) == []
+
+    def test_delete_bucket_paginated(self, s3_uploader: S3Uploader):
+        delete_bucket_name = 'th.kim-delete-paginated-bucket'
+        s3_uploader.create_bucket(delete_bucket_name)
+        for index in range(1001):
+            s3_uploader.upload_file(delete_bucket_name, f'{index}.txt', b'')
+
+        s3_uploader.delete_bucket(delete_bucket_name)
+
+        assert not s3_uploader._has_bucket(delete_bucket_name)
+
+    def test_get_file_name(self, s3_uploader: S3Uploader, bucket_name: str):
+        url = s3_uploader.get_url(bucket_name, 'SVG/20240101/1.svg')
+
+        assert s3_uploader.get_file_name(bucket_name, url) == 'SVG/20240101/1.svg'
+        assert s3_uploader.get_file_name('other-bucket', url) is None
+
+    def test_shared_client(self):
+        assert S3Uploader().s3 is S3Uploader().s3
+
+    def test_create_bucket_checked_once(self, bucket_name: str):
+        requests = []
+        s3_uploader = S3Uploader()
+        s3_uploader.create_bucket(bucket_name)
+        s3_uploader.s3.meta.events.register(
+            'before-send', lambda request, **kwargs: requests.append(request.method), unique_id='count-requests'
+        )
+        try:
+            S3Uploader().create_bucket(bucket_name)
+            S3Uploader().upload_file(bucket_name, 'test_image.txt', b'test')
+        finally:
+            s3_uploader.s3.meta.events.unregister('before-send', unique_id='count-requests')
+
+        # 버킷 확인은 프로세스당 한 번이고, 이후 업로드는 요청 한 번입니다.
+        assert requests == ['PUT']
+
+    def test_stream_multipart(self, s3_uploader: S3Uploader, bucket_name: str, monkeypatch):
+        monkeypatch.setattr(env, 'S3_MULTIPART_THRESHOLD', 1024 * 1024 * 5)
+        monkeypatch.setattr(env, 'S3_MULTIPART_CHUNKSIZE', 1024 * 1024 * 5)
+        get_transfer_config.cache_clear()
+        data = bytes(range(256)) * 4096 * 11  # 11MB
+        operations = []
+        s3_uploader.s3.meta.events.register(
+            'before-call.s3', lambda model, **kwargs: operations.append(model.name), unique_id='count-operations'
+        )
+        try:
+            chunks = (data[index : index + 1024 * 64] for index in range(0, len(data), 1024 * 64))
+            s3_uploader.upload_stream(bucket_name, 'test_large.bin', chunks)
+            uploaded_operations = list(operations)
+            operations.clear()
+
+            output = BytesIO()
+            s3_uploader.download_stream(bucket_name, 'test_large.bin', output)
+        finally:
+            s3_uploader.s3.meta.events.unregister('before-call.s3', unique_id='count-operations')
+            get_transfer_config.cache_clear()
+
+        # 5MB 단위로 나누어 올리고, 범위 요청으로 나누어 받습니다.
+        assert uploaded_operations.count('UploadPart') == 3
+        assert 'CompleteMultipartUpload' in uploaded_operations
+        assert operations.count('GetObject') == 3
+        assert output.getvalue() == data
+        assert b''.join(s3_uploader.iter_file(bucket_name, 'test_large.bin')) == data
+
+    def test_stream_small(self, s3_uploader: S3Uploader, bucket_name: str):
+        s3_uploader.upload_stream(bucket_name, 'test_small.bin', BytesIO(b'small'), size=5)
+
+        assert s3_uploader.download_file(bucket_name, 'test_small.bin') == b'small'
@@ -0,0 +1,235 @@
+import re
+import xml.etree.ElementTree as ET
+
+import cv2
+import numpy as np
+import pytest
+
+from app.schema.enum.image import SvgOptimizerType
+from app.util.image_util import convert_image_to_svg, optimize_svg
+from app.util.svg_util import (
+    bitmap_to_path_data,
+    compact_path_data,
+    contour_areas,
+    contour_depths,
+    contours_to_path_data,
+    minify_svg,
+    shorten_number,
+)
+
+
+def create_line_art() -> np.ndarray:
+    image = np.zeros((300, 400), np.uint8)
+    cv2.circle(image, (100, 100), 50, 255, 3)
+    cv2.rectangle(image, (200, 50), (350, 250), 255, -1)
+    cv2.rectangle(image, (250, 100), (300, 200), 0, -1)
+    cv2.circle(image, (275, 150), 10, 255, -1)
+    return image
+
+
+def parse_path_data(path_data: bytes) -> list[list[tuple[int, int]]]:
+    subpaths = re.findall(rb'M([\d ]+)Z', path_data)
+    result = []
+    for subpath in subpaths:
+        numbers = [int(number) for number in subpath.split()]
+        result.append(list(zip(numbers[0::2], numbers[1::2])))
+    return result
+
+
+def parse_span_data(path_data: bytes) -> list[tuple[int, int, int]]:
+    return [tuple(int(value) for value in span) for span in re.findall(rb'M(\d+) (\d+)h(\d+)v1h-\3z', path_data)]
+
+
+def parse_relative_path_data(path_data: str) -> list[list[tuple[int, int]]]:
+    # only the commands written by compact_path_data for polygon paths
+    subpaths, start, current, command = [], (0, 0), (0, 0), None
+    for token in re.findall(r'[mlhvz]|-?\d+', path_data):
+        if token.isalpha():
+            command = token
+            if command == 'z':
+                current = start
+            continue
+        if command == 'v':
+            current = (current[0], current[1] + int(token))
+            subpaths[-1].append(current)
+            continue
+        if command == 'h':
+            current = (current[0] + int(token), current[1])
+            subpaths[-1].append(current)
+            continue
+        # m and l take pairs, the second number completes the point
+        if isinstance(current, tuple):
+            current = [current, int(token)]
+            continue
+        previous, dx = current
+        current = (previous[0] + dx, previous[1] + int(token))
+        if command == 'm':
+            start = current
+            subpaths.append([current])
+            command = 'l'
+        else:
+            subpaths[-1].append(current)
+    return subpaths
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    _, encoded = cv2.imencode('.png', image)
+    return encoded.tobytes()
+
+
+class TestSvgUtil:
+    def test_contours_to_path_data_round_trip(self):
+        contours, _ = cv2.findContours(create_line_art(), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+
+        subpaths = parse_path_data(contours_to_path_data(contours))
+
+        assert len(subpaths) == len(contours)
+        for subpath, contour in zip(subpaths, contours):
+            assert subpath == [(int(x), int(y)) for x, y in contour.reshape(-1, 2)]
+
+    def test_contours_to_path_data_empty(self):
+        assert contours_to_path_data([]) == b''
+
+    def test_bitmap_to_path_data_runs(self):
+        mask = np.array([
+            [0, 1, 1, 0, 1],
+            [0, 0, 0, 0, 0],
+            [1, 1, 1, 1, 1],
+        ])
+
+        spans = parse_span_data(bitmap_to_path_data(mask))
+
+        # (x, y, length)
+        assert spans == [(1, 0, 2), (4, 0, 1), (0, 2, 5)]
+
+    def test_bitmap_to_path_data_solid(self):
+        mask = np.ones((50, 80), dtype=bool)
+
+        spans = parse_span_data(bitmap_to_path_data(mask))
+
+        assert spans == [(0, y, 80) for y in range(50)]
+
+    def test_bitmap_to_path_data_blank(self):
+        assert bitmap_to_path_data(np.zeros((50, 80), dtype=bool)) == b''
+
+    def test_convert_blank_image_to_svg(self):
+        # no contours are found, the output must not grow with the number of pixels
+        svg = convert_image_to_svg(encode_png(np.zeros((2000, 2000), np.uint8)))
+
+        assert svg.count(b'<rect') == 1
+        assert b'<path' not in svg
+        assert len(svg) < 1024
+
+    def test_convert_solid_image_to_svg(self):
+        # a solid gray image stays under the threshold and is written as a single background
+        svg = convert_image_to_svg(encode_png(np.full((2000, 2000), 100, np.uint8)))
+
+        assert svg.count(b'<rect') == 1
+        assert b'fill="white"' in svg
+        assert len(svg) < 1024
+
+    def test_contour_depths(self):
+        _, hierarchy = cv2.findContours(create_line_art(), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+        parents = hierarchy[0][:, 3]
+
+        depths = contour_depths(hierarchy)
+
+        for index, parent in enumerate(parents):
+            expected = 0 if parent < 0 else depths[parent] + 1
+            assert depths[index] == expected
+
+    def test_contour_areas(self):
+        contours, _ = cv2.findContours(create_line_art(), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+
+        areas = contour_areas(contours)
+
+        assert np.allclose(areas, [cv2.contourArea(contour) for contour in contours])
+        assert len(contour_areas([])) == 0
+
+    def test_convert_image_to_svg_tolerance(self):
+        image_data = encode_png(create_line_art())
+
+        svg = convert_image_to_svg(image_data)
+        simplified_svg = convert_image_to_svg(image_data, tolerance=2.0)
+
+        assert len(simplified_svg) < len(svg)
+        assert simplified_svg.count(b'<path ') == svg.count(b'<path ')
+
+    def test_convert_image_to_svg_min_area(self):
+        image_data = encode_png(create_line_art())
+        contours, _ = cv2.findContours(create_line_art(), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+        min_area = sorted(contour_areas(contours))[1] + 1
+
+        svg = convert_image_to_svg(image_data, min_area=min_area)
+
+        # 가장 작은 두 윤곽선이 빠집니다.
+        assert svg.count(b'M') == len(contours) - 3
+        assert svg.count(b'M') < convert_image_to_svg(image_data).count(b'M')
+
+    def test_convert_image_to_svg_one_path_per_level(self):
+        image_data = encode_png(create_line_art())
+        _, hierarchy = cv2.findContours(create_line_art(), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+
+        svg = convert_image_to_svg(image_data)
+
+        assert svg.count(b'<path ') <= len(np.unique(contour_depths(hierarchy)))
+        assert b'<polygon' not in svg
+
+    def test_shorten_number(self):
+        assert shorten_number('10.000') == '10'
+        assert shorten_number('0.500') == '.5'
+        assert shorten_number('-0.5') == '-.5'
+        assert shorten_number('-0') == '0'
+        assert shorten_number('+7') == '7'
+        assert shorten_number('1e-3') == '1e-3'
+
+    def test_compact_path_data_tokens(self):
+        assert compact_path_data('M 10.0 20.0 L 30 -40 L 50 60 C 1 2 3 4 5 6') == 'M10 20 30-40 50 60C1 2 3 4 5 6'
+        assert compact_path_data('M 0.5 0.5 L 0.25 .5') == 'M.5.5.25.5'
+
+    def test_compact_path_data_polygons(self):
+        contours, _ = cv2.findContours(create_line_art(), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+
+        compacted = compact_path_data(contours_to_path_data(contours).decode('ascii'))
+        subpaths = parse_relative_path_data(compacted)
+
+        assert re.fullmatch(r'[mlhvz\d -]+', compacted)
+        assert len(subpaths) == len(contours)
+        for subpath, contour in zip(subpaths, contours):
+            points = [(int(x), int(y)) for x, y in contour.reshape(-1, 2)]
+            # only points that do not move the pen, or repeat the start right before 'z', are dropped
+            expected = [point for index, point in enumerate(points) if index == 0 or point != points[index - 1]]
+            if len(expected) > 1 and expected[-1] == expected[0]:
+                expected.pop()
+            assert subpath == expected
+
+    def test_minify_svg(self):
+        svg = b"""<?xml version="1.0" encoding="utf-8" ?>
+        <!-- generated -->
+        <svg baseProfile="full" height="100.0" width="100" xmlns="http://www.w3.org/2000/svg"
+             xmlns:xlink="http://www.w3.org/1999/xlink">
+            <metadata><rdf:RDF><dc:title>logo</dc:title></rdf:RDF></metadata>
+            <title>logo</title>
+            <defs />
+            <g>
+                <g fill="black"></g>
+                <rect height="10" width="10" x="0.0" y="0.50" fill="white" />
+            </g>
+        </svg>"""
+
+        minified = minify_svg(svg)
+
+        assert minified == (
+            b'<svg height="100" width="100" xmlns="http://www.w3.org/2000/svg">'
+            b'<rect height="10" width="10" x="0" y=".5" fill="#fff"/></svg>'
+        )
+
+    @pytest.mark.parametrize('optimizer', list(SvgOptimizerType))
+    def test_optimize_svg(self, optimizer: SvgOptimizerType):
+        svg = convert_image_to_svg(encode_png(create_line_art()))
+
+        optimized = optimize_svg(svg, optimizer)
+
+        assert optimized[:4] == b'<svg'
+        assert len(optimized) < len(svg)
+        assert ET.fromstring(optimized).tag.endswith('svg')
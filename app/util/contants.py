@@ -1,2 +1,12 @@
 MAXIMUM_IMAGE_SIZE = 1024 * 1024 * 5  # 5MB
 MAX_ALLOWED_IMAGE_COUNT = 3
+MAX_ALLOWED_BULK_IMAGE_COUNT = 100  # bulk ingestion endpoint, accepted uploads stay in memory until the request ends
+UPLOAD_CHUNK_SIZE = 1024 * 64  # uploads are read, checked and hashed this much at a time
+PERCEPTUAL_HASH_DISTANCE = 3  # near-duplicate threshold in bits, must stay below the 4 index bands
+PERCEPTUAL_HASH_MIN_BITS = 8  # hashes with fewer set (or unset) bits are near-blank and never matched
+SIMILAR_PIXEL_TOLERANCE = 48  # grayscale levels a near-duplicate pixel may differ by, above jpeg re-encoding noise
+SIMILAR_PIXEL_RATIO = 0.0001  # share of pixels allowed beyond the tolerance, a one pixel line is well above it
+SIMILAR_MAX_CANDIDATES = 3  # closest stored originals downloaded and compared per upload
+PRESIGNED_URL_EXPIRES_IN = 60 * 10  # seconds
+IMAGE_HEADER_READ_SIZE = 1024 * 256  # read from a presigned upload to check its header, covers EXIF segments
+MAX_ALLOWED_DELETE_IMAGE_COUNT = 1000  # ids per bulk delete request
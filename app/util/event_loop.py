@@ -0,0 +1,43 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+
+class EventLoopLagMonitor:
+    """
+    Sleeps for a fixed interval and measures how late it wakes up, the delay is the time the loop was blocked.
+    """
+
+    def __init__(self, interval: float = 0.05, threshold: float = 0.1):
+        self.interval = interval
+        self.threshold = threshold
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.samples = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def reset(self) -> None:
+        self.last_lag, self.max_lag, self.samples = 0.0, 0.0, 0
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(time.perf_counter() - started - self.interval, 0.0)
+            self.max_lag = max(self.max_lag, self.last_lag)
+            self.samples += 1
+            if self.last_lag > self.threshold:
+                logging.warning(f'event loop was blocked for {self.last_lag * 1000:.0f} ms')
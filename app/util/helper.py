@@ -1,9 +1,25 @@
+import asyncio
+import base64
 import logging
-from functools import wraps
-from typing import Any, Callable
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial, wraps
+from itertools import islice
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Any, Callable, Iterable, Iterator, TypeVar
+from uuid import UUID
 
+from app.config.env import env
 from app.exception.image import ImageServiceCustomException
 
+R = TypeVar('R')
+T = TypeVar('T')
+
+# bounded, so a burst of uploads queues here instead of starting a thread per image
+blocking_executor = ThreadPoolExecutor(max_workers=env.BLOCKING_WORKERS, thread_name_prefix='blocking')
+
 
 def exception_handler(exception: Callable) -> Callable:
     def decorator(func: Callable) -> Callable:
@@ -21,3 +37,37 @@ def exception_handler(exception: Callable) -> Callable:
         return wrapper
 
     return decorator
+
+
+async def run_blocking(func: Callable[..., R], *args: Any, **kwargs: Any) -> R:
+    # PIL, boto3 and SQLAlchemy calls block, they run on the executor so the event loop keeps serving requests
+    return await asyncio.get_running_loop().run_in_executor(blocking_executor, partial(func, *args, **kwargs))
+
+
+def batched(items: Iterable[T], size: int) -> Iterator[list[T]]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def write_atomic(path: Path, chunks: Iterable[bytes]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # written under a temporary name and renamed, so a reader never sees a partial file
+    with NamedTemporaryFile(dir=path.parent, prefix=f'.{path.name}.', delete=False) as temporary_file:
+        try:
+            for chunk in chunks:
+                temporary_file.write(chunk)
+        except Exception as e:
+            os.unlink(temporary_file.name)
+            raise e
+    os.replace(temporary_file.name, path)
+
+
+def encode_cursor(created_at: datetime, id: UUID) -> str:
+    # opaque to clients, it only carries the sort key of the last row of a page
+    return base64.urlsafe_b64encode(f'{created_at.isoformat()}|{id}'.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    created_at, id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(created_at), UUID(id)
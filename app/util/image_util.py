@@ -1,65 +1,257 @@
-import random
-from datetime import datetime
-from io import BytesIO, StringIO
+import gzip
+import hashlib
+import uuid
+from functools import cache, cached_property
+from io import BytesIO
+from typing import Optional, Union
 
 import cv2
 import numpy as np
-import svgwrite
 from PIL import Image, ImageFile
 from scour import scour
 
+try:
+    import brotli
+except ImportError:  # optional, only needed for SVG_ENCODING=br
+    brotli = None
+
+from app.config.env import env
+from app.schema.enum.image import SvgEncodingType, SvgOptimizerType
+from app.util.svg_util import (
+    bitmap_to_path_data,
+    build_svg,
+    contour_areas,
+    contour_depths,
+    contours_to_path_data,
+    minify_svg,
+    path_element,
+    rect_element,
+)
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_MODES = {(0, 1): '1', (0, 16): 'I;16', 0: 'L', 2: 'RGB', 3: 'P', 4: 'LA', 6: 'RGBA'}
+JPEG_SIGNATURE = b'\xff\xd8'
+# start-of-frame markers, 0xC4 (DHT), 0xC8 (JPG) and 0xCC (DAC) share the range but carry no frame header
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+JPEG_STANDALONE_MARKERS = set(range(0xD0, 0xD9)) | {0x01}
+JPEG_MODES = {1: 'L', 3: 'RGB', 4: 'CMYK'}
+REDUCIBLE_MODES = {'L', 'LA', 'RGB', 'RGBA', 'I', 'F'}
+
+Image.MAX_IMAGE_PIXELS = env.MAXIMUM_IMAGE_PIXELS
+
+
+def _read_png_header(data: bytes) -> Optional[tuple[str, int, int, str]]:
+    # signature, then the IHDR chunk: length(4) type(4) width(4) height(4) bit depth(1) color type(1)
+    if len(data) < 26 or data[12:16] != b'IHDR':
+        return None
+    width, height = int.from_bytes(data[16:20], 'big'), int.from_bytes(data[20:24], 'big')
+    bit_depth, color_type = data[24], data[25]
+    mode = PNG_MODES.get((color_type, bit_depth), PNG_MODES.get(color_type))
+    return ('PNG', width, height, mode) if mode else None
+
+
+def _read_jpeg_header(data: bytes) -> Optional[tuple[str, int, int, str]]:
+    # walk the marker segments until the frame header, entropy-coded data (SOS) means there is none
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            return None
+        marker = data[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        if marker in JPEG_STANDALONE_MARKERS:
+            position += 2
+            continue
+        if marker == 0xDA:
+            return None
+
+        length = int.from_bytes(data[position + 2 : position + 4], 'big')
+        if marker in JPEG_SOF_MARKERS:
+            # length(2) precision(1) height(2) width(2) components(1)
+            if position + 10 > len(data):
+                return None
+            height = int.from_bytes(data[position + 5 : position + 7], 'big')
+            width = int.from_bytes(data[position + 7 : position + 9], 'big')
+            mode = JPEG_MODES.get(data[position + 9])
+            return ('JPEG', width, height, mode) if mode and width and height else None
+        position += 2 + length
+    return None
+
+
+def has_image_signature(data: bytes) -> bool:
+    return data.startswith(PNG_SIGNATURE) or data.startswith(JPEG_SIGNATURE)
+
+
+def read_image_header(data: bytes) -> Optional[tuple[str, int, int, str]]:
+    """
+    Format, width, height and mode of a PNG or JPEG, read from the IHDR/SOF header without decoding.
+    """
+    if data.startswith(PNG_SIGNATURE):
+        return _read_png_header(data)
+    if data.startswith(JPEG_SIGNATURE):
+        return _read_jpeg_header(data)
+    return None
+
+
+def compute_perceptual_hash(image: Image.Image) -> str:
+    # dHash: 9x8 grayscale thumbnail, one bit per pair of horizontally adjacent pixels
+    pixels = np.asarray(image.convert('L').resize((9, 8), Image.Resampling.BOX), dtype=np.int16)
+    bits = np.packbits(pixels[:, 1:] > pixels[:, :-1])
+    return bits.tobytes().hex()
+
+
+def perceptual_hash_bands(perceptual_hash: str) -> list[int]:
+    return [int(perceptual_hash[index : index + 4], 16) for index in range(0, 16, 4)]
+
+
+def hamming_distance(perceptual_hash: str, other: str) -> int:
+    return (int(perceptual_hash, 16) ^ int(other, 16)).bit_count()
+
+
+def is_near_blank(perceptual_hash: str, min_bits: int) -> bool:
+    # blank images, thin line art and small text all hash to (almost) all zeros or all ones
+    bits = int(perceptual_hash, 16).bit_count()
+    return bits < min_bits or bits > 64 - min_bits
+
+
+def pixel_difference(image_data: bytes, other: bytes, tolerance: int) -> float:
+    # share of grayscale pixels differing by more than tolerance, 1 when the sizes differ
+    pixels = np.asarray(Image.open(BytesIO(image_data)).convert('L'), dtype=np.int16)
+    other_pixels = np.asarray(Image.open(BytesIO(other)).convert('L'), dtype=np.int16)
+    if pixels.shape != other_pixels.shape:
+        return 1.0
+    return float(np.mean(np.abs(pixels - other_pixels) > tolerance))
+
+
+class ImageContext:
+    """
+    Handle of one uploaded image, created once and passed through validate -> preprocess -> create_save_path.
+    Format, dimensions and mode come from the header, the pixels are decoded only when they are needed.
+    preprocess_image records the preprocessed image and its perceptual hash on it.
+    """
+
+    def __init__(self, data: bytes, content_hash: Optional[str] = None):
+        self.data = data
+        self.perceptual_hash: Optional[str] = None
+        self.preprocessed: Optional['ImageContext'] = None
+        # set when the upload was hashed while it was streamed in
+        self._content_hash = content_hash
+
+    @classmethod
+    def of(cls, image: Union[bytes, 'ImageContext']) -> 'ImageContext':
+        return image if isinstance(image, cls) else cls(image)
+
+    @cached_property
+    def _header(self) -> Optional[tuple[str, int, int, str]]:
+        return read_image_header(self.data)
+
+    @property
+    def format(self) -> Optional[str]:
+        return self._header[0] if self._header else None
+
+    @property
+    def extension(self) -> str:
+        return self.format.lower()
+
+    @property
+    def width(self) -> int:
+        return self._header[1]
+
+    @property
+    def height(self) -> int:
+        return self._header[2]
+
+    @property
+    def pixel_count(self) -> int:
+        return self.width * self.height
+
+    @property
+    def mode(self) -> str:
+        return self._header[3]
+
+    @property
+    def byte_size(self) -> int:
+        return len(self.data)
+
+    @property
+    def content_hash(self) -> str:
+        if self._content_hash is None:
+            self._content_hash = hashlib.sha256(self.data).hexdigest()
+        return self._content_hash
+
+    def decode(self, mode: Optional[str] = None, size: Optional[tuple[int, int]] = None) -> ImageFile.ImageFile:
+        image = Image.open(BytesIO(self.data))
+        if mode or size:
+            # JPEG only: the decoder converts and scales the DCT blocks by 1/2, 1/4 or 1/8 while decoding,
+            # the result is never smaller than the requested size
+            image.draft(mode, size)
+        image.load()
+        return image
+
+    @cached_property
+    def pixels(self) -> ImageFile.ImageFile:
+        return self.decode()
+
 
 def resize_image(image: ImageFile.ImageFile, width: int, height: int) -> Image:
     return image.resize((max(width, 100), max(height, 100)))
 
 
-def is_jpg_or_png(image_data: bytes) -> bool:
-    try:
-        image_format = Image.open(BytesIO(image_data)).format
-        return image_format in ['JPEG', 'PNG']
-    except Exception:
-        return False
+def is_jpg_or_png(image_data: Union[bytes, ImageContext]) -> bool:
+    return ImageContext.of(image_data).format in ['JPEG', 'PNG']
 
 
-def get_image_size(image_data: bytes) -> int:
-    return len(image_data)
+def get_image_size(image_data: Union[bytes, ImageContext]) -> int:
+    return ImageContext.of(image_data).byte_size
 
 
-def get_image_format(image_data: bytes) -> str:
-    return Image.open(BytesIO(image_data)).format.lower()
+def get_image_pixels(image_data: Union[bytes, ImageContext]) -> int:
+    return ImageContext.of(image_data).pixel_count
 
 
-def convert_image_to_svg(image_data: bytes) -> bytes:
+def get_image_format(image_data: Union[bytes, ImageContext]) -> str:
+    return ImageContext.of(image_data).extension
+
+
+def convert_image_to_svg(image_data: bytes, tolerance: float = 0.0, min_area: float = 0.0) -> bytes:
+    """
+    tolerance: maximum distance in pixels between a contour and its simplified polygon (approxPolyDP), 0 keeps all
+    min_area: contours enclosing less than this many square pixels are dropped
+    """
     img_array = np.frombuffer(image_data, np.uint8)
     img = cv2.imdecode(img_array, cv2.IMREAD_GRAYSCALE)
     _, thresh = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY)
-    contours, _ = cv2.findContours(thresh, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-    dwg = svgwrite.Drawing(size=(img.shape[1], img.shape[0]))
+    contours, hierarchy = cv2.findContours(thresh, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
 
     if not contours:
-        for y in range(img.shape[0]):
-            for x in range(img.shape[1]):
-                color = 'black' if img[y, x] == 255 else 'white'
-                dwg.add(dwg.rect(insert=(x, y), size=(1, 1), fill=color))
-    else:
-        max_contour = max(contours, key=cv2.contourArea)
-        for contour in contours:
-            points = [(int(point[0][0]), int(point[0][1])) for point in contour]
-            if points:
-                if cv2.contourArea(contour) != cv2.contourArea(max_contour):
-                    if points[0] != points[-1]:
-                        points.append(points[0])
-                    dwg.add(dwg.polygon(points=points, fill='black', stroke='black'))
-                else:
-                    continue
-
-    output_bytes = StringIO()
-    dwg.write(output_bytes)
-    return output_bytes.getvalue().encode('utf-8')
-
-
-def optimize_svg(svg_data: bytes) -> bytes:
-    svg_string = svg_data.decode('utf-8')
+        # nothing passed the threshold, the bitmap is written as a background plus merged row spans
+        spans = bitmap_to_path_data(img == 255)
+        elements = [rect_element(0, 0, img.shape[1], img.shape[0], fill='white')]
+        if spans:
+            elements.append(path_element(spans, fill='black'))
+        return build_svg(img.shape[1], img.shape[0], elements)
+
+    # contours sharing the largest area are skipped, every other contour is filled black
+    areas = contour_areas(contours)
+    filled = (areas != areas.max()) & (areas >= min_area)
+    depths = contour_depths(hierarchy)
+    if tolerance > 0:
+        contours = [
+            cv2.approxPolyDP(contour, tolerance, True) if filled[index] else contour
+            for index, contour in enumerate(contours)
+        ]
+
+    # contours on the same hierarchy level never overlap, so one path per level renders like one polygon per contour
+    paths = []
+    for depth in np.unique(depths[filled]):
+        level = [contours[index] for index in np.flatnonzero(filled & (depths == depth))]
+        paths.append(path_element(contours_to_path_data(level), fill='black', stroke='black'))
+    return build_svg(img.shape[1], img.shape[0], paths)
+
+
+@cache
+def _scour_options():
     options = scour.parse_args([])
     options.enable_viewboxing = True
     options.enable_id_stripping = True
@@ -71,27 +263,74 @@ def optimize_svg(svg_data: bytes) -> bytes:
     options.remove_descriptive_elements = True
     options.group_create = True
     options.group_collapse = True
-    options = scour.sanitizeOptions(options)
-    optimized_svg = scour.scourString(svg_string, options)
-    return StringIO(optimized_svg).read().encode('utf-8')
+    return scour.sanitizeOptions(options)
+
+
+def optimize_svg(svg_data: bytes, optimizer: Optional[SvgOptimizerType] = None) -> bytes:
+    optimizer = optimizer or env.SVG_OPTIMIZER
+    if optimizer == SvgOptimizerType.SCOUR:
+        return scour.scourString(svg_data.decode('utf-8'), _scour_options()).encode('utf-8')
+    return minify_svg(svg_data)
+
 
+def encode_svg(svg_data: bytes, encoding: Optional[SvgEncodingType] = None, level: Optional[int] = None) -> bytes:
+    encoding = encoding or env.SVG_ENCODING
+    level = env.SVG_COMPRESSION_LEVEL if level is None else level
+    if encoding == SvgEncodingType.GZIP:
+        # mtime=0 keeps the output the same for the same svg
+        return gzip.compress(svg_data, compresslevel=level, mtime=0)
+    if encoding == SvgEncodingType.BROTLI:
+        if brotli is None:
+            raise RuntimeError('brotli is not installed')
+        return brotli.compress(svg_data, mode=brotli.MODE_TEXT, quality=level)
+    return svg_data
+
+
+def decode_svg(svg_data: bytes, encoding: SvgEncodingType) -> bytes:
+    if encoding == SvgEncodingType.GZIP:
+        return gzip.decompress(svg_data)
+    if encoding == SvgEncodingType.BROTLI:
+        if brotli is None:
+            raise RuntimeError('brotli is not installed')
+        return brotli.decompress(svg_data)
+    return svg_data
+
+
+def preprocess_image(image_data: Union[bytes, ImageContext]) -> bytes:
+    context = ImageContext.of(image_data)
+    width, height = max(context.width // 2, 100), max(context.height // 2, 100)
+
+    if context.format == 'JPEG':
+        image = context.decode('L', (width, height))
+    elif (width, height) == (context.width // 2, context.height // 2):
+        # box reduction by 2 instead of a general resample, odd edges are cropped so the size stays width // 2
+        image = context.pixels
+        if image.mode not in REDUCIBLE_MODES:
+            image = image.convert('L')
+        image = image.reduce(2, box=(0, 0, width * 2, height * 2))
+    else:
+        image = context.pixels
 
-def preprocess_image(image_data: bytes) -> bytes:
-    image = Image.open(BytesIO(image_data))
-    resized_image = resize_image(image, image.width // 2, image.height // 2)
-    grayscale_image = resized_image.convert('L')
+    if image.size != (width, height):
+        image = resize_image(image, width, height)
+    grayscale_image = image if image.mode == 'L' else image.convert('L')
+    context.perceptual_hash = compute_perceptual_hash(grayscale_image)
     output = BytesIO()
-    grayscale_image.save(output, image.format)
-    return output.getvalue()
+    grayscale_image.save(output, context.format)
+    context.preprocessed = ImageContext(output.getvalue())
+    return context.preprocessed.data
 
 
-def process_image(image_data: bytes) -> bytes:
-    svg_data = convert_image_to_svg(image_data)
+def process_image(image_data: bytes, tolerance: float = 0.0, min_area: float = 0.0) -> bytes:
+    svg_data = convert_image_to_svg(image_data, tolerance, min_area)
     optimized_svg_data = optimize_svg(svg_data)
     return optimized_svg_data
 
 
 def create_save_path(image_type: str) -> str:
-    # 이미지타입/날짜/타입스탬프-난수(5자리)-난수(3자리)-난수(1자리).확장자
-    file_name = f'{datetime.now().strftime("%Y%m%d%H%M%S")}-{random.randint(10000, 99999)}-{random.randint(100, 999)}-{random.randint(0, 9)}'
-    return f'{image_type.upper()}/{datetime.now().strftime("%Y%m%d")}/{file_name}.{image_type}'
+    # 이미지타입/샤드/uuid.확장자, 샤드는 uuid의 앞 글자라 쓰기가 키 공간 전체에 고르게 퍼집니다.
+    # 날짜로 시작하던 기존 키(이미지타입/날짜/타임스탬프-난수.확장자)도 그대로 조회됩니다.
+    file_name = uuid.uuid4().hex
+    shard = file_name[: env.STORAGE_KEY_SHARD_LENGTH]
+    prefix = f'{image_type.upper()}/{shard}' if shard else image_type.upper()
+    return f'{prefix}/{file_name}.{image_type}'
@@ -1,7 +1,7 @@
 from app.config.database import engine
-from app.model.image import Image, ProcessingLog
+from app.model.image import Image, ImagePerceptualHash, ProcessingLog
 
 
 def create_tables():
-    for model in [Image, ProcessingLog]:
+    for model in [Image, ProcessingLog, ImagePerceptualHash]:
         model.metadata.create_all(engine)
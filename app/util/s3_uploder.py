@@ -1,21 +1,96 @@
+import io
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from typing import BinaryIO, Iterable, Iterator, Optional, Union
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 
 from app.config.env import env
+from app.util.helper import batched
+from app.util.storage import FileMetadata, Storage
 
+DELETE_BATCH_SIZE = 1000  # keys per delete_objects request, the s3 maximum
 
-class S3Uploader:
+# buckets this process has already seen or created, create_bucket checks each one once
+_known_buckets: set[str] = set()
+
+
+@cache
+def get_s3_client():
+    # one client per process, boto3 clients are thread safe and keep a pool of open connections
+    return boto3.client(
+        's3',
+        aws_access_key_id=env.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=env.AWS_SECRET_ACCESS_KEY,
+        region_name=env.AWS_DEFAULT_REGION,
+        config=Config(max_pool_connections=env.S3_MAX_POOL_CONNECTIONS, tcp_keepalive=True),
+    )
+
+
+@cache
+def get_transfer_config() -> TransferConfig:
+    # above the threshold, uploads are multipart and downloads are ranged GETs, both run concurrently,
+    # at most one buffered part per thread is held in memory
+    config = TransferConfig(
+        multipart_threshold=env.S3_MULTIPART_THRESHOLD,
+        multipart_chunksize=env.S3_MULTIPART_CHUNKSIZE,
+        max_concurrency=env.S3_TRANSFER_CONCURRENCY,
+    )
+    # s3transfer options that boto3 does not take as arguments
+    config.max_in_memory_upload_chunks = env.S3_TRANSFER_CONCURRENCY
+    config.max_in_memory_download_chunks = env.S3_TRANSFER_CONCURRENCY
+    return config
+
+
+class IteratorReader(io.RawIOBase):
+    """
+    File-like view of an iterator of byte chunks, holds at most one chunk
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer:
+            self._buffer = next(self._chunks, None)
+            if self._buffer is None:
+                self._buffer = b''
+                return 0
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def _reset_after_fork() -> None:
+    # celery and multiprocessing workers fork, a child must not share the parent's sockets
+    get_s3_client.cache_clear()
+    _known_buckets.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class S3Uploader(Storage):
     def __init__(self):
-        self.s3 = boto3.client(
-            's3',
-            aws_access_key_id=env.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=env.AWS_SECRET_ACCESS_KEY,
-            region_name=env.AWS_DEFAULT_REGION,
-        )
+        self.s3 = get_s3_client()
 
     def _has_bucket(self, bucket_name: str) -> bool:
-        return any([bucket['Name'] == bucket_name for bucket in self.s3.list_buckets()['Buckets']])
+        try:
+            self.s3.head_bucket(Bucket=bucket_name)
+            return True
+        except self.s3.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchBucket'):
+                return False
+            raise e
 
     def _has_file(self, bucket_name: str, file_name: str) -> bool:
         try:
@@ -26,33 +101,120 @@ class S3Uploader:
                 return False
             raise e
 
-    def create_bucket(self, bucket_name: str) -> None:
+    def create_bucket(self, bucket_name: str) -> str:
+        if bucket_name in _known_buckets:
+            return bucket_name
+
         # check existing bucket name
         if self._has_bucket(bucket_name):
             logging.info(f'{bucket_name} already exists')
+            _known_buckets.add(bucket_name)
             return bucket_name
 
         # create bucket
         self.s3.create_bucket(Bucket=bucket_name, CreateBucketConfiguration={'LocationConstraint': 'ap-northeast-2'})
         logging.info(f'{bucket_name} is created')
+        _known_buckets.add(bucket_name)
         return bucket_name
 
     def delete_bucket(self, bucket_name: str) -> None:
-        response = self.s3.list_objects_v2(Bucket=bucket_name)
-        if 'Contents' in response:
-            for obj in response['Contents']:
-                self.s3.delete_object(Bucket=bucket_name, Key=obj['Key'])
+        self.delete_files(bucket_name, self.list_files(bucket_name))
 
         self.s3.delete_bucket(Bucket=bucket_name)
+        _known_buckets.discard(bucket_name)
         logging.info(f'{bucket_name} is deleted')
 
-    def upload_file(self, bucket_name: str, file_name: str, file_data: bytes) -> str:
-        self.s3.put_object(Bucket=bucket_name, Key=file_name, Body=file_data)
+    def get_url(self, bucket_name: str, file_name: str) -> str:
         return f'https://{bucket_name}.s3.{env.AWS_DEFAULT_REGION}.amazonaws.com/{file_name}'
 
+    def _extra_args(self, metadata: Optional[FileMetadata]) -> dict:
+        # sent as the Content-Type and Content-Encoding headers of every GET
+        if metadata is None:
+            return {}
+        extra_args = {'ContentType': metadata.content_type, 'ContentEncoding': metadata.content_encoding}
+        return {key: value for key, value in extra_args.items() if value}
+
+    def upload_file(
+        self, bucket_name: str, file_name: str, file_data: bytes, metadata: Optional[FileMetadata] = None
+    ) -> str:
+        self.s3.put_object(Bucket=bucket_name, Key=file_name, Body=file_data, **self._extra_args(metadata))
+        return self.get_url(bucket_name, file_name)
+
+    def upload_stream(
+        self,
+        bucket_name: str,
+        file_name: str,
+        stream: Union[BinaryIO, Iterable[bytes]],
+        size: Optional[int] = None,
+        metadata: Optional[FileMetadata] = None,
+    ) -> str:
+        # small bodies of known size take one put_object, anything else goes through the managed transfer
+        if size is not None and size < env.S3_MULTIPART_THRESHOLD:
+            body = stream.read() if hasattr(stream, 'read') else b''.join(stream)
+            return self.upload_file(bucket_name, file_name, body, metadata)
+        fileobj = stream if hasattr(stream, 'read') else io.BufferedReader(IteratorReader(stream))
+        self.s3.upload_fileobj(
+            fileobj,
+            bucket_name,
+            file_name,
+            ExtraArgs=self._extra_args(metadata),
+            Config=get_transfer_config(),
+        )
+        return self.get_url(bucket_name, file_name)
+
+    def create_upload_url(self, bucket_name: str, file_name: str, expires_in: int) -> str:
+        # presigned PUT, the client uploads straight to the bucket without credentials
+        return self.s3.generate_presigned_url(
+            'put_object', Params={'Bucket': bucket_name, 'Key': file_name}, ExpiresIn=expires_in
+        )
+
+    def get_file_size(self, bucket_name: str, file_name: str) -> Optional[int]:
+        try:
+            return self.s3.head_object(Bucket=bucket_name, Key=file_name)['ContentLength']
+        except self.s3.exceptions.ClientError as e:
+            if e.response['Error']['Code'] == '404':
+                return None
+            raise e
+
+    def download_file_head(self, bucket_name: str, file_name: str, size: int) -> bytes:
+        response = self.s3.get_object(Bucket=bucket_name, Key=file_name, Range=f'bytes=0-{size - 1}')
+        return response['Body'].read()
+
+    def list_files(self, bucket_name: str, prefix: str = '') -> Iterator[str]:
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                yield obj['Key']
+
     def delete_file(self, bucket_name: str, file_name: str) -> None:
         self.s3.delete_object(Bucket=bucket_name, Key=file_name)
 
+    def _delete_batch(self, bucket_name: str, file_names: list[str]) -> list[str]:
+        response = self.s3.delete_objects(
+            Bucket=bucket_name, Delete={'Objects': [{'Key': name} for name in file_names], 'Quiet': True}
+        )
+        errors = response.get('Errors', [])
+        for error in errors:
+            logging.error(f'{error["Key"]} is not deleted: {error["Message"]}')
+        return [error['Key'] for error in errors]
+
+    def delete_files(self, bucket_name: str, file_names: Iterable[str]) -> list[str]:
+        # delete_objects takes up to 1000 keys, the batches are sent concurrently while the keys are still listed
+        with ThreadPoolExecutor(max_workers=env.S3_TRANSFER_CONCURRENCY) as executor:
+            futures = [
+                executor.submit(self._delete_batch, bucket_name, batch)
+                for batch in batched(file_names, DELETE_BATCH_SIZE)
+            ]
+            return [name for future in futures for name in future.result()]
+
     def download_file(self, bucket_name: str, file_name: str) -> bytes:
         response = self.s3.get_object(Bucket=bucket_name, Key=file_name)
         return response['Body'].read()
+
+    def download_stream(self, bucket_name: str, file_name: str, output: BinaryIO) -> None:
+        # output must be seekable, the ranged parts are written at their offsets
+        self.s3.download_fileobj(bucket_name, file_name, output, Config=get_transfer_config())
+
+    def iter_file(self, bucket_name: str, file_name: str, chunk_size: int = 1024 * 64) -> Iterator[bytes]:
+        response = self.s3.get_object(Bucket=bucket_name, Key=file_name)
+        yield from response['Body'].iter_chunks(chunk_size)
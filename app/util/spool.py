@@ -0,0 +1,20 @@
+from pathlib import Path
+from typing import Optional
+
+from app.util.helper import write_atomic
+
+
+def write_spool(spool_dir: str, name: str, data: bytes) -> None:
+    write_atomic(Path(spool_dir, name), [data])
+
+
+def read_spool(spool_dir: str, name: str) -> Optional[bytes]:
+    # the file stays until remove_spool, a worker failing after the read leaves it in place
+    try:
+        return Path(spool_dir, name).read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def remove_spool(spool_dir: str, name: str) -> None:
+    Path(spool_dir, name).unlink(missing_ok=True)
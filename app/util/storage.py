@@ -0,0 +1,209 @@
+import logging
+import os
+import shutil
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, NamedTuple, Optional, Union
+
+from app.config.env import env
+from app.exception.image import NotSupportedUploadException
+from app.schema.enum.exception import ErrorType
+from app.schema.enum.image import StorageBackendType
+from app.util.helper import write_atomic
+
+
+class FileMetadata(NamedTuple):
+    content_type: Optional[str] = None
+    content_encoding: Optional[str] = None
+
+
+class Storage(ABC):
+    """
+    Object storage used by the service and the worker, files are addressed by bucket and key
+    """
+
+    @abstractmethod
+    def create_bucket(self, bucket_name: str) -> str:
+        pass
+
+    @abstractmethod
+    def delete_bucket(self, bucket_name: str) -> None:
+        pass
+
+    @abstractmethod
+    def get_url(self, bucket_name: str, file_name: str) -> str:
+        pass
+
+    def get_file_name(self, bucket_name: str, url: str) -> Optional[str]:
+        prefix = self.get_url(bucket_name, '')
+        return url[len(prefix) :] if url.startswith(prefix) else None
+
+    @abstractmethod
+    def upload_file(
+        self, bucket_name: str, file_name: str, file_data: bytes, metadata: Optional[FileMetadata] = None
+    ) -> str:
+        pass
+
+    @abstractmethod
+    def upload_stream(
+        self,
+        bucket_name: str,
+        file_name: str,
+        stream: Union[BinaryIO, Iterable[bytes]],
+        size: Optional[int] = None,
+        metadata: Optional[FileMetadata] = None,
+    ) -> str:
+        pass
+
+    @abstractmethod
+    def create_upload_url(self, bucket_name: str, file_name: str, expires_in: int) -> str:
+        pass
+
+    @abstractmethod
+    def get_file_size(self, bucket_name: str, file_name: str) -> Optional[int]:
+        pass
+
+    @abstractmethod
+    def download_file(self, bucket_name: str, file_name: str) -> bytes:
+        pass
+
+    @abstractmethod
+    def download_file_head(self, bucket_name: str, file_name: str, size: int) -> bytes:
+        pass
+
+    @abstractmethod
+    def download_stream(self, bucket_name: str, file_name: str, output: BinaryIO) -> None:
+        pass
+
+    @abstractmethod
+    def iter_file(self, bucket_name: str, file_name: str, chunk_size: int = 1024 * 64) -> Iterator[bytes]:
+        pass
+
+    @abstractmethod
+    def list_files(self, bucket_name: str, prefix: str = '') -> Iterator[str]:
+        pass
+
+    @abstractmethod
+    def delete_file(self, bucket_name: str, file_name: str) -> None:
+        pass
+
+    @abstractmethod
+    def delete_files(self, bucket_name: str, file_names: Iterable[str]) -> list[str]:
+        pass
+
+
+class LocalStorage(Storage):
+    """
+    Buckets are directories under env.LOCAL_STORAGE_DIR, files are served by the /api/v1/files route.
+    Metadata is not kept, the route derives the content type and encoding from the key
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = Path(root or env.LOCAL_STORAGE_DIR)
+
+    def get_bucket_path(self, bucket_name: str) -> Path:
+        root = self.root.resolve()
+        bucket_path = (root / bucket_name).resolve()
+        # bucket names come from urls as well, a bucket is always a directory directly under the root
+        if bucket_path.parent != root:
+            raise ValueError(f'{bucket_name} is not a valid bucket')
+        return bucket_path
+
+    def get_path(self, bucket_name: str, file_name: str) -> Path:
+        bucket_path = self.get_bucket_path(bucket_name)
+        path = (bucket_path / file_name).resolve()
+        # keys come from urls, they must not climb out of the bucket
+        if not path.is_relative_to(bucket_path) or path == bucket_path:
+            raise ValueError(f'{file_name} is not a valid key')
+        return path
+
+    def get_file_path(self, bucket_name: str, file_name: str) -> Optional[Path]:
+        # a stored file, None for missing files, invalid keys and uploads still being written
+        try:
+            path = self.get_path(bucket_name, file_name)
+        except ValueError:
+            return None
+        return path if path.is_file() and not path.name.startswith('.') else None
+
+    def create_bucket(self, bucket_name: str) -> str:
+        self.get_bucket_path(bucket_name).mkdir(parents=True, exist_ok=True)
+        return bucket_name
+
+    def delete_bucket(self, bucket_name: str) -> None:
+        shutil.rmtree(self.get_bucket_path(bucket_name), ignore_errors=True)
+        logging.info(f'{bucket_name} is deleted')
+
+    def get_url(self, bucket_name: str, file_name: str) -> str:
+        return f'{env.LOCAL_STORAGE_URL}/{bucket_name}/{file_name}'
+
+    def upload_file(
+        self, bucket_name: str, file_name: str, file_data: bytes, metadata: Optional[FileMetadata] = None
+    ) -> str:
+        write_atomic(self.get_path(bucket_name, file_name), [file_data])
+        return self.get_url(bucket_name, file_name)
+
+    def upload_stream(
+        self,
+        bucket_name: str,
+        file_name: str,
+        stream: Union[BinaryIO, Iterable[bytes]],
+        size: Optional[int] = None,
+        metadata: Optional[FileMetadata] = None,
+    ) -> str:
+        chunks = iter(lambda: stream.read(1024 * 64), b'') if hasattr(stream, 'read') else stream
+        write_atomic(self.get_path(bucket_name, file_name), chunks)
+        return self.get_url(bucket_name, file_name)
+
+    def create_upload_url(self, bucket_name: str, file_name: str, expires_in: int) -> str:
+        raise NotSupportedUploadException(ErrorType.PRESIGNED_UPLOAD_NOT_SUPPORTED)
+
+    def get_file_size(self, bucket_name: str, file_name: str) -> Optional[int]:
+        try:
+            return self.get_path(bucket_name, file_name).stat().st_size
+        except FileNotFoundError:
+            return None
+
+    def download_file(self, bucket_name: str, file_name: str) -> bytes:
+        return self.get_path(bucket_name, file_name).read_bytes()
+
+    def download_file_head(self, bucket_name: str, file_name: str, size: int) -> bytes:
+        with self.get_path(bucket_name, file_name).open('rb') as f:
+            return f.read(size)
+
+    def download_stream(self, bucket_name: str, file_name: str, output: BinaryIO) -> None:
+        with self.get_path(bucket_name, file_name).open('rb') as f:
+            shutil.copyfileobj(f, output)
+
+    def iter_file(self, bucket_name: str, file_name: str, chunk_size: int = 1024 * 64) -> Iterator[bytes]:
+        with self.get_path(bucket_name, file_name).open('rb') as f:
+            yield from iter(lambda: f.read(chunk_size), b'')
+
+    def list_files(self, bucket_name: str, prefix: str = '') -> Iterator[str]:
+        bucket_path = self.get_bucket_path(bucket_name)
+        for root, _, files in os.walk(bucket_path):
+            for file in sorted(files):
+                key = Path(root, file).relative_to(bucket_path).as_posix()
+                if key.startswith(prefix) and not file.startswith('.'):
+                    yield key
+
+    def delete_file(self, bucket_name: str, file_name: str) -> None:
+        self.get_path(bucket_name, file_name).unlink(missing_ok=True)
+
+    def delete_files(self, bucket_name: str, file_names: Iterable[str]) -> list[str]:
+        failed = []
+        for file_name in file_names:
+            try:
+                self.delete_file(bucket_name, file_name)
+            except (OSError, ValueError) as e:
+                logging.error(f'{file_name} is not deleted: {e}')
+                failed.append(file_name)
+        return failed
+
+
+def get_storage() -> Storage:
+    # S3Uploader implements Storage, so it is imported here rather than at the top
+    from app.util.s3_uploder import S3Uploader
+
+    if env.STORAGE_BACKEND == StorageBackendType.LOCAL:
+        return LocalStorage()
+    return S3Uploader()
@@ -0,0 +1,329 @@
+import re
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+
+SVG_HEADER = (
+    '<?xml version="1.0" encoding="utf-8" ?>\n'
+    '<svg baseProfile="full" height="{height}" version="1.1" width="{width}" xmlns="http://www.w3.org/2000/svg">'
+)
+SVG_FOOTER = '</svg>'
+
+
+def _digits(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # render non-negative integers as a fixed-width ascii matrix and a mask that drops the leading zeros
+    values = values.astype(np.int64, copy=False)
+    width = len(str(int(values.max()))) if values.size else 1
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    digits = (values[:, None] // powers % 10 + ord('0')).astype(np.uint8)
+    mask = powers[None, :] <= np.maximum(values, 1)[:, None]
+    return digits, mask
+
+
+def _literal(char: str, mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    return np.full((mask.shape[0], 1), ord(char), dtype=np.uint8), mask.reshape(-1, 1)
+
+
+def _join_columns(columns: Sequence[tuple[np.ndarray, np.ndarray]]) -> bytes:
+    # every row is one token group, masked cells are dropped before the bytes are emitted row by row
+    chars = np.hstack([chars for chars, _ in columns])
+    mask = np.hstack([mask for _, mask in columns])
+    return chars[mask].tobytes()
+
+
+def contour_depths(hierarchy: np.ndarray) -> np.ndarray:
+    # depth of each contour in the RETR_TREE hierarchy, one vectorized step per nesting level
+    parents = hierarchy.reshape(-1, 4)[:, 3]
+    depths = np.zeros(len(parents), dtype=np.int64)
+    current = parents.copy()
+    nested = current >= 0
+    while nested.any():
+        depths[nested] += 1
+        current[nested] = parents[current[nested]]
+        nested = current >= 0
+    return depths
+
+
+def contour_areas(contours: Sequence[np.ndarray]) -> np.ndarray:
+    # shoelace formula over all contours at once, same values as cv2.contourArea (contours are never empty)
+    lengths = np.fromiter((len(contour) for contour in contours), dtype=np.int64, count=len(contours))
+    if not len(lengths):
+        return np.zeros(0, dtype=np.float64)
+
+    points = np.concatenate(contours).reshape(-1, 2).astype(np.float64)
+    starts = np.cumsum(lengths) - lengths
+    following = np.arange(1, len(points) + 1)
+    following[starts + lengths - 1] = starts
+    cross = points[:, 0] * points[following, 1] - points[following, 0] * points[:, 1]
+    return np.abs(np.add.reduceat(cross, starts)) / 2
+
+
+def contours_to_path_data(contours: Sequence[np.ndarray]) -> bytes:
+    # 'Mx y x y ... Z' per contour, the implicit lineto after M keeps the data compact
+    contours = [contour for contour in contours if len(contour)]
+    if not contours:
+        return b''
+
+    lengths = np.fromiter((len(contour) for contour in contours), dtype=np.int64, count=len(contours))
+    points = np.concatenate(contours).reshape(-1, 2)
+    ends = np.cumsum(lengths) - 1
+    is_start = np.zeros(len(points), dtype=bool)
+    is_start[ends - lengths + 1] = True
+    is_end = np.zeros(len(points), dtype=bool)
+    is_end[ends] = True
+
+    always = np.ones(len(points), dtype=bool)
+    prefix = np.where(is_start, ord('M'), ord(' ')).astype(np.uint8).reshape(-1, 1), always.reshape(-1, 1)
+    return _join_columns([
+        prefix,
+        _digits(points[:, 0]),
+        _literal(' ', always),
+        _digits(points[:, 1]),
+        _literal('Z', is_end),
+    ])
+
+
+def bitmap_to_path_data(mask: np.ndarray) -> bytes:
+    # run-length encode every row, each run of set pixels becomes one 'Mx yh{length}v1h-{length}z' rectangle
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask.astype(bool)
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    if not len(rows):
+        return b''
+
+    lengths = ends - starts
+    always = np.ones(len(rows), dtype=bool)
+    return _join_columns([
+        _literal('M', always),
+        _digits(starts),
+        _literal(' ', always),
+        _digits(rows),
+        _literal('h', always),
+        _digits(lengths),
+        _literal('v', always),
+        _literal('1', always),
+        _literal('h', always),
+        _literal('-', always),
+        _digits(lengths),
+        _literal('z', always),
+    ])
+
+
+def path_element(path_data: bytes, **attributes: str) -> bytes:
+    attrs = ''.join(f' {name}="{value}"' for name, value in sorted(attributes.items()))
+    return b'<path d="' + path_data + b'"' + attrs.encode('utf-8') + b' />'
+
+
+def rect_element(x: int, y: int, width: int, height: int, **attributes: str) -> bytes:
+    attrs = ''.join(f' {name}="{value}"' for name, value in sorted(attributes.items()))
+    return f'<rect height="{height}" width="{width}" x="{x}" y="{y}"{attrs} />'.encode('utf-8')
+
+
+def build_svg(width: int, height: int, elements: Iterable[bytes]) -> bytes:
+    header = SVG_HEADER.format(width=width, height=height).encode('utf-8')
+    return header + b''.join(elements) + SVG_FOOTER.encode('utf-8')
+
+
+# minifier tokens, matched in a single left-to-right pass over the document
+_SVG_TOKEN = re.compile(
+    r'(?P<comment><!--.*?-->)'
+    r'|(?P<prolog><\?.*?\?>|<!DOCTYPE[^>]*>)'
+    r'|(?P<cdata><!\[CDATA\[.*?\]\]>)'
+    r'|</(?P<close>[\w:.-]+)\s*>'
+    r'|<(?P<open>[\w:.-]+)(?P<attributes>(?:\s+[\w:.-]+\s*=\s*(?:"[^"]*"|\'[^\']*\'))*)\s*(?P<empty>/?)>'
+    r'|(?P<text>[^<]+)'
+    r'|(?P<other><)',
+    re.S,
+)
+_SVG_ATTRIBUTE = re.compile(r'([\w:.-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+_NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+_PATH_TOKEN = re.compile(r'([MmZzLlHhVvCcSsQqTt])|([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)')
+_PATH_ARC = re.compile(r'[Aa]')
+_POLYGON_PATH = re.compile(r'(?:\s*M[\d\s]+Z)+\s*')
+_IMPLICIT_PATH_COMMAND = {'M': 'L', 'm': 'l'}
+_DESCRIPTIVE_ELEMENTS = {'metadata', 'title', 'desc'}
+_CONTAINER_ELEMENTS = {'g', 'defs'}
+_DROPPED_ATTRIBUTES = {'baseProfile'}
+_COLORS = {'black': '#000', 'white': '#fff', '#000000': '#000', '#ffffff': '#fff'}
+
+
+def shorten_number(number: str) -> str:
+    # lossless: only the sign, leading and trailing zeros are removed
+    sign = '-' if number[0] == '-' else ''
+    number = number.lstrip('+-')
+    if 'e' in number or 'E' in number:
+        return sign + number
+    if '.' in number:
+        number = number.rstrip('0').rstrip('.')
+    number = number.lstrip('0')
+    if not number:
+        return '0'
+    return sign + number
+
+
+def _masked(column: tuple[np.ndarray, np.ndarray], rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    chars, mask = column
+    return chars, mask & rows.reshape(-1, 1)
+
+
+def _signed(values: np.ndarray, rows: np.ndarray) -> list[tuple[np.ndarray, np.ndarray]]:
+    return [_literal('-', rows & (values < 0)), _masked(_digits(np.abs(values)), rows)]
+
+
+def _compact_polygon_path(path_data: str) -> Optional[bytes]:
+    # integer 'Mx y x y ... Z' subpaths, as written by contours_to_path_data, are rewritten with relative
+    # m/l/h/v commands in bulk, points that do not move the pen are dropped
+    raw = np.frombuffer(path_data.encode('ascii'), dtype=np.uint8)
+    numbers = np.fromstring(re.sub(r'[MZ]', ' ', path_data), dtype=np.int64, sep=' ')
+    is_digit = (raw >= ord('0')) & (raw <= ord('9'))
+    number_starts = np.cumsum(is_digit & ~np.concatenate(([False], is_digit[:-1])))
+    counts = np.diff(np.append(number_starts[raw == ord('M')], number_starts[-1]))
+    if (counts % 2).any() or not counts.all():
+        return None
+    lengths = counts // 2
+
+    points = numbers.reshape(-1, 2)
+    x, y = points[:, 0], points[:, 1]
+    ends = np.cumsum(lengths) - 1
+    starts = ends - lengths + 1
+    is_start = np.zeros(len(points), dtype=bool)
+    is_start[starts] = True
+    subpath = np.repeat(np.arange(len(lengths)), lengths)
+
+    dx = np.diff(x, prepend=0)
+    dy = np.diff(y, prepend=0)
+    # a subpath moves relative to the start of the previous one, 'z' returns the pen there
+    previous_start = np.concatenate(([0], starts[:-1]))
+    dx[starts] = x[starts] - np.where(np.arange(len(starts)) > 0, x[previous_start], 0)
+    dy[starts] = y[starts] - np.where(np.arange(len(starts)) > 0, y[previous_start], 0)
+
+    closes_at_start = (x == x[starts][subpath]) & (y == y[starts][subpath])
+    is_end = np.zeros(len(points), dtype=bool)
+    is_end[ends] = True
+    kept = is_start | ~(((dx == 0) & (dy == 0)) | (is_end & closes_at_start))
+
+    dx, dy, is_start, subpath = dx[kept], dy[kept], is_start[kept], subpath[kept]
+    command = np.where(is_start, ord('m'), np.where(dy == 0, ord('h'), np.where(dx == 0, ord('v'), ord('l'))))
+    implicit = np.where(is_start, ord('l'), command)
+    write_command = is_start | (command != np.concatenate(([0], implicit[:-1])))
+    first = np.where(command == ord('v'), dy, dx)
+    has_second = (command == ord('m')) | (command == ord('l'))
+    is_last = np.append(subpath[1:] != subpath[:-1], True)
+
+    always = np.ones(len(dx), dtype=bool)
+    command_column = command.astype(np.uint8).reshape(-1, 1), write_command.reshape(-1, 1)
+    return _join_columns([
+        command_column,
+        _literal(' ', ~write_command & (first >= 0)),
+        *_signed(first, always),
+        _literal(' ', has_second & (dy >= 0)),
+        *_signed(dy, has_second),
+        _literal('z', is_last),
+    ])
+
+
+def compact_path_data(path_data: str) -> str:
+    compacted = _compact_polygon_path(path_data) if _POLYGON_PATH.fullmatch(path_data) else None
+    if compacted is not None:
+        return compacted.decode('ascii')
+    if _PATH_ARC.search(path_data):
+        # arc flags may be written without separators, leave those paths tokenized as they are
+        return ' '.join(path_data.split())
+
+    output = []
+    current_command = None
+    previous_number = None
+    for command, number in _PATH_TOKEN.findall(path_data):
+        if command:
+            # a repeated command, or a lineto right after a moveto, is implicit
+            if command == current_command and command not in 'Zz':
+                continue
+            output.append(command)
+            current_command = _IMPLICIT_PATH_COMMAND.get(command, command)
+            previous_number = None
+            continue
+
+        number = shorten_number(number)
+        if previous_number is not None and not (
+            number[0] == '-' or (number[0] == '.' and ('.' in previous_number or 'e' in previous_number.lower()))
+        ):
+            output.append(' ')
+        output.append(number)
+        previous_number = number
+    return ''.join(output)
+
+
+def _minify_attribute(name: str, value: str) -> str:
+    if name == 'd':
+        return compact_path_data(value)
+    if name == 'points':
+        return ' '.join(shorten_number(number) for number in _NUMBER.findall(value))
+    if _NUMBER.fullmatch(value.strip()):
+        return shorten_number(value.strip())
+    return _COLORS.get(value.strip().lower(), value)
+
+
+def minify_svg(svg_data: bytes) -> bytes:
+    text = svg_data.decode('utf-8')
+    unused_prefixes = {
+        prefix
+        for prefix in re.findall(r'xmlns:([\w.-]+)\s*=', text)
+        if not re.search(rf'[\s<"\']{re.escape(prefix)}:', text)
+    }
+
+    output = []
+    skipped_depth = 0  # inside a descriptive element that is dropped with its children
+    written_groups = []  # per open <g>, whether its tag was written
+    open_container = None  # (tag, index) of the last container written, to drop it again if it stays empty
+    for token in _SVG_TOKEN.finditer(text):
+        tag = token.group('open')
+        if tag is not None:
+            empty = bool(token.group('empty'))
+            if skipped_depth or tag in _DESCRIPTIVE_ELEMENTS:
+                skipped_depth += not empty
+                continue
+
+            attributes = []
+            for name, double_quoted, single_quoted in _SVG_ATTRIBUTE.findall(token.group('attributes')):
+                if name in _DROPPED_ATTRIBUTES or name.partition('xmlns:')[2] in unused_prefixes:
+                    continue
+                value = _minify_attribute(name, double_quoted or single_quoted)
+                attributes.append(f"{name}='{value}'" if '"' in value else f'{name}="{value}"')
+
+            if tag in _CONTAINER_ELEMENTS and (empty or (tag == 'g' and not attributes)):
+                # empty containers are dropped, attribute-less groups are collapsed into their parent
+                if not empty:
+                    written_groups.append(False)
+                continue
+            if tag == 'g':
+                written_groups.append(True)
+
+            output.append(f'<{" ".join([tag, *attributes])}{"/" if empty else ""}>')
+            open_container = (tag, len(output) - 1) if tag in _CONTAINER_ELEMENTS and not empty else None
+            continue
+
+        tag = token.group('close')
+        if tag is not None:
+            if skipped_depth:
+                skipped_depth -= 1
+                continue
+            if tag == 'g' and written_groups and not written_groups.pop():
+                continue
+            if open_container == (tag, len(output) - 1):
+                output.pop()
+            else:
+                output.append(f'</{tag}>')
+            open_container = None
+            continue
+
+        if skipped_depth or token.group('comment') or token.group('prolog'):
+            continue
+        content = token.group(0)
+        if token.group('text') is not None and not content.strip():
+            continue
+        output.append(content)
+        open_container = None
+
+    return ''.join(output).encode('utf-8')
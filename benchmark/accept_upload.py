@@ -0,0 +1,45 @@
+import asyncio
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from app.api.v1 import images
+from app.config.env import env
+from benchmark.helper import create_photo
+from benchmark.upload import create_app, patch_storage
+
+REQUESTS = 20
+
+
+async def post(path: str, files: list) -> float:
+    transport = httpx.ASGITransport(app=create_app(images.upload_multiple_images))
+    latencies = []
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as http:
+        for _ in range(REQUESTS):
+            started = time.perf_counter()
+            (await http.post(path, files=files)).raise_for_status()
+            latencies.append(time.perf_counter() - started)
+    return float(np.percentile(latencies, 50))
+
+
+def main():
+    # s3 put_object is a fixed 50 ms, the broker is a no-op and the spool is a temporary directory
+    patch_storage()
+    images.process_image_task.apply_async = lambda *args, **kwargs: None
+    env.SPOOL_DIR = tempfile.mkdtemp()
+
+    for width, height in [(640, 480), (2000, 1500), (4000, 3000)]:
+        # nothing is ever converted here, so the repeated upload is never deduplicated
+        files = [('files', ('image.jpg', create_photo(width, height), 'image/jpeg'))]
+        sync_p50 = asyncio.run(post('/api/v1/images/?mode=sync', files))
+        accept_p50 = asyncio.run(post('/api/v1/images/?mode=accept', files))
+        print(
+            f'{width:>4}x{height:<4} {len(files[0][1][1]) / 1024:7.0f} KB  '
+            f'sync p50: {sync_p50 * 1000:7.1f} ms  accept p50: {accept_p50 * 1000:6.1f} ms'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.api.v1 import images
+from benchmark.helper import create_photo
+from benchmark.upload import create_app, patch_storage
+
+IMAGE_COUNT = 60
+
+
+async def post(app, path: str, requests: list) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as http:
+        started = time.perf_counter()
+        for files in requests:
+            (await http.post(path, files=files)).raise_for_status()
+        return time.perf_counter() - started
+
+
+def main():
+    # the broker is kombu's in-memory transport, so publishing is measured without a redis
+    images.process_image_task.app.conf.broker_url = 'memory://'
+    commits = []
+    event.listen(Session, 'after_commit', lambda session: commits.append(1))
+
+    files = [
+        ('files', (f'{index}.jpg', create_photo(400, 300, seed=index), 'image/jpeg')) for index in range(IMAGE_COUNT)
+    ]
+    for latency in [0.0, 0.05]:
+        patch_storage(latency)
+        for label, endpoint, batch in [
+            ('3 per request', images.upload_multiple_images, 3),
+            ('bulk', images.upload_bulk_images, IMAGE_COUNT),
+        ]:
+            commits.clear()
+            requests = [files[index : index + batch] for index in range(0, IMAGE_COUNT, batch)]
+            elapsed = asyncio.run(post(create_app(endpoint), '/api/v1/images/', requests))
+            print(
+                f'put_object {latency * 1000:3.0f} ms  {label:>13}  {IMAGE_COUNT} images in {len(requests):2} requests  '
+                f'{IMAGE_COUNT / elapsed:6.1f} images/s  commits: {len(commits)}'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+import time
+from io import BytesIO
+from typing import Callable
+
+import cv2
+import numpy as np
+from PIL import Image
+
+
+def measure(func: Callable, *args, repeat: int = 5) -> float:
+    # best of n, in milliseconds
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings)
+
+
+def create_line_art(width: int = 2000, height: int = 2000, shapes: int = 20000, seed: int = 0) -> bytes:
+    # busy binary drawing: many small outlined and filled shapes produce tens of thousands of contours
+    rng = np.random.default_rng(seed)
+    image = np.zeros((height, width), np.uint8)
+    for x, y, radius, filled in zip(
+        rng.integers(0, width, shapes),
+        rng.integers(0, height, shapes),
+        rng.integers(2, 12, shapes),
+        rng.integers(0, 2, shapes),
+    ):
+        cv2.circle(image, (int(x), int(y)), int(radius), 255, -1 if filled else 1)
+    _, encoded = cv2.imencode('.png', image)
+    return encoded.tobytes()
+
+
+def create_photo(width: int = 4000, height: int = 3000, image_format: str = 'JPEG', seed: int = 0) -> bytes:
+    # smooth gradients with noise, closer to a camera upload than a flat fill
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None] * np.ones((height, 1, 3), np.float32)
+    noise = rng.normal(0, 20, (height, width, 3)).astype(np.float32)
+    pixels = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+    output = BytesIO()
+    Image.fromarray(pixels).save(output, image_format)
+    return output.getvalue()
@@ -0,0 +1,26 @@
+from io import BytesIO
+
+from PIL import Image
+
+from app.util.image_util import read_image_header
+from benchmark.helper import measure
+
+
+def pil_sniff(image_data: bytes):
+    image = Image.open(BytesIO(image_data))
+    return image.format, image.width, image.height, image.mode
+
+
+def main():
+    for image_format in ['JPEG', 'PNG']:
+        output = BytesIO()
+        Image.new('RGB', (4000, 3000), 'white').save(output, image_format)
+        image_data = output.getvalue()
+
+        pil_ms = measure(lambda: [pil_sniff(image_data) for _ in range(1000)])
+        header_ms = measure(lambda: [read_image_header(image_data) for _ in range(1000)])
+        print(f'{image_format:>4} x1000  PIL open: {pil_ms:7.1f} ms  header only: {header_ms:7.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
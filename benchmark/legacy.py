@@ -0,0 +1,90 @@
+"""
+implementations replaced by optimizations, kept only as the baseline for the benchmarks
+"""
+
+from io import BytesIO, StringIO
+
+import boto3
+import cv2
+import numpy as np
+import svgwrite
+from fastapi import Depends, File, UploadFile
+from PIL import Image
+
+from app.api.depedencies import get_image_service
+from app.api.v1.images import deduplicate, preprocess, process_image_task, save
+from app.config.env import env
+from app.schema.dto.image import UploadImageResponse
+from app.schema.enum.image import ImageProcessingType
+from app.service.image import ImageService
+
+
+def convert_image_to_svg(image_data: bytes) -> bytes:
+    img_array = np.frombuffer(image_data, np.uint8)
+    img = cv2.imdecode(img_array, cv2.IMREAD_GRAYSCALE)
+    _, thresh = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY)
+    contours, _ = cv2.findContours(thresh, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    dwg = svgwrite.Drawing(size=(img.shape[1], img.shape[0]))
+
+    if not contours:
+        for y in range(img.shape[0]):
+            for x in range(img.shape[1]):
+                color = 'black' if img[y, x] == 255 else 'white'
+                dwg.add(dwg.rect(insert=(x, y), size=(1, 1), fill=color))
+    else:
+        max_contour = max(contours, key=cv2.contourArea)
+        for contour in contours:
+            points = [(int(point[0][0]), int(point[0][1])) for point in contour]
+            if points:
+                if cv2.contourArea(contour) != cv2.contourArea(max_contour):
+                    if points[0] != points[-1]:
+                        points.append(points[0])
+                    dwg.add(dwg.polygon(points=points, fill='black', stroke='black'))
+                else:
+                    continue
+
+    output_bytes = StringIO()
+    dwg.write(output_bytes)
+    return output_bytes.getvalue().encode('utf-8')
+
+
+def preprocess_image(image_data: bytes) -> bytes:
+    image = Image.open(BytesIO(image_data))
+    resized_image = image.resize((max(image.width // 2, 100), max(image.height // 2, 100)))
+    grayscale_image = resized_image.convert('L')
+    output = BytesIO()
+    grayscale_image.save(output, image.format)
+    return output.getvalue()
+
+
+async def upload_multiple_images(
+    files: list[UploadFile] = File(...), service: ImageService = Depends(get_image_service)
+):
+    # every blocking call ran on the event loop, one image after the other
+    images = service.receive([file.file for file in files])
+    response = []
+    for image in images:
+        duplicated_image_model = deduplicate(service, image)
+        if duplicated_image_model:
+            response.append(duplicated_image_model)
+            continue
+        storage_key, original_url = preprocess(service, image)
+        original_image_model = save(service, image, original_url)
+        if original_image_model.status == ImageProcessingType.READY:
+            process_image_task.apply_async(args=[original_image_model.id, storage_key], ignore_result=True)
+        response.append(original_image_model)
+    return [UploadImageResponse(**item.model_dump()) for item in response]
+
+
+def upload(name: str, image: bytes) -> str:
+    # a new client (and connection pool) per call, and a bucket listing before every put_object
+    s3 = boto3.client(
+        's3',
+        aws_access_key_id=env.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=env.AWS_SECRET_ACCESS_KEY,
+        region_name=env.AWS_DEFAULT_REGION,
+    )
+    if not any(bucket['Name'] == env.BUCKET_NAME for bucket in s3.list_buckets()['Buckets']):
+        s3.create_bucket(Bucket=env.BUCKET_NAME, CreateBucketConfiguration={'LocationConstraint': 'ap-northeast-2'})
+    s3.put_object(Bucket=env.BUCKET_NAME, Key=name, Body=image)
+    return f'https://{env.BUCKET_NAME}.s3.{env.AWS_DEFAULT_REGION}.amazonaws.com/{name}'
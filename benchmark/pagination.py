@@ -0,0 +1,59 @@
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.config.database import Base
+from app.model.image import Image, ProcessingLog
+from app.repository.image import ImageRepository
+from app.schema.dao.image import ImageOutput
+from app.util.helper import decode_cursor
+from benchmark.helper import measure
+
+IMAGES = 200_000
+LIMIT = 20
+DEPTHS = [0, 100, 1000, 5000]  # pages
+
+
+def populate(session) -> None:
+    started = datetime(2024, 1, 1)
+    images = [
+        {'id': uuid.uuid4(), 'original_url': f'PNG/{index}.png', 'created_at': started + timedelta(seconds=index)}
+        for index in range(IMAGES)
+    ]
+    session.execute(insert(Image), images)
+    session.execute(
+        insert(ProcessingLog),
+        [
+            {'id': uuid.uuid4(), 'original_id': image['id'], 'status': status, 'created_at': image['created_at']}
+            for image in images
+            for status in ['ready', 'completed']
+        ],
+    )
+    session.commit()
+
+
+def main():
+    engine = create_engine(f'sqlite:///{tempfile.mktemp()}')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    populate(session)
+    repository = ImageRepository(session, Image, ImageOutput)
+
+    # the cursor of each depth, read once up front
+    cursors, after = {}, None
+    for depth in range(max(DEPTHS) + 1):
+        cursors[depth] = after
+        after = decode_cursor(repository.get_images_after(LIMIT, after).next_cursor)
+
+    print(f'{IMAGES} images, {LIMIT} per page')
+    for depth in DEPTHS:
+        offset_ms = measure(repository.get_images_with_pagination, LIMIT, depth, repeat=3)
+        cursor_ms = measure(repository.get_images_after, LIMIT, cursors[depth], repeat=3)
+        print(f'page {depth:>5}  offset + count: {offset_ms:8.1f} ms  cursor: {cursor_ms:6.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from app.util.image_util import preprocess_image
+from benchmark import legacy
+from benchmark.helper import create_photo, measure
+
+
+def main():
+    for image_format in ['JPEG', 'PNG']:
+        image_data = create_photo(image_format=image_format)
+        legacy_ms = measure(legacy.preprocess_image, image_data)
+        scaled_ms = measure(preprocess_image, image_data)
+
+        # mean absolute difference of the two outputs, on a 0-255 scale
+        before = np.asarray(Image.open(BytesIO(legacy.preprocess_image(image_data))), dtype=np.int16)
+        after = np.asarray(Image.open(BytesIO(preprocess_image(image_data))), dtype=np.int16)
+        difference = np.abs(before - after).mean()
+
+        print(
+            f'{image_format:>4} 4000x3000  resize+convert: {legacy_ms:7.1f} ms  '
+            f'scaled decode: {scaled_ms:7.1f} ms  speedup: {legacy_ms / scaled_ms:.1f}x  mean diff: {difference:.2f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
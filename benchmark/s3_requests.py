@@ -0,0 +1,37 @@
+import time
+
+from botocore.endpoint import Endpoint
+
+from app.service.image import ImageService
+from benchmark import legacy
+
+UPLOADS = 50
+
+# every s3 request, whichever client makes it
+requests = []
+original_send = Endpoint._send
+
+
+def count_send(self, request):
+    requests.append(request.method)
+    return original_send(self, request)
+
+
+def main():
+    # needs a local s3 stand-in, e.g. `moto_server -p 5000` with AWS_ENDPOINT_URL=http://127.0.0.1:5000
+    Endpoint._send = count_send
+    service = ImageService(None, None)
+    for label, upload in [('client per upload', legacy.upload), ('shared client', service.upload)]:
+        requests.clear()
+        started = time.perf_counter()
+        for index in range(UPLOADS):
+            upload(f'benchmark/{index}.png', b'\x89PNG' + bytes(1024))
+        elapsed = (time.perf_counter() - started) * 1000
+        print(
+            f'{label:>17}  {UPLOADS} uploads  requests/upload: {len(requests) / UPLOADS:4.2f}  '
+            f'{elapsed / UPLOADS:5.1f} ms/upload'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import tempfile
+import time
+import tracemalloc
+
+from app.config.env import env
+from app.util.s3_uploder import S3Uploader
+
+SIZE = 1024 * 1024 * 64
+CHUNK = 1024 * 64
+
+
+def chunks():
+    # generated on the fly, like a body read from a socket or a file
+    block = bytes(range(256)) * (CHUNK // 256)
+    for _ in range(SIZE // CHUNK):
+        yield block
+
+
+def measure(func) -> tuple[float, float]:
+    tracemalloc.start()
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1000, peak / 1024 / 1024
+
+
+def main():
+    # needs a local s3 stand-in, e.g. `moto_server -p 5000` with AWS_ENDPOINT_URL=http://127.0.0.1:5000
+    s3_uploader = S3Uploader()
+    s3_uploader.create_bucket(env.BUCKET_NAME)
+    key = 'benchmark/large.bin'
+    cases = [
+        ('put_object', lambda: s3_uploader.upload_file(env.BUCKET_NAME, key, b''.join(chunks()))),
+        ('upload_stream', lambda: s3_uploader.upload_stream(env.BUCKET_NAME, key, chunks())),
+        ('get_object', lambda: s3_uploader.download_file(env.BUCKET_NAME, key)),
+        ('download_stream', lambda: s3_uploader.download_stream(env.BUCKET_NAME, key, tempfile.TemporaryFile())),
+        ('iter_file', lambda: sum(len(chunk) for chunk in s3_uploader.iter_file(env.BUCKET_NAME, key))),
+    ]
+    for label, func in cases:
+        elapsed, peak = measure(func)
+        print(f'{label:>15}  {SIZE // 1024 // 1024} MB  {elapsed:7.1f} ms  peak python memory: {peak:6.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+from app.schema.enum.image import SvgEncodingType
+from app.util.image_util import brotli, convert_image_to_svg, encode_svg, optimize_svg
+from benchmark.helper import create_line_art, measure
+
+LEVELS = {SvgEncodingType.GZIP: [1, 6, 9], SvgEncodingType.BROTLI: [1, 5, 9, 11]}
+
+
+def main():
+    # SVG_COMPRESSION_LEVEL trades worker time for storage and download size
+    svg_data = optimize_svg(convert_image_to_svg(create_line_art()))
+    print(f'input: {len(svg_data)} bytes')
+
+    for encoding, levels in LEVELS.items():
+        if encoding == SvgEncodingType.BROTLI and brotli is None:
+            print(f'{encoding.value:>8}: brotli is not installed')
+            continue
+        for level in levels:
+            elapsed_ms = measure(encode_svg, svg_data, encoding, level, repeat=3)
+            size = len(encode_svg(svg_data, encoding, level))
+            print(f'{encoding.value:>8} {level:>2}: {elapsed_ms:9.1f} ms {size:>10} bytes ({size / len(svg_data):.1%})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+import cv2
+import numpy as np
+
+from app.util.image_util import convert_image_to_svg, process_image
+from benchmark import legacy
+from benchmark.helper import create_line_art, measure
+
+
+def main():
+    image_data = create_line_art()
+    image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    contours, _ = cv2.findContours(image, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+
+    legacy_ms = measure(legacy.convert_image_to_svg, image_data, repeat=3)
+    vectorized_ms = measure(convert_image_to_svg, image_data, repeat=3)
+    legacy_size = len(legacy.convert_image_to_svg(image_data))
+    vectorized_size = len(convert_image_to_svg(image_data))
+
+    print(f'contours: {len(contours)}')
+    print(f'svgwrite polygons : {legacy_ms:9.1f} ms {legacy_size:>10} bytes')
+    print(f'numpy path encoder: {vectorized_ms:9.1f} ms {vectorized_size:>10} bytes')
+    print(f'speedup: {legacy_ms / vectorized_ms:.1f}x')
+
+    # quality/size curve of the simplification tolerance, after the default optimizer
+    for tolerance in [0.0, 0.5, 1.0, 2.0]:
+        elapsed_ms = measure(process_image, image_data, tolerance, repeat=3)
+        size = len(process_image(image_data, tolerance))
+        print(f'tolerance {tolerance:3.1f}px: {elapsed_ms:9.1f} ms {size:>10} bytes')
+
+    # blank uploads hit the no-contour fallback, the legacy version is only measured on a small image
+    _, blank = cv2.imencode('.png', np.zeros((300, 300), np.uint8))
+    _, large_blank = cv2.imencode('.png', np.zeros((2000, 2000), np.uint8))
+    legacy_ms = measure(legacy.convert_image_to_svg, blank.tobytes(), repeat=1)
+    vectorized_ms = measure(convert_image_to_svg, blank.tobytes())
+    large_ms = measure(convert_image_to_svg, large_blank.tobytes())
+
+    print(f'blank 300x300 svgwrite rects : {legacy_ms:9.1f} ms')
+    print(f'blank 300x300 run-length rows: {vectorized_ms:9.1f} ms')
+    print(f'blank 2000x2000 run-length rows: {large_ms:9.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
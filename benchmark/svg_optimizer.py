@@ -0,0 +1,17 @@
+from app.schema.enum.image import SvgOptimizerType
+from app.util.image_util import convert_image_to_svg, optimize_svg
+from benchmark.helper import create_line_art, measure
+
+
+def main():
+    svg_data = convert_image_to_svg(create_line_art())
+    print(f'input: {len(svg_data)} bytes')
+
+    for optimizer in SvgOptimizerType:
+        elapsed_ms = measure(optimize_svg, svg_data, optimizer, repeat=3)
+        size = len(optimize_svg(svg_data, optimizer))
+        print(f'{optimizer.value:>8}: {elapsed_ms:9.1f} ms {size:>10} bytes ({size / len(svg_data):.1%})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import asyncio
+import tempfile
+import time
+from io import BytesIO
+
+import httpx
+import numpy as np
+from fastapi import APIRouter, FastAPI
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.api.v1 import images
+from app.config.database import Base, get_db
+from app.service import image as image_service
+from app.util.event_loop import EventLoopLagMonitor
+from app.util.storage import LocalStorage
+from benchmark import legacy
+
+CLIENTS = 8
+REQUESTS_PER_CLIENT = 5
+S3_LATENCY = 0.05  # seconds per put_object, simulated so the run needs no bucket
+
+
+def create_app(upload_endpoint) -> FastAPI:
+    app = FastAPI()
+    router = APIRouter()
+    router.add_api_route('/', upload_endpoint, methods=['POST'])
+    app.include_router(router, prefix='/api/v1/images')
+
+    engine = create_engine(f'sqlite:///{tempfile.mktemp()}', connect_args={'check_same_thread': False})
+    Base.metadata.create_all(engine)
+    session_local = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = session_local()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    return app
+
+
+def create_files(seed: int) -> list:
+    files = []
+    for index in range(3):
+        pixels = np.random.default_rng(seed * 3 + index).integers(0, 255, (600, 800, 3), np.uint8)
+        output = BytesIO()
+        Image.fromarray(pixels).save(output, 'JPEG')
+        files.append(('files', (f'{index}.jpg', output.getvalue(), 'image/jpeg')))
+    return files
+
+
+async def load(app: FastAPI, payloads: list) -> tuple[float, float, float]:
+    monitor = EventLoopLagMonitor(interval=0.01)
+    monitor.start()
+    latencies = []
+
+    async def client(requests: list):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as http:
+            for files in requests:
+                started = time.perf_counter()
+                response = await http.post('/api/v1/images/', files=files)
+                latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client(requests) for requests in payloads])
+    elapsed = time.perf_counter() - started
+    await monitor.stop()
+    return len(latencies) / elapsed, float(np.percentile(latencies, 99)), monitor.max_lag
+
+
+class DelayedStorage(LocalStorage):
+    # local files plus a fixed delay per write, standing in for the s3 round trip
+    def __init__(self, latency: float):
+        super().__init__(tempfile.mkdtemp())
+        self.latency = latency
+
+    def _write(self, path, chunks) -> None:
+        time.sleep(self.latency)
+        super()._write(path, chunks)
+
+
+def patch_storage(latency: float = S3_LATENCY) -> None:
+    # s3 is replaced by the local backend, so the run needs no bucket
+    storage = DelayedStorage(latency)
+    image_service.get_storage = lambda: storage
+
+
+def main():
+    # the broker is a no-op, the measurement is the handler itself
+    patch_storage()
+    images.process_image_task.apply_async = lambda *args, **kwargs: None
+
+    # encoded up front, so the only blocking work on the loop is the handler's
+    payloads = [
+        [create_files(number * REQUESTS_PER_CLIENT + request) for request in range(REQUESTS_PER_CLIENT)]
+        for number in range(CLIENTS)
+    ]
+    for label, endpoint in [
+        ('on event loop', legacy.upload_multiple_images),
+        ('executor', images.upload_multiple_images),
+    ]:
+        throughput, p99, max_lag = asyncio.run(load(create_app(endpoint), payloads))
+        print(
+            f'{label:>13}  {CLIENTS} clients x {REQUESTS_PER_CLIENT} requests x 3 images  '
+            f'{throughput:6.1f} req/s  p99: {p99 * 1000:7.1f} ms  max loop lag: {max_lag * 1000:7.1f} ms'
+        )
+
+
+if __name__ == '__main__':
+    main()